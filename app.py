@@ -2,16 +2,28 @@
 Sistema de Gestão de Projeto Social de Judô
 Backend Flask com SQLite
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, g, has_app_context, has_request_context, stream_with_context
+from flask.cli import AppGroup
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import sqlite3
+import click
+import base64
+import bisect
+import json
 import os
 import secrets
-from functools import wraps
-import pandas as pd
+import queue
+import threading
+import time
+import tempfile
+import codecs
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, wraps
 import io
 import csv
 from io import StringIO
@@ -23,18 +35,153 @@ CORS(app)
 
 # Configuração do banco de dados
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE = os.path.join(BASE_DIR, 'judo.db')
+DATABASE = os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'judo.db'))
+
+# PRAGMAs aplicados em cada conexão nova
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',           # leitores não bloqueiam o escritor
+    'synchronous': 'NORMAL',         # seguro com WAL, um fsync por checkpoint
+    'busy_timeout': 5000,            # espera até 5s antes de "database is locked"
+    'cache_size': -20000,            # ~20 MB de page cache por conexão
+    'mmap_size': 268435456,          # 256 MB mapeados em memória
+    'temp_store': 'MEMORY',
+}
+
+class GerenciadorConexoes:
+    """Mantém uma conexão SQLite reutilizável por thread de cada worker"""
+
+    def __init__(self, database, pragmas=None):
+        self.database = database
+        self.pragmas = pragmas or {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes = []
+        self._pid = os.getpid()
+        self._stats = {'criadas': 0, 'reutilizadas': 0, 'rollbacks': 0, 'descartadas': 0}
+
+    def _abrir(self):
+        conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for nome, valor in self.pragmas.items():
+            conn.execute(f'PRAGMA {nome} = {valor}')
+        with self._lock:
+            self._conexoes.append(conn)
+            self._stats['criadas'] += 1
+        return conn
+
+    def _verificar_fork(self):
+        # Conexões herdadas de um processo pai (gunicorn --preload) não podem ser usadas
+        if os.getpid() != self._pid:
+            self._local = threading.local()
+            self._lock = threading.Lock()
+            self._conexoes = []
+            self._pid = os.getpid()
+
+    def obter(self):
+        """Retorna a conexão da thread atual, abrindo uma nova se necessário"""
+        self._verificar_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._abrir()
+            self._local.conn = conn
+        else:
+            with self._lock:
+                self._stats['reutilizadas'] += 1
+        return conn
+
+    def liberar(self, conn):
+        """Devolve a conexão ao pool desfazendo transações deixadas abertas"""
+        if conn is None:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                with self._lock:
+                    self._stats['rollbacks'] += 1
+        except sqlite3.Error:
+            self.descartar(conn)
+
+    def descartar(self, conn):
+        """Fecha uma conexão com problema; a próxima chamada abre outra"""
+        with self._lock:
+            if conn in self._conexoes:
+                self._conexoes.remove(conn)
+            self._stats['descartadas'] += 1
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def fechar_todas(self):
+        """Fecha todas as conexões abertas por este processo"""
+        with self._lock:
+            conexoes, self._conexoes = self._conexoes, []
+        for conn in conexoes:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def estatisticas(self):
+        """Contadores do pool para monitoramento"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['abertas'] = len(self._conexoes)
+        stats['pid'] = self._pid
+        stats['database'] = self.database
+        return stats
+
+db_pool = GerenciadorConexoes(DATABASE, SQLITE_PRAGMAS)
 
 def get_db():
-    """Conexão com o banco de dados"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão com o banco de dados (uma por thread, vinculada ao contexto da aplicação)"""
+    if has_app_context():
+        if 'db' not in g:
+            g.db = db_pool.obter()
+        return g.db
+    return db_pool.obter()
 
-def init_db():
-    """Inicializa o banco de dados com todas as tabelas"""
-    conn = get_db()
-    cursor = conn.cursor()
+@app.teardown_appcontext
+def liberar_db(exception=None):
+    """Devolve a conexão do contexto ao pool ao fim da requisição"""
+    conn = g.pop('db', None)
+    db_pool.liberar(conn)
+    # A conexão fica no pool pelo processo inteiro: volta sem os arquivos anuais anexados
+    if conn is not None and g.pop('arquivos_anexados', False):
+        try:
+            desanexar_arquivos(conn)
+        except sqlite3.ProgrammingError:
+            pass  # já descartada por liberar
+        except sqlite3.Error:
+            db_pool.descartar(conn)
+    usuario_ids = g.pop('contadores_nao_lidas', None)
+    if usuario_ids:
+        invalidar_contadores_nao_lidas(*usuario_ids)
+    if g.pop('acordar_hub', False):
+        hub_notificacoes.acordar()
+
+# ==================== MIGRAÇÕES DO BANCO ====================
+# A versão do schema fica em PRAGMA user_version. Cada migração roda uma
+# única vez, em ordem, dentro de uma transação BEGIN IMMEDIATE: se vários
+# workers sobem juntos, só um aplica o DDL e os demais encontram a versão
+# já atualizada quando conseguem o lock.
+
+def _colunas_tabela(cursor, tabela):
+    """Retorna o conjunto de colunas existentes em uma tabela"""
+    # table_xinfo também lista as colunas geradas
+    cursor.execute(f'PRAGMA table_xinfo({tabela})')
+    return {row[1] for row in cursor.fetchall()}
+
+def _adicionar_coluna(cursor, tabela, coluna, definicao):
+    """Adiciona uma coluna apenas se ela ainda não existir"""
+    if coluna not in _colunas_tabela(cursor, tabela):
+        cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}')
+
+def _migracao_001_schema_inicial(cursor):
+    """Tabelas originais do sistema e usuário admin padrão"""
     
     # Tabela de usuários
     cursor.execute('''
@@ -75,30 +222,12 @@ def init_db():
     ''')
     
     # Adicionar novas colunas se a tabela já existir (migração)
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN graduacao_atual TEXT DEFAULT "Branca"')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN modalidade TEXT')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN pode_graduar BOOLEAN DEFAULT 0')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN graduar_para TEXT')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN peso REAL')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE alunos ADD COLUMN altura REAL')
-    except:
-        pass
+    _adicionar_coluna(cursor, 'alunos', 'graduacao_atual', 'TEXT DEFAULT "Branca"')
+    _adicionar_coluna(cursor, 'alunos', 'modalidade', 'TEXT')
+    _adicionar_coluna(cursor, 'alunos', 'pode_graduar', 'BOOLEAN DEFAULT 0')
+    _adicionar_coluna(cursor, 'alunos', 'graduar_para', 'TEXT')
+    _adicionar_coluna(cursor, 'alunos', 'peso', 'REAL')
+    _adicionar_coluna(cursor, 'alunos', 'altura', 'REAL')
     
     # Tabela de presenças
     cursor.execute('''
@@ -134,18 +263,9 @@ def init_db():
     ''')
     
     # Adicionar colunas de status se a tabela já existir
-    try:
-        cursor.execute('ALTER TABLE avaliacoes ADD COLUMN status TEXT DEFAULT "Rascunho"')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE avaliacoes ADD COLUMN data_liberacao DATE')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE avaliacoes ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
-    except:
-        pass
+    _adicionar_coluna(cursor, 'avaliacoes', 'status', 'TEXT DEFAULT "Rascunho"')
+    _adicionar_coluna(cursor, 'avaliacoes', 'data_liberacao', 'DATE')
+    _adicionar_coluna(cursor, 'avaliacoes', 'updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
     
     # Tabela de justificativas de ausência
     cursor.execute('''
@@ -229,9 +349,690 @@ def init_db():
             INSERT INTO usuarios (username, password, perfil, nome)
             VALUES (?, ?, ?, ?)
         ''', ('admin', generate_password_hash('admin123'), 'admin', 'Administrador'))
+
+def _migracao_002_indices(cursor):
+    """Índices para os caminhos de acesso usados pelas rotas"""
+    indices = [
+        # Notificações do usuário (não lidas primeiro filtradas, mais recentes primeiro)
+        'CREATE INDEX IF NOT EXISTS idx_notificacoes_usuario_lida_data ON notificacoes(usuario_id, lida, data_notificacao)',
+        'CREATE INDEX IF NOT EXISTS idx_notificacoes_usuario_data ON notificacoes(usuario_id, data_notificacao)',
+        # Presenças por intervalo de datas (cobre o agrupamento do dashboard)
+        'CREATE INDEX IF NOT EXISTS idx_presencas_data ON presencas(data, presente, aluno_id)',
+        # Avaliações por aluno e por data
+        'CREATE INDEX IF NOT EXISTS idx_avaliacoes_aluno_data ON avaliacoes(aluno_id, data_avaliacao)',
+        'CREATE INDEX IF NOT EXISTS idx_avaliacoes_data ON avaliacoes(data_avaliacao)',
+        # Justificativas por aluno
+        'CREATE INDEX IF NOT EXISTS idx_justificativas_aluno_data ON justificativas_ausencia(aluno_id, data_ausencia)',
+        'CREATE INDEX IF NOT EXISTS idx_justificativas_data ON justificativas_ausencia(data_ausencia)',
+        # Login vinculado ao aluno e busca de admins
+        'CREATE INDEX IF NOT EXISTS idx_usuarios_aluno ON usuarios(aluno_id)',
+        'CREATE INDEX IF NOT EXISTS idx_usuarios_perfil ON usuarios(perfil)',
+        # Biblioteca por tipo de golpe, mais recentes primeiro
+        'CREATE INDEX IF NOT EXISTS idx_biblioteca_tipo_data ON biblioteca_tecnica(tipo_golpe, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_biblioteca_data ON biblioteca_tecnica(created_at)',
+        # Alunos ativos em ordem alfabética e listagem geral
+        'CREATE INDEX IF NOT EXISTS idx_alunos_status_nome ON alunos(status, nome_completo)',
+        'CREATE INDEX IF NOT EXISTS idx_alunos_nome ON alunos(nome_completo, id)',
+        # Rematrículas por aluno
+        'CREATE INDEX IF NOT EXISTS idx_rematriculas_aluno ON rematriculas(aluno_id)',
+    ]
+    for sql in indices:
+        cursor.execute(sql)
+
+def _migracao_003_indices_alunos(cursor):
+    """Índices dos filtros da listagem de alunos (todos terminam na ordem de nome)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_tipo_nome ON alunos(tipo, nome_completo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_graduacao_nome ON alunos(graduacao_atual, nome_completo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_modalidade_nome ON alunos(modalidade, nome_completo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_nascimento ON alunos(data_nascimento)')
+
+def _migracao_004_campos_derivados(cursor):
+    """Persiste idade, IMC, classe e categoria dos alunos"""
+    _adicionar_coluna(cursor, 'alunos', 'idade', 'INTEGER')
+    _adicionar_coluna(cursor, 'alunos', 'imc', 'REAL')
+    _adicionar_coluna(cursor, 'alunos', 'classe', 'TEXT')
+    _adicionar_coluna(cursor, 'alunos', 'categoria', 'TEXT')
+    _adicionar_coluna(cursor, 'alunos', 'aniversario', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_classe_nome ON alunos(classe, nome_completo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_categoria_nome ON alunos(categoria, nome_completo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alunos_aniversario ON alunos(aniversario)')
+    cursor.execute('DROP INDEX IF EXISTS idx_alunos_nascimento')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas_agendadas (
+            nome TEXT PRIMARY KEY,
+            ultima_execucao DATE
+        )
+    ''')
+    # Os campos não são calculados aqui, para a migração não depender das regras atuais:
+    # sem execução registrada, a virada da primeira requisição recalcula o cadastro inteiro
+    cursor.execute("DELETE FROM tarefas_agendadas WHERE nome = 'virada_idades'")
+
+def _migracao_005_importacoes(cursor):
+    """Andamento e erros das importações em segundo plano"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS importacoes (
+            id TEXT PRIMARY KEY,
+            usuario_id INTEGER,
+            arquivo TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Na fila',
+            linhas_processadas INTEGER DEFAULT 0,
+            sucesso INTEGER DEFAULT 0,
+            erros INTEGER DEFAULT 0,
+            cancelar BOOLEAN DEFAULT 0,
+            mensagem TEXT,
+            iniciada_em TIMESTAMP,
+            atualizada_em TIMESTAMP,
+            concluida_em TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS importacoes_erros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            importacao_id TEXT NOT NULL,
+            linha INTEGER,
+            nome TEXT,
+            erro TEXT,
+            FOREIGN KEY (importacao_id) REFERENCES importacoes(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_importacoes_erros_importacao ON importacoes_erros(importacao_id, linha)')
+
+def _migracao_006_resumos_presenca(cursor):
+    """Resumos diários de presença (por aluno e por dia) mantidos por triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presencas_resumo_aluno (
+            data DATE NOT NULL,
+            aluno_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            presentes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, aluno_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_presencas_resumo_aluno_aluno ON presencas_resumo_aluno(aluno_id, data)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presencas_resumo_dia (
+            data DATE PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            presentes INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
     
-    conn.commit()
-    conn.close()
+    # Cada escrita em presencas atualiza os resumos na mesma transação, qualquer que
+    # seja a rota. INSERT OR REPLACE não dispara o trigger de DELETE da linha
+    # substituída, por isso as rotas gravam presenças com ON CONFLICT DO UPDATE.
+    # O SQL fica congelado aqui: mudar os triggers exige uma nova migração.
+    def somar(linha, sinal):
+        dia = f'COALESCE(DATE({linha}.data), {linha}.data)'
+        presente = f'({linha}.presente = 1)'
+        return f'''
+            INSERT INTO presencas_resumo_aluno (data, aluno_id, total, presentes)
+            VALUES ({dia}, {linha}.aluno_id, {sinal}, {sinal} * {presente})
+            ON CONFLICT(data, aluno_id) DO UPDATE SET
+                total = total + excluded.total, presentes = presentes + excluded.presentes;
+            DELETE FROM presencas_resumo_aluno WHERE data = {dia} AND aluno_id = {linha}.aluno_id AND total = 0;
+            INSERT INTO presencas_resumo_dia (data, total, presentes)
+            VALUES ({dia}, {sinal}, {sinal} * {presente})
+            ON CONFLICT(data) DO UPDATE SET
+                total = total + excluded.total, presentes = presentes + excluded.presentes;
+            DELETE FROM presencas_resumo_dia WHERE data = {dia} AND total = 0;
+        '''
+    
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_resumo_insert AFTER INSERT ON presencas
+        BEGIN {somar('NEW', 1)} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_resumo_delete AFTER DELETE ON presencas
+        BEGIN {somar('OLD', -1)} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_resumo_update
+        AFTER UPDATE OF aluno_id, data, presente ON presencas
+        BEGIN {somar('OLD', -1)} {somar('NEW', 1)} END''')
+    
+    cursor.execute('DELETE FROM presencas_resumo_aluno')
+    cursor.execute('DELETE FROM presencas_resumo_dia')
+    cursor.execute('''
+        INSERT INTO presencas_resumo_aluno (data, aluno_id, total, presentes)
+        SELECT COALESCE(DATE(p.data), p.data), p.aluno_id, COUNT(*),
+               SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END)
+        FROM presencas p
+        GROUP BY 1, 2
+    ''')
+    cursor.execute('''
+        INSERT INTO presencas_resumo_dia (data, total, presentes)
+        SELECT data, SUM(total), SUM(presentes) FROM presencas_resumo_aluno
+        GROUP BY data
+    ''')
+
+def _migracao_007_bitmaps_presenca(cursor):
+    """Bitmaps mensais de presença por aluno, derivados dos resumos diários"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presencas_bitmap (
+            aluno_id INTEGER NOT NULL,
+            mes TEXT NOT NULL,
+            registrados INTEGER NOT NULL DEFAULT 0,
+            presentes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (aluno_id, mes)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Bit (dia - 1) de registrados marca dia com chamada; de presentes, dia com presença.
+    # Os triggers derivam os bitmaps de presencas_resumo_aluno; o SQL fica congelado aqui.
+    def bit(linha):
+        return f'(1 << (CAST(substr({linha}.data, 9, 2) AS INTEGER) - 1))'
+    
+    def data_valida(linha):
+        return f"{linha}.data GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+    
+    marcar = f'''
+            INSERT INTO presencas_bitmap (aluno_id, mes, registrados, presentes)
+            VALUES (NEW.aluno_id, substr(NEW.data, 1, 7), {bit('NEW')}, (NEW.presentes > 0) * {bit('NEW')})
+            ON CONFLICT(aluno_id, mes) DO UPDATE SET
+                registrados = registrados | excluded.registrados,
+                presentes = (presentes & ~excluded.registrados) | excluded.presentes;
+        '''
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_bitmap_insert AFTER INSERT ON presencas_resumo_aluno
+        WHEN {data_valida('NEW')}
+        BEGIN {marcar} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_bitmap_update AFTER UPDATE ON presencas_resumo_aluno
+        WHEN {data_valida('NEW')}
+        BEGIN {marcar} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_presencas_bitmap_delete AFTER DELETE ON presencas_resumo_aluno
+        WHEN {data_valida('OLD')}
+        BEGIN
+            UPDATE presencas_bitmap SET
+                registrados = registrados & ~{bit('OLD')},
+                presentes = presentes & ~{bit('OLD')}
+            WHERE aluno_id = OLD.aluno_id AND mes = substr(OLD.data, 1, 7);
+            DELETE FROM presencas_bitmap
+            WHERE aluno_id = OLD.aluno_id AND mes = substr(OLD.data, 1, 7) AND registrados = 0;
+        END''')
+    
+    # Cada dia aparece uma vez por aluno nos resumos, então somar os bits equivale a um OR
+    cursor.execute('DELETE FROM presencas_bitmap')
+    cursor.execute(f'''
+        INSERT INTO presencas_bitmap (aluno_id, mes, registrados, presentes)
+        SELECT r.aluno_id, substr(r.data, 1, 7), SUM({bit('r')}), SUM((r.presentes > 0) * {bit('r')})
+        FROM presencas_resumo_aluno r
+        WHERE {data_valida('r')}
+        GROUP BY 1, 2
+    ''')
+
+def _migracao_008_versoes_cache(cursor):
+    """Versões das tabelas usadas pelo cache de respostas"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versoes (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # As tabelas versionadas na versão 8; as seguintes entram nas próprias migrações (12 e 13)
+    for tabela in ('alunos', 'presencas'):
+        cursor.execute('INSERT OR IGNORE INTO cache_versoes (tabela, versao) VALUES (?, 0)', (tabela,))
+
+def _migracao_009_sincronizacao_presencas(cursor):
+    """Versão e horário da última alteração de cada presença, para a sincronização offline"""
+    _adicionar_coluna(cursor, 'presencas', 'versao', 'INTEGER NOT NULL DEFAULT 0')
+    _adicionar_coluna(cursor, 'presencas', 'alterado_em', 'TIMESTAMP')
+
+def _migracao_010_arquivos_anuais(cursor):
+    """Registro dos arquivos anuais de presenças e notificações antigas"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_anuais (
+            ano INTEGER PRIMARY KEY,
+            caminho TEXT NOT NULL,
+            atualizado_em TIMESTAMP
+        )
+    ''')
+
+def _migracao_011_media_avaliacoes(cursor):
+    """Média das avaliações como coluna gerada e indexada, para ordenar e filtrar em SQL"""
+    # Média das notas preenchidas (NULL se nenhuma foi lançada). ALTER TABLE só aceita
+    # colunas geradas VIRTUAL; o índice guarda o valor calculado
+    _adicionar_coluna(cursor, 'avaliacoes', 'media', '''REAL GENERATED ALWAYS AS (ROUND(
+        (COALESCE(disciplina, 0) + COALESCE(tecnica, 0) + COALESCE(participacao, 0)
+         + COALESCE(respeito_comportamento, 0)) * 1.0
+        / NULLIF((disciplina IS NOT NULL) + (tecnica IS NOT NULL) + (participacao IS NOT NULL)
+                 + (respeito_comportamento IS NOT NULL), 0),
+        2)) VIRTUAL''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_avaliacoes_media ON avaliacoes(media)')
+
+def _migracao_012_versao_avaliacoes(cursor):
+    """Versão de avaliacoes para o cache das tendências"""
+    cursor.execute("INSERT OR IGNORE INTO cache_versoes (tabela, versao) VALUES ('avaliacoes', 0)")
+
+def _migracao_013_versao_usuarios(cursor):
+    """Versão de usuarios para o índice de perfis em memória"""
+    cursor.execute("INSERT OR IGNORE INTO cache_versoes (tabela, versao) VALUES ('usuarios', 0)")
+
+def _migracao_014_saida_notificacoes(cursor):
+    """Fila de saída das notificações, gravada na transação de cada alteração"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notificacoes_saida (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destino TEXT NOT NULL,
+            aluno_id INTEGER,
+            tipo TEXT NOT NULL,
+            titulo TEXT NOT NULL,
+            mensagem TEXT NOT NULL,
+            link TEXT,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT,
+            criada_em TIMESTAMP NOT NULL,
+            proxima_tentativa TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_notificacoes_saida_status ON notificacoes_saida(status, proxima_tentativa)'
+    )
+
+def _migracao_015_contadores_nao_lidas(cursor):
+    """Contador de notificações não lidas por usuário, mantido por triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notificacoes_nao_lidas (
+            usuario_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # SQL congelado aqui: mudar os triggers exige uma nova migração
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_notificacoes_nao_lidas_insert AFTER INSERT ON notificacoes
+        WHEN NEW.lida = 0 AND NEW.usuario_id IS NOT NULL
+        BEGIN
+            INSERT INTO notificacoes_nao_lidas (usuario_id, total) VALUES (NEW.usuario_id, 1)
+            ON CONFLICT(usuario_id) DO UPDATE SET total = total + 1;
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_notificacoes_nao_lidas_delete AFTER DELETE ON notificacoes
+        WHEN OLD.lida = 0
+        BEGIN
+            UPDATE notificacoes_nao_lidas SET total = total - 1 WHERE usuario_id = OLD.usuario_id;
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_notificacoes_nao_lidas_update AFTER UPDATE OF lida, usuario_id ON notificacoes
+        BEGIN
+            UPDATE notificacoes_nao_lidas SET total = total - 1
+            WHERE usuario_id = OLD.usuario_id AND OLD.lida = 0;
+            INSERT INTO notificacoes_nao_lidas (usuario_id, total)
+            SELECT NEW.usuario_id, 1 WHERE NEW.lida = 0 AND NEW.usuario_id IS NOT NULL
+            ON CONFLICT(usuario_id) DO UPDATE SET total = total + 1;
+        END''')
+    cursor.execute('DELETE FROM notificacoes_nao_lidas')
+    cursor.execute('''
+        INSERT INTO notificacoes_nao_lidas (usuario_id, total)
+        SELECT usuario_id, COUNT(*) FROM notificacoes
+        WHERE lida = 0 AND usuario_id IS NOT NULL
+        GROUP BY usuario_id
+    ''')
+
+def _migracao_016_indice_retencao_notificacoes(cursor):
+    """Índice parcial das notificações lidas por data, para a retenção em lotes"""
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_notificacoes_lidas_data ON notificacoes(data_notificacao) WHERE lida = 1'
+    )
+
+# Lista ordenada de migrações: (versão, descrição, função)
+MIGRACOES = [
+    (1, 'schema inicial', _migracao_001_schema_inicial),
+    (2, 'índices das rotas', _migracao_002_indices),
+    (3, 'índices dos filtros de alunos', _migracao_003_indices_alunos),
+    (4, 'campos derivados dos alunos', _migracao_004_campos_derivados),
+    (5, 'importações em segundo plano', _migracao_005_importacoes),
+    (6, 'resumos diários de presença', _migracao_006_resumos_presenca),
+    (7, 'bitmaps mensais de presença', _migracao_007_bitmaps_presenca),
+    (8, 'versões das tabelas para o cache', _migracao_008_versoes_cache),
+    (9, 'sincronização offline de presenças', _migracao_009_sincronizacao_presencas),
+    (10, 'arquivos anuais do histórico', _migracao_010_arquivos_anuais),
+    (11, 'média das avaliações indexada', _migracao_011_media_avaliacoes),
+    (12, 'versão das avaliações para o cache', _migracao_012_versao_avaliacoes),
+    (13, 'versão dos usuários para o índice de perfis', _migracao_013_versao_usuarios),
+    (14, 'fila de saída das notificações', _migracao_014_saida_notificacoes),
+    (15, 'contadores de notificações não lidas', _migracao_015_contadores_nao_lidas),
+    (16, 'índice de retenção das notificações', _migracao_016_indice_retencao_notificacoes),
+]
+
+SCHEMA_VERSION = MIGRACOES[-1][0]
+
+def versao_schema(conn):
+    """Lê a versão atual do schema"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def aplicar_migracoes(conn, alvo=None):
+    """Aplica as migrações pendentes até a versão alvo e retorna as aplicadas"""
+    alvo = SCHEMA_VERSION if alvo is None else alvo
+    if conn.in_transaction:
+        conn.commit()
+    aplicadas = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Relê a versão com o lock de escrita já obtido
+        atual = versao_schema(conn)
+        cursor = conn.cursor()
+        for versao, descricao, migracao in MIGRACOES:
+            if atual < versao <= alvo:
+                migracao(cursor)
+                cursor.execute(f'PRAGMA user_version = {int(versao)}')
+                aplicadas.append((versao, descricao))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return aplicadas
+
+def init_db():
+    """Garante que o banco está na versão atual do schema"""
+    conn = get_db()
+    # Caminho rápido: com o schema em dia, a inicialização é uma única leitura
+    atual = versao_schema(conn)
+    if atual >= SCHEMA_VERSION:
+        return
+    if os.environ.get('AUTO_MIGRATE', '1') == '0':
+        # Deploys com etapa de release própria aplicam as migrações via CLI
+        print(f'⚠️ Schema na versão {atual}, esperado {SCHEMA_VERSION}. Execute: flask --app app db upgrade')
+        return
+    for versao, descricao in aplicar_migracoes(conn):
+        print(f'Migração {versao} aplicada: {descricao}')
+
+# Chamadas conferidas por "flask db explain". O SQL verificado é o que cada rota executa,
+# capturado na conexão enquanto a chamada roda pelo test client em um banco temporário.
+# Cada item: (nome, perfil da sessão, método, url, corpo JSON). A url é formatada com
+# os valores do banco temporário (aluno, cursores, importação).
+ROTAS_VERIFICADAS = [
+    ('login', None, 'POST', '/api/login', {'username': 'admin', 'password': 'verificacao'}),
+    ('criar_usuario: login do aluno', 'admin', 'POST', '/api/usuarios',
+     {'username': 'verificacao2', 'password': 'verificacao', 'perfil': 'aluno', 'nome': 'Verificação', 'aluno_id': '{aluno}'}),
+    ('listar_alunos', 'admin', 'GET', '/api/alunos', None),
+    ('listar_alunos: página', 'admin', 'GET', '/api/alunos?limite=50&cursor={cursor_aluno}', None),
+    ('listar_alunos: status', 'admin', 'GET', '/api/alunos?status=Ativo&limite=50', None),
+    ('listar_alunos: graduação', 'admin', 'GET', '/api/alunos?graduacao=Azul&limite=50', None),
+    ('listar_alunos: modalidade', 'admin', 'GET', '/api/alunos?modalidade=Judô&limite=50', None),
+    ('listar_alunos: classe', 'admin', 'GET', '/api/alunos?classe=Júnior&limite=50', None),
+    ('listar_alunos: categoria', 'admin', 'GET', '/api/alunos?categoria=Até 66kg&limite=50', None),
+    ('obter_aluno', 'admin', 'GET', '/api/alunos/{aluno}', None),
+    ('listar_presencas: período', 'admin', 'GET', '/api/presencas?data_inicio={ano}-01-01&data_fim={ano}-12-31', None),
+    ('listar_presencas: aluno', 'admin', 'GET', '/api/presencas?aluno_id={aluno}&data_inicio={ano}-01-01', None),
+    ('registrar_presencas_lote', 'admin', 'POST', '/api/presencas/lote',
+     {'data': '{hoje}', 'presencas': [{'aluno_id': '{aluno}', 'presente': True}]}),
+    ('presencas_hoje', 'admin', 'GET', '/api/presencas/hoje', None),
+    ('dashboard_frequencia', 'admin', 'GET', '/api/dashboard/frequencia?data_inicio={ano}-01-01&data_fim={ano}-12-31', None),
+    ('dashboard_evolucao', 'admin', 'GET', '/api/dashboard/evolucao?data_inicio={ano}-01-01&data_fim={ano}-12-31', None),
+    ('dashboard_evolucao: aluno', 'admin', 'GET',
+     '/api/dashboard/evolucao?aluno_id={aluno}&data_inicio={ano}-01-01&data_fim={ano}-12-31', None),
+    ('listar_avaliacoes', 'admin', 'GET', '/api/avaliacoes', None),
+    ('listar_avaliacoes: aluno', 'aluno', 'GET', '/api/avaliacoes', None),
+    ('listar_avaliacoes: por média', 'admin', 'GET', '/api/avaliacoes?ordenar=media&limite=50', None),
+    ('listar_avaliacoes: média mínima', 'admin', 'GET',
+     '/api/avaliacoes?ordenar=media&media_min=7&limite=50&cursor={cursor_media}', None),
+    ('listar_justificativas', 'admin', 'GET', '/api/justificativas?aluno_id={aluno}', None),
+    ('listar_notificacoes', 'admin', 'GET', '/api/notificacoes', None),
+    ('listar_notificacoes: página', 'admin', 'GET', '/api/notificacoes?cursor={cursor_notificacao}', None),
+    ('listar_notificacoes: não lidas', 'admin', 'GET', '/api/notificacoes?apenas_nao_lidas=true', None),
+    ('contar_notificacoes_nao_lidas', 'admin', 'GET', '/api/notificacoes/contador', None),
+    ('marcar_todas_notificacoes_lidas', 'admin', 'POST', '/api/notificacoes/marcar-todas-lidas', None),
+    ('listar_biblioteca: tipo de golpe', 'admin', 'GET', '/api/biblioteca?tipo_golpe=Outro', None),
+    ('obter_importacao', 'admin', 'GET', '/api/alunos/importar/{importacao}', None),
+    ('obter_rematricula_token', None, 'GET', '/api/rematriculas/token/verificacao', None),
+]
+
+# Varreduras aceitas, por (nome da chamada ou None para todas, linha do plano), com o motivo.
+# Qualquer outro SCAN, mesmo "USING INDEX" ou "USING COVERING INDEX", reprova a consulta.
+CONSULTAS_COM_SCAN = {
+    (None, 'SCAN cache_versoes'): 'uma linha por tabela versionada',
+    (None, 'SCAN arquivos_anuais'): 'uma linha por ano arquivado',
+    ('listar_alunos', 'SCAN alunos USING COVERING INDEX idx_alunos_aniversario'): 'X-Total-Count sem filtros',
+    ('listar_alunos: página', 'SCAN alunos USING COVERING INDEX idx_alunos_aniversario'): 'X-Total-Count sem filtros',
+    ('listar_alunos', 'SCAN alunos USING INDEX idx_alunos_nome'): 'sem limite, a rota devolve o cadastro inteiro',
+    ('listar_avaliacoes', 'SCAN av USING COVERING INDEX idx_avaliacoes_media'): 'X-Total-Count sem filtros',
+    ('listar_avaliacoes', 'SCAN av USING INDEX idx_avaliacoes_data'): 'sem filtros nem limite, a rota devolve todas',
+    ('listar_avaliacoes: por média', 'SCAN av'): 'X-Total-Count das avaliações com média',
+}
+
+def capturar_sql(conn, chamada):
+    """Roda chamada() e retorna os comandos que ela executou em conn, com os parâmetros no texto"""
+    executados = []
+    conn.set_trace_callback(executados.append)
+    try:
+        chamada()
+    finally:
+        conn.set_trace_callback(None)
+    # Só comandos com plano de execução; os de triggers chegam como comentários "-- TRIGGER"
+    return [sql for sql in executados
+            if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')]
+
+def verificar_planos(conn, consultas):
+    """Roda EXPLAIN QUERY PLAN em (nome, sql) e retorna as consultas com SCAN fora da lista permitida
+    
+    Só SEARCH limita as linhas lidas: SCAN percorre a tabela ou o índice inteiro.
+    """
+    problemas = []
+    for nome, sql in consultas:
+        try:
+            plano = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+        except sqlite3.Error as e:
+            problemas.append((nome, sql, [f'sem plano: {e}']))
+            continue
+        scans = [p for p in plano if p.startswith('SCAN ')
+                 and (nome, p) not in CONSULTAS_COM_SCAN and (None, p) not in CONSULTAS_COM_SCAN]
+        if scans:
+            problemas.append((nome, sql, plano))
+    return problemas
+
+db_cli = AppGroup('db', help='Gerenciamento do banco de dados')
+
+@db_cli.command('upgrade')
+@click.option('--versao', type=int, default=None, help='Versão alvo (padrão: a mais recente)')
+def db_upgrade(versao):
+    """Aplica as migrações pendentes"""
+    conn = get_db()
+    aplicadas = aplicar_migracoes(conn, versao)
+    for numero, descricao in aplicadas:
+        click.echo(f'Migração {numero} aplicada: {descricao}')
+    click.echo(f'Schema na versão {versao_schema(conn)} (mais recente: {SCHEMA_VERSION})')
+
+@db_cli.command('version')
+def db_version():
+    """Mostra a versão atual do schema"""
+    click.echo(f'Schema na versão {versao_schema(get_db())} (mais recente: {SCHEMA_VERSION})')
+
+@db_cli.command('explain')
+def db_explain():
+    """Falha se alguma consulta das rotas fizer SCAN fora de CONSULTAS_COM_SCAN
+    
+    As rotas de ROTAS_VERIFICADAS e as tarefas de fundo rodam em um banco temporário
+    com o schema atual; o SQL conferido é o capturado na conexão durante cada chamada.
+    """
+    global db_pool
+    pool_original = db_pool
+    with tempfile.TemporaryDirectory() as diretorio:
+        db_pool = GerenciadorConexoes(os.path.join(diretorio, 'verificacao.db'), SQLITE_PRAGMAS)
+        try:
+            conn = db_pool.obter()
+            aplicar_migracoes(conn)
+            hoje = datetime.now().date()
+            admin_id = conn.execute("SELECT id FROM usuarios WHERE perfil = 'admin'").fetchone()[0]
+            aluno_id = conn.execute(
+                "INSERT INTO alunos (nome_completo, tipo, data_matricula, status) VALUES ('Verificação', 'Adulto', ?, 'Ativo')",
+                (hoje.isoformat(),)
+            ).lastrowid
+            usuario_aluno = conn.execute(
+                "INSERT INTO usuarios (username, password, perfil, nome, aluno_id) VALUES ('verificacao', '', 'aluno', 'Verificação', ?)",
+                (aluno_id,)
+            ).lastrowid
+            conn.execute("INSERT INTO importacoes (id, usuario_id, arquivo) VALUES ('verificacao', ?, 'verificacao.csv')",
+                         (admin_id,))
+            # A virada incremental lê só os aniversariantes desde a última execução
+            conn.execute(
+                "INSERT OR REPLACE INTO tarefas_agendadas (nome, ultima_execucao) VALUES ('virada_idades', ?)",
+                ((hoje - timedelta(days=1)).isoformat(),)
+            )
+            conn.commit()
+            valores = {
+                'aluno': aluno_id, 'ano': hoje.year, 'hoje': hoje.isoformat(), 'importacao': 'verificacao',
+                'cursor_aluno': codificar_cursor('M', 0),
+                'cursor_media': codificar_cursor(7.5, 0),
+                'cursor_notificacao': codificar_cursor(f'{hoje.year}-01-01 00:00:00', 0),
+            }
+            sessoes = {
+                None: {},
+                'admin': {'user_id': admin_id, 'perfil': 'admin'},
+                'aluno': {'user_id': usuario_aluno, 'perfil': 'aluno', 'aluno_id': aluno_id},
+            }
+            
+            def preencher(valor):
+                if isinstance(valor, str):
+                    preenchido = valor.format(**valores)
+                    # Um campo que é só "{aluno}" vira o id numérico, não texto
+                    return int(preenchido) if valor == '{aluno}' else preenchido
+                if isinstance(valor, list):
+                    return [preencher(item) for item in valor]
+                if isinstance(valor, dict):
+                    return {chave: preencher(item) for chave, item in valor.items()}
+                return valor
+            
+            cliente = app.test_client()
+            # As tarefas de fundo vêm antes das rotas: a primeira requisição também roda a virada do dia
+            chamadas = [
+                ('executar_virada_idades', lambda: executar_virada_idades(conn, hoje)),
+                ('processar_saida_notificacoes', lambda: processar_saida_notificacoes(conn)),
+                ('compactar_notificacoes', lambda: compactar_notificacoes(conn, hoje, pausa=0)),
+            ]
+            for nome, perfil, metodo, url, corpo in ROTAS_VERIFICADAS:
+                def requisitar(perfil=perfil, metodo=metodo, url=url, corpo=corpo):
+                    with cliente.session_transaction() as sessao:
+                        sessao.clear()
+                        sessao.update(sessoes[perfil])
+                    cliente.open(preencher(url), method=metodo, json=preencher(corpo))
+                chamadas.append((nome, requisitar))
+            with app.app_context():
+                consultas = []
+                for nome, chamada in chamadas:
+                    capturadas = list(dict.fromkeys(capturar_sql(conn, chamada)))
+                    if not capturadas:
+                        click.echo(f'❌ {nome}: nenhuma consulta capturada')
+                        raise SystemExit(1)
+                    consultas += [(nome, sql) for sql in capturadas]
+                problemas = verificar_planos(conn, consultas)
+        finally:
+            db_pool.fechar_todas()
+            db_pool = pool_original
+    for nome, sql, plano in problemas:
+        click.echo(f'❌ {nome}: {" ".join(sql.split())}\n   ' + ' | '.join(plano))
+    if problemas:
+        raise SystemExit(1)
+    click.echo(f'✅ {len(consultas)} consultas de {len(chamadas)} chamadas sem SCAN fora da lista permitida')
+
+@db_cli.command('arquivar')
+@click.option('--dias', type=int, default=None, help='Idade mínima em dias (padrão: ARQUIVAMENTO_DIAS)')
+@click.option('--antes-de', default=None, help='Data de corte (AAAA-MM-DD); tem precedência sobre --dias')
+@click.option('--vacuum', is_flag=True, help='Roda VACUUM no banco principal ao final')
+def db_arquivar(dias, antes_de, vacuum):
+    """Move presenças e notificações lidas antigas para os arquivos anuais"""
+    if antes_de:
+        corte = datetime.strptime(antes_de, '%Y-%m-%d').date()
+    else:
+        corte = datetime.now().date() - timedelta(days=ARQUIVAMENTO_DIAS if dias is None else dias)
+    conn = get_db()
+    resultado = arquivar_historico(conn, corte)
+    for ano, movidas in resultado.items():
+        click.echo(f'{ano}: {movidas["presencas"]} presença(s), {movidas["notificacoes"]} notificação(ões) '
+                   f'→ {caminho_arquivo(ano)}')
+    if not resultado:
+        click.echo(f'Nada anterior a {corte.isoformat()} para arquivar')
+    if vacuum:
+        conn.execute('VACUUM main')
+        click.echo(f'VACUUM concluído: {os.path.getsize(DATABASE) / 1024 / 1024:.1f} MB')
+
+@db_cli.command('verificar-arquivo')
+@click.option('--anos', default=12, help='Anos arquivados no banco temporário')
+def db_verificar_arquivo(anos):
+    """Arquiva N anos em um banco temporário e confere as rotas e a reconstrução que os leem
+    
+    Falha se alguma leitura estourar o limite de ATTACH do SQLite ou deixar arquivos
+    anexados na conexão do pool.
+    """
+    global db_pool, ARQUIVO_DIR
+    pool_original, diretorio_original = db_pool, ARQUIVO_DIR
+    problemas = []
+    
+    def conferir(condicao, descricao):
+        click.echo(('✅ ' if condicao else '❌ ') + descricao)
+        if not condicao:
+            problemas.append(descricao)
+    
+    with tempfile.TemporaryDirectory() as diretorio:
+        db_pool = GerenciadorConexoes(os.path.join(diretorio, 'verificacao.db'), SQLITE_PRAGMAS)
+        ARQUIVO_DIR = diretorio
+        try:
+            conn = db_pool.obter()
+            aplicar_migracoes(conn)
+            
+            def anexados():
+                return [row[1] for row in conn.execute('PRAGMA database_list') if row[1].startswith('arquivo_')]
+            
+            # Duas presenças e três notificações lidas por ano; só o ano atual fica no principal
+            ano_atual = datetime.now().year
+            primeiro = ano_atual - anos
+            usuario_id = conn.execute("SELECT id FROM usuarios WHERE perfil = 'admin'").fetchone()[0]
+            aluno_id = conn.execute(
+                "INSERT INTO alunos (nome_completo, tipo, data_matricula) VALUES ('Verificação', 'Adulto', ?)",
+                (f'{primeiro}-01-01',)
+            ).lastrowid
+            conn.executemany('INSERT INTO presencas (aluno_id, data, presente) VALUES (?, ?, ?)', [
+                (aluno_id, f'{ano}-{mes:02d}-10', mes < 6) for ano in range(primeiro, ano_atual + 1) for mes in (3, 9)
+            ])
+            criar_notificacoes(conn.cursor(), [
+                (usuario_id, aluno_id, 'verificacao', 'Verificação', f'{ano}-{mes:02d}', None)
+                for ano in range(primeiro, ano_atual + 1) for mes in (2, 6, 10)
+            ])
+            conn.execute("UPDATE notificacoes SET lida = 1, data_notificacao = mensagem || '-15 10:00:00'")
+            conn.commit()
+            notificacoes = [row[0] for row in conn.execute(
+                'SELECT id FROM notificacoes ORDER BY data_notificacao DESC, id DESC')]
+            resumos = conn.execute('SELECT COUNT(*), SUM(total), SUM(presentes) FROM presencas_resumo_dia').fetchone()
+            
+            resultado = arquivar_historico(conn, datetime(ano_atual, 1, 1).date())
+            conferir(len(resultado) == anos, f'{len(resultado)} anos arquivados')
+            conferir(not anexados(), 'nenhum arquivo anexado depois de arquivar')
+            
+            cliente = app.test_client()
+            with cliente.session_transaction() as sessao:
+                sessao['user_id'], sessao['perfil'] = usuario_id, 'admin'
+            # A segunda rodada reusa a mesma conexão do pool (mesma thread)
+            for rodada in (1, 2):
+                resposta = cliente.get('/api/presencas')
+                esperadas = 2 * (ARQUIVO_ANOS_SEM_PERIODO + 1)
+                conferir(resposta.status_code == 200 and len(resposta.json) == esperadas,
+                         f'[{rodada}] /api/presencas sem período: {len(resposta.json or [])} de {esperadas} '
+                         f'(principal e últimos {ARQUIVO_ANOS_SEM_PERIODO} anos)')
+                inicio = ano_atual - ARQUIVO_ANEXOS_MAXIMO
+                resposta = cliente.get(f'/api/presencas?data_inicio={inicio}-01-01')
+                esperadas = 2 * (ARQUIVO_ANEXOS_MAXIMO + 1)
+                conferir(resposta.status_code == 200 and len(resposta.json) == esperadas,
+                         f'[{rodada}] /api/presencas desde {inicio}: {len(resposta.json or [])} de {esperadas}')
+                resposta = cliente.get(f'/api/presencas?data_inicio={primeiro}-01-01')
+                conferir(resposta.status_code == 400, f'[{rodada}] /api/presencas desde {primeiro}: '
+                         f'{resposta.status_code} (mais que {ARQUIVO_ANEXOS_MAXIMO} anos arquivados)')
+                vistas, cursor_pagina = [], None
+                while True:
+                    resposta = cliente.get('/api/notificacoes?limite=5' + (f'&cursor={cursor_pagina}' if cursor_pagina else ''))
+                    if resposta.status_code != 200:
+                        break
+                    vistas += [notificacao['id'] for notificacao in resposta.json]
+                    cursor_pagina = resposta.headers.get('X-Next-Cursor')
+                    if not cursor_pagina:
+                        break
+                conferir(vistas == notificacoes, f'[{rodada}] /api/notificacoes paginada: '
+                         f'{len(vistas)} de {len(notificacoes)}, status {resposta.status_code}')
+                conferir(not anexados(), f'[{rodada}] nenhum arquivo anexado depois das rotas')
+            
+            with app.app_context():
+                dias = reconstruir_resumos_com_arquivo(conn)
+            conferir(tuple(conn.execute('SELECT COUNT(*), SUM(total), SUM(presentes) FROM presencas_resumo_dia'
+                                        ).fetchone()) == tuple(resumos) and not anexados(),
+                     f'resumos reconstruídos com o arquivo ({dias} dias) iguais aos de antes de arquivar')
+        finally:
+            db_pool.fechar_todas()
+            db_pool, ARQUIVO_DIR = pool_original, diretorio_original
+    if problemas:
+        raise SystemExit(1)
+
+app.cli.add_command(db_cli)
 
 # Decorador para verificar autenticação
 def login_required(f):
@@ -260,21 +1061,224 @@ def aluno_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Função auxiliar para criar notificação
-def criar_notificacao(usuario_id=None, aluno_id=None, tipo='', titulo='', mensagem='', link=None):
-    """Cria uma notificação no sistema"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO notificacoes (usuario_id, aluno_id, tipo, titulo, mensagem, link)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (usuario_id, aluno_id, tipo, titulo, mensagem, link))
-        conn.commit()
-    except Exception as e:
-        print(f'Erro ao criar notificação: {e}')
-    finally:
-        conn.close()
+# Funções auxiliares para criar notificações
+def notificar(cursor, destinatarios, aluno_id=None, tipo='', titulo='', mensagem='', link=None):
+    """Envia a mesma notificação a um conjunto de usuários com um único executemany
+    
+    Usa a transação do cursor do chamador (sem commit), junto com a alteração que
+    originou a notificação. Retorna quantas foram criadas.
+    """
+    notificacoes = [
+        (usuario_id, aluno_id, tipo, titulo, mensagem, link)
+        for usuario_id in dict.fromkeys(destinatarios)
+    ]
+    if notificacoes:
+        criar_notificacoes(cursor, notificacoes)
+    return len(notificacoes)
+
+# Contador de notificações não lidas por usuário (notificacoes_nao_lidas), mantido pelos
+# triggers da migração 15 na mesma transação de qualquer INSERT, UPDATE de lida ou DELETE
+def reconstruir_contadores_nao_lidas(cursor):
+    """Recalcula os contadores a partir de notificacoes; retorna os usuários que estavam errados"""
+    cursor.execute('SELECT usuario_id, total FROM notificacoes_nao_lidas WHERE total != 0')
+    gravados = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute('''
+        SELECT usuario_id, COUNT(*) FROM notificacoes
+        WHERE lida = 0 AND usuario_id IS NOT NULL
+        GROUP BY usuario_id
+    ''')
+    reais = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute('DELETE FROM notificacoes_nao_lidas')
+    cursor.executemany('INSERT INTO notificacoes_nao_lidas (usuario_id, total) VALUES (?, ?)', reais.items())
+    return sorted(usuario_id for usuario_id in gravados.keys() | reais.keys()
+                  if gravados.get(usuario_id, 0) != reais.get(usuario_id, 0))
+
+# Contadores lidos recentemente, por worker. Gravações deste processo descartam o
+# valor do usuário; as de outros processos aparecem em até CONTADOR_NAO_LIDAS_TTL segundos.
+CONTADOR_NAO_LIDAS_TTL = float(os.environ.get('CONTADOR_NAO_LIDAS_TTL', 5))
+_contadores_nao_lidas = {}
+_contadores_nao_lidas_lock = threading.Lock()
+
+def contar_nao_lidas(conn, usuario_id):
+    """Notificações não lidas do usuário: memória do worker ou uma leitura pela chave primária"""
+    agora = time.monotonic()
+    item = _contadores_nao_lidas.get(usuario_id)
+    if item and item[1] > agora:
+        return item[0]
+    row = conn.execute('SELECT total FROM notificacoes_nao_lidas WHERE usuario_id = ?', (usuario_id,)).fetchone()
+    total = row[0] if row else 0
+    with _contadores_nao_lidas_lock:
+        _contadores_nao_lidas[usuario_id] = (total, agora + CONTADOR_NAO_LIDAS_TTL)
+    return total
+
+def invalidar_contadores_nao_lidas(*usuario_ids):
+    """Descarta os contadores em memória dos usuários (todos, se nenhum for dado)"""
+    with _contadores_nao_lidas_lock:
+        if not usuario_ids:
+            _contadores_nao_lidas.clear()
+        for usuario_id in usuario_ids:
+            _contadores_nao_lidas.pop(usuario_id, None)
+    hub_notificacoes.acordar()
+
+# Ids dos usuários por perfil, em memória; refeito quando a versão de usuarios muda
+_usuarios_por_perfil = {'versao': None, 'perfis': {}}
+_usuarios_por_perfil_lock = threading.Lock()
+
+def usuarios_por_perfil(conn, perfil):
+    """Ids dos usuários com o perfil (por exemplo, todos os admins), em ordem de id"""
+    versao = versoes_tabelas(conn).get('usuarios')
+    if _usuarios_por_perfil['versao'] != versao:
+        with _usuarios_por_perfil_lock:
+            if _usuarios_por_perfil['versao'] != versao:
+                perfis = {}
+                for row in conn.execute('SELECT id, perfil FROM usuarios ORDER BY id'):
+                    perfis.setdefault(row['perfil'], []).append(row['id'])
+                _usuarios_por_perfil['perfis'] = {chave: tuple(ids) for chave, ids in perfis.items()}
+                _usuarios_por_perfil['versao'] = versao
+    return _usuarios_por_perfil['perfis'].get(perfil, ())
+
+def criar_notificacoes(cursor, notificacoes):
+    """Insere várias notificações de uma vez, na transação do cursor (sem commit)
+    
+    notificacoes: tuplas (usuario_id, aluno_id, tipo, titulo, mensagem, link).
+    Numa requisição, os contadores em memória são descartados no fim dela, depois do
+    commit; fora dela, quem faz o commit chama invalidar_contadores_nao_lidas.
+    """
+    cursor.executemany('''
+        INSERT INTO notificacoes (usuario_id, aluno_id, tipo, titulo, mensagem, link)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', notificacoes)
+    if has_request_context():
+        # Antes do commit, uma leitura no mesmo worker guardaria de novo o total antigo
+        g.setdefault('contadores_nao_lidas', set()).update(notificacao[0] for notificacao in notificacoes)
+
+def usuarios_dos_alunos(cursor, aluno_ids):
+    """Usuário vinculado a cada aluno ({aluno_id: usuario_id}), com uma única consulta"""
+    aluno_ids = list(aluno_ids)
+    if not aluno_ids:
+        return {}
+    marcadores = ', '.join('?' * len(aluno_ids))
+    cursor.execute(f'SELECT id, aluno_id FROM usuarios WHERE aluno_id IN ({marcadores}) ORDER BY id', aluno_ids)
+    usuarios = {}
+    for row in cursor.fetchall():
+        usuarios.setdefault(row['aluno_id'], row['id'])
+    return usuarios
+
+# ==================== CACHE DE RESPOSTAS ====================
+
+# Tabelas cujas alterações invalidam respostas em cache. Cada transação que escreve
+# nelas incrementa a versão com registrar_alteracao(); como a versão fica no banco,
+# serve de sinal para os outros workers. (Um trigger por linha dobraria o custo
+# das importações em massa.)
+TABELAS_VERSIONADAS = ('alunos', 'presencas', 'avaliacoes', 'usuarios')
+
+CACHE_RESPOSTAS_TTL = int(os.environ.get('CACHE_RESPOSTAS_TTL', 60))
+CACHE_RESPOSTAS_ITENS = int(os.environ.get('CACHE_RESPOSTAS_ITENS', 256))
+
+def registrar_alteracao(conn, *tabelas):
+    """Marca as tabelas como alteradas, dentro da transação de escrita do chamador
+    
+    Retorna as novas versões ({tabela: versao}).
+    """
+    marcadores = ', '.join('?' * len(tabelas))
+    conn.execute(f'UPDATE cache_versoes SET versao = versao + 1 WHERE tabela IN ({marcadores})', tabelas)
+    cache_respostas.invalidar(*tabelas)
+    cursor = conn.execute(f'SELECT tabela, versao FROM cache_versoes WHERE tabela IN ({marcadores})', tabelas)
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def versoes_tabelas(conn):
+    """Versão atual de cada tabela versionada"""
+    return {row['tabela']: row['versao'] for row in conn.execute('SELECT tabela, versao FROM cache_versoes')}
+
+class CacheRespostas:
+    """Cache LRU com TTL das respostas GET, por worker
+    
+    Cada item guarda as versões das tabelas de que depende; se alguma mudou desde
+    então (escrita em qualquer worker), o item é descartado na leitura.
+    """
+
+    def __init__(self, ttl=CACHE_RESPOSTAS_TTL, maximo=CACHE_RESPOSTAS_ITENS):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'acertos': 0, 'falhas': 0, 'expirados': 0, 'invalidados': 0, 'removidos_lru': 0}
+
+    def obter(self, chave, versoes):
+        """Resposta guardada para a chave, ou None se ausente, expirada ou desatualizada"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self._stats['falhas'] += 1
+                return None
+            expira_em, versoes_item, resposta = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                self._stats['expirados'] += 1
+                self._stats['falhas'] += 1
+                return None
+            if any(versoes.get(tabela) != versao for tabela, versao in versoes_item.items()):
+                del self._itens[chave]
+                self._stats['invalidados'] += 1
+                self._stats['falhas'] += 1
+                return None
+            self._itens.move_to_end(chave)
+            self._stats['acertos'] += 1
+            return resposta
+
+    def guardar(self, chave, versoes, resposta):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, versoes, resposta)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+                self._stats['removidos_lru'] += 1
+
+    def invalidar(self, *tabelas):
+        """Descarta os itens que dependem de alguma das tabelas (todas, se nenhuma for dada)"""
+        with self._lock:
+            for chave in list(self._itens):
+                if not tabelas or set(tabelas) & set(self._itens[chave][1]):
+                    del self._itens[chave]
+                    self._stats['invalidados'] += 1
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats, itens=len(self._itens), ttl=self.ttl, maximo=self.maximo, pid=os.getpid())
+        consultas = stats['acertos'] + stats['falhas']
+        stats['taxa_acertos'] = round(stats['acertos'] / consultas * 100, 2) if consultas else 0
+        return stats
+
+cache_respostas = CacheRespostas()
+
+def _chave_cache():
+    """Endpoint + quem pergunta + argumentos normalizados (ordenados, sem valores vazios)"""
+    argumentos = tuple(sorted(
+        (nome, valor) for nome, valores in request.args.lists() for valor in valores if valor != ''
+    ))
+    # Perfis aluno só enxergam os próprios dados; o dia entra por causa dos períodos padrão
+    escopo = (session.get('perfil'), session.get('aluno_id') if session.get('perfil') == 'aluno' else None)
+    return (request.endpoint, escopo, datetime.now().date().isoformat(), argumentos)
+
+def cache_resposta(*tabelas):
+    """Guarda a resposta JSON da rota até expirar ou até uma das tabelas mudar"""
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versoes = versoes_tabelas(get_db())
+            versoes = {tabela: versoes.get(tabela) for tabela in tabelas}
+            chave = _chave_cache()
+            guardada = cache_respostas.obter(chave, versoes)
+            if guardada is not None:
+                corpo, status = guardada
+                return app.response_class(corpo, status=status, mimetype='application/json')
+            
+            resposta = app.make_response(f(*args, **kwargs))
+            if resposta.status_code == 200 and resposta.mimetype == 'application/json':
+                cache_respostas.guardar(chave, versoes, (resposta.get_data(), resposta.status_code))
+            return resposta
+        return decorated_function
+    return decorador
 
 # ==================== FUNÇÕES AUXILIARES ====================
 
@@ -305,110 +1309,1431 @@ def calcular_imc(peso, altura):
     except:
         return None
 
-def determinar_classe(idade):
-    """Determina a classe do atleta baseado na idade"""
-    if not idade:
-        return None
+# Classes por idade: (classe, idade mínima, idade máxima exclusiva)
+FAIXAS_CLASSE = [
+    ('Infantil', None, 13),
+    ('Juvenil', 13, 16),
+    ('Júnior', 16, 20),
+    ('Sênior', 20, 30),
+    ('Veterano', 30, None),
+]
+
+def determinar_classe(idade):
+    """Determina a classe do atleta baseado na idade"""
+    if not idade:
+        return None
+    
+    for classe, minima, maxima in FAIXAS_CLASSE:
+        if maxima is None or idade < maxima:
+            return classe
+
+# Categorias de peso (CBJ, simplificadas): limites superiores exclusivos em kg
+# por (classe, gênero). Acima do último limite a categoria é "Acima de X kg".
+_PESOS_INFANTIL = (30, 34, 38, 42, 46, 50, 55)
+_PESOS_JUVENIL = (40, 44, 48, 52, 57, 63, 70)
+_PESOS_JUNIOR = (50, 55, 60, 66, 73, 81, 90, 100)
+_PESOS_ADULTO = (60, 66, 73, 81, 90, 100)
+
+FAIXAS_PESO = {
+    ('Infantil', 'M'): _PESOS_INFANTIL, ('Infantil', 'F'): _PESOS_INFANTIL,
+    ('Juvenil', 'M'): _PESOS_JUVENIL, ('Juvenil', 'F'): _PESOS_JUVENIL,
+    ('Júnior', 'M'): _PESOS_JUNIOR, ('Júnior', 'F'): _PESOS_JUNIOR,
+    ('Sênior', 'M'): _PESOS_ADULTO, ('Sênior', 'F'): _PESOS_ADULTO,
+    ('Veterano', 'M'): _PESOS_ADULTO, ('Veterano', 'F'): _PESOS_ADULTO,
+}
+
+GENEROS = ('M', 'F')
+
+# Idades de corte entre as classes, na ordem de FAIXAS_CLASSE
+_CORTES_CLASSE = tuple(maxima for _, _, maxima in FAIXAS_CLASSE if maxima is not None)
+
+def _rotulos_categoria(limites):
+    """Nomes das categorias de uma tabela de limites, na ordem do bisect"""
+    return tuple(f'Até {limite}kg' for limite in limites) + (f'Acima de {limites[-1]}kg',)
+
+# Tabelas indexadas por [gênero][índice da classe] -> (limites, rótulos)
+_TABELA_PESO = {
+    genero: [
+        (FAIXAS_PESO[(classe, genero)], _rotulos_categoria(FAIXAS_PESO[(classe, genero)]))
+        for classe, _, _ in FAIXAS_CLASSE
+    ]
+    for genero in GENEROS
+}
+
+def determinar_categoria(idade, peso, genero='M'):
+    """Determina a categoria de peso baseado em idade, peso e regras do Judô"""
+    if not idade or not peso:
+        return None
+    
+    limites, rotulos = _TABELA_PESO[genero if genero == 'F' else 'M'][bisect.bisect_right(_CORTES_CLASSE, idade)]
+    return rotulos[bisect.bisect_right(limites, peso)]
+
+def classificar_categorias(idades, pesos, generos=None):
+    """Classifica um elenco inteiro de uma vez (listas, arrays NumPy ou Series do pandas)
+    
+    Retorna um array NumPy de objetos com a categoria de cada atleta (None quando
+    idade ou peso estão ausentes), igual a chamar determinar_categoria linha a linha.
+    """
+    import numpy as np
+    
+    # Todas as tabelas (gênero, classe) são concatenadas com deslocamento de
+    # 1000 kg por grupo, de modo que um único searchsorted classifica tudo
+    limites_concatenados = []
+    rotulos_concatenados = []
+    for genero in GENEROS:
+        for grupo_classe, (limites, rotulos) in enumerate(_TABELA_PESO[genero]):
+            deslocamento = (GENEROS.index(genero) * len(FAIXAS_CLASSE) + grupo_classe) * 1000
+            limites_concatenados.extend(deslocamento + limite for limite in limites)
+            rotulos_concatenados.extend(rotulos)
+    rotulos_concatenados.append(None)
+    
+    idades = np.asarray(idades, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    feminino = np.zeros(idades.shape, dtype=int) if generos is None else (np.asarray(generos, dtype=object) == 'F').astype(int)
+    
+    grupo = feminino * len(FAIXAS_CLASSE) + np.searchsorted(_CORTES_CLASSE, idades, side='right')
+    chave = grupo * 1000 + np.clip(np.nan_to_num(pesos), 0, 999)
+    # Cada grupo tem um rótulo a mais que limites: soma o número do grupo ao índice
+    indices = np.searchsorted(limites_concatenados, chave, side='right') + grupo
+    
+    validos = ~np.isnan(idades) & ~np.isnan(pesos) & (idades != 0) & (pesos != 0)
+    indices[~validos] = len(rotulos_concatenados) - 1
+    return np.asarray(rotulos_concatenados, dtype=object)[indices]
+
+def obter_proxima_graduacao(graduacao_atual):
+    """Retorna a próxima graduação possível"""
+    graduacoes = [
+        "Branca", "Cinza", "Azul", "Amarela", "Laranja",
+        "Verde", "Roxa", "Marrom", "Preta"
+    ]
+    try:
+        index = graduacoes.index(graduacao_atual)
+        if index < len(graduacoes) - 1:
+            return graduacoes[index + 1]
+        return None
+    except:
+        return "Cinza"  # Se não encontrar, assume que pode graduar para Cinza
+
+def codificar_cursor(*valores):
+    """Gera um cursor opaco de paginação a partir da chave da última linha"""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor, tamanho):
+    """Lê um cursor de paginação; lança ValueError se for inválido"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise ValueError('Cursor inválido')
+    return valores
+
+def calcular_campos_derivados(data_nascimento, peso, altura):
+    """Calcula os campos persistidos a partir de nascimento, peso e altura"""
+    idade = calcular_idade(data_nascimento)
+    aniversario = None
+    if idade is not None:
+        # 'MM-DD' do nascimento, usado pela virada diária de idades
+        aniversario = str(data_nascimento)[5:10]
+    return {
+        'idade': idade,
+        'imc': calcular_imc(peso, altura),
+        'classe': determinar_classe(idade),
+        'categoria': determinar_categoria(idade, peso),
+        'aniversario': aniversario,
+    }
+
+def _parametros_derivados(data_nascimento, peso, altura):
+    """Campos derivados na ordem das colunas (idade, imc, classe, categoria, aniversario)"""
+    derivados = calcular_campos_derivados(data_nascimento, peso, altura)
+    return (derivados['idade'], derivados['imc'], derivados['classe'],
+            derivados['categoria'], derivados['aniversario'])
+
+def enriquecer_aluno(aluno):
+    """Prepara o aluno para a resposta (idade, IMC, classe e categoria já vêm do banco)"""
+    for key, value in aluno.items():
+        if isinstance(value, datetime):
+            aluno[key] = value.isoformat()
+    aluno.pop('aniversario', None)
+    
+    # Determinar próxima graduação se pode graduar
+    if aluno.get('pode_graduar') and not aluno.get('graduar_para'):
+        aluno['graduar_para'] = obter_proxima_graduacao(
+            aluno.get('graduacao_atual', 'Branca')
+        )
+    return aluno
+
+def executar_virada_idades(conn, hoje=None, todos=False):
+    """Recalcula os campos derivados dos aniversariantes desde a última execução
+    
+    Com todos=True recalcula o cadastro inteiro. Retorna o número de alunos atualizados.
+    """
+    hoje = hoje or datetime.now().date()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT ultima_execucao FROM tarefas_agendadas WHERE nome = ?', ('virada_idades',))
+        row = cursor.fetchone()
+        ultima = datetime.strptime(row['ultima_execucao'], '%Y-%m-%d').date() if row else None
+        if ultima == hoje and not todos:
+            conn.rollback()
+            return 0
+        
+        if todos or ultima is None or (hoje - ultima).days > 366:
+            cursor.execute('SELECT id, data_nascimento, peso, altura FROM alunos')
+        else:
+            # Aniversários entre o dia seguinte à última execução e hoje
+            dias = set()
+            dia = ultima + timedelta(days=1)
+            while dia <= hoje:
+                dias.add(dia.strftime('%m-%d'))
+                # Nascidos em 29/02 fazem aniversário em 01/03 nos anos não bissextos
+                if dia.month == 3 and dia.day == 1:
+                    dias.add('02-29')
+                dia += timedelta(days=1)
+            marcadores = ','.join('?' * len(dias))
+            cursor.execute(f'SELECT id, data_nascimento, peso, altura FROM alunos WHERE aniversario IN ({marcadores})',
+                           sorted(dias))
+        
+        atualizacoes = [
+            _parametros_derivados(row['data_nascimento'], row['peso'], row['altura']) + (row['id'],)
+            for row in cursor.fetchall()
+        ]
+        cursor.executemany('''
+            UPDATE alunos SET idade = ?, imc = ?, classe = ?, categoria = ?, aniversario = ?
+            WHERE id = ?
+        ''', atualizacoes)
+        cursor.execute('''
+            INSERT INTO tarefas_agendadas (nome, ultima_execucao) VALUES (?, ?)
+            ON CONFLICT(nome) DO UPDATE SET ultima_execucao = excluded.ultima_execucao
+        ''', ('virada_idades', hoje.isoformat()))
+        if atualizacoes:
+            registrar_alteracao(conn, 'alunos')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(atualizacoes)
+
+# ==================== RESUMOS DE PRESENÇA ====================
+
+# Dia do resumo: a data da presença sem hora (a própria data se não for reconhecida)
+_DIA_PRESENCA = 'COALESCE(DATE({0}.data), {0}.data)'
+
+def reconstruir_resumos_presenca(cursor, data_inicio=None, data_fim=None, fonte='presencas'):
+    """Recalcula os resumos a partir de presencas (todo o histórico ou um período)
+    
+    Roda dentro da transação do chamador. fonte pode incluir os anos arquivados
+    (ver tabela_com_arquivo). Retorna o número de dias reconstruídos.
+    """
+    dia = _DIA_PRESENCA.format('p')
+    filtro, filtro_presencas, params = '', '', []
+    if data_inicio:
+        filtro += ' AND data >= ?'
+        filtro_presencas += ' AND p.data >= ?'
+        params.append(data_inicio)
+    if data_fim:
+        filtro += ' AND data <= ?'
+        # Presenças gravadas com hora ainda pertencem ao último dia
+        filtro_presencas += " AND p.data < DATE(?, '+1 day')"
+        params.append(data_fim)
+    
+    cursor.execute(f'DELETE FROM presencas_resumo_aluno WHERE 1=1{filtro}', params)
+    cursor.execute(f'DELETE FROM presencas_resumo_dia WHERE 1=1{filtro}', params)
+    cursor.execute(f'''
+        INSERT INTO presencas_resumo_aluno (data, aluno_id, total, presentes)
+        SELECT {dia}, p.aluno_id, COUNT(*), SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END)
+        FROM {fonte} p
+        WHERE 1=1{filtro_presencas}
+        GROUP BY 1, 2
+    ''', params)
+    cursor.execute(f'''
+        INSERT INTO presencas_resumo_dia (data, total, presentes)
+        SELECT data, SUM(total), SUM(presentes) FROM presencas_resumo_aluno
+        WHERE 1=1{filtro}
+        GROUP BY data
+    ''', params)
+    cursor.execute(f'SELECT COUNT(*) FROM presencas_resumo_dia WHERE 1=1{filtro}', params)
+    return cursor.fetchone()[0]
+
+def _mascara_dias(mes, inicio, fim):
+    """Bits do mês ('AAAA-MM') que caem entre as datas inicio e fim (inclusive)"""
+    mascara = (1 << 31) - 1
+    if inicio and mes == inicio.strftime('%Y-%m'):
+        mascara &= ~((1 << (inicio.day - 1)) - 1)
+    if fim and mes == fim.strftime('%Y-%m'):
+        mascara &= (1 << fim.day) - 1
+    return mascara
+
+class BitmapPresencas:
+    """Presenças de um aluno como bitmaps mensais {'AAAA-MM': (registrados, presentes)}
+    
+    As consultas recebem datas (date) opcionais e usam só operações de bits.
+    """
+    
+    def __init__(self, meses=None):
+        self.meses = dict(meses or {})
+    
+    def _meses_no_periodo(self, inicio=None, fim=None):
+        """(mes, registrados, presentes) em ordem, já recortados pelo período"""
+        primeiro = inicio.strftime('%Y-%m') if inicio else None
+        ultimo = fim.strftime('%Y-%m') if fim else None
+        for mes in sorted(self.meses):
+            if (primeiro and mes < primeiro) or (ultimo and mes > ultimo):
+                continue
+            registrados, presentes = self.meses[mes]
+            mascara = _mascara_dias(mes, inicio, fim)
+            yield mes, registrados & mascara, presentes & mascara
+    
+    def registrou(self, dia):
+        """True/False se houve chamada no dia e o aluno esteve presente; None se não houve chamada"""
+        registrados, presentes = self.meses.get(dia.strftime('%Y-%m'), (0, 0))
+        bit = 1 << (dia.day - 1)
+        if not registrados & bit:
+            return None
+        return bool(presentes & bit)
+    
+    def frequencia(self, inicio=None, fim=None):
+        """(presentes, registrados, percentual) no período"""
+        presentes = registrados = 0
+        for _, mes_registrados, mes_presentes in self._meses_no_periodo(inicio, fim):
+            registrados += bin(mes_registrados).count('1')
+            presentes += bin(mes_presentes).count('1')
+        percentual = round(presentes / registrados * 100, 2) if registrados else 0
+        return presentes, registrados, percentual
+    
+    def maior_sequencia_ausencias(self, inicio=None, fim=None):
+        """Maior número de chamadas seguidas com ausência (dias sem chamada não interrompem)"""
+        maior = atual = 0
+        for _, registrados, presentes in self._meses_no_periodo(inicio, fim):
+            ausentes = registrados & ~presentes
+            # Percorre as chamadas do mês em ordem, isolando o bit mais baixo a cada passo
+            while registrados:
+                dia = registrados & -registrados
+                if ausentes & dia:
+                    atual += 1
+                    maior = max(maior, atual)
+                else:
+                    atual = 0
+                registrados ^= dia
+        return maior
+    
+    def ultima_presenca(self, inicio=None, fim=None):
+        """Data (date) da última presença no período, ou None"""
+        ultima = None
+        for mes, _, presentes in self._meses_no_periodo(inicio, fim):
+            if presentes:
+                ultima = (mes, presentes.bit_length())
+        if not ultima:
+            return None
+        ano, mes = ultima[0].split('-')
+        return datetime(int(ano), int(mes), ultima[1]).date()
+
+def carregar_bitmaps_presenca(conn, aluno_ids=None, inicio=None, fim=None):
+    """Lê os bitmaps mensais; retorna {aluno_id: BitmapPresencas}"""
+    query = 'SELECT aluno_id, mes, registrados, presentes FROM presencas_bitmap WHERE 1=1'
+    params = []
+    if aluno_ids is not None:
+        aluno_ids = list(aluno_ids)
+        if not aluno_ids:
+            return {}
+        query += f' AND aluno_id IN ({", ".join("?" * len(aluno_ids))})'
+        params.extend(aluno_ids)
+    if inicio:
+        query += ' AND mes >= ?'
+        params.append(inicio.strftime('%Y-%m'))
+    if fim:
+        query += ' AND mes <= ?'
+        params.append(fim.strftime('%Y-%m'))
+    
+    bitmaps = {}
+    for row in conn.execute(query, params):
+        bitmaps.setdefault(row['aluno_id'], BitmapPresencas()).meses[row['mes']] = (row['registrados'], row['presentes'])
+    return bitmaps
+
+# ==================== ARQUIVO HISTÓRICO ====================
+
+# Presenças e notificações lidas mais antigas que o corte vão para um arquivo
+# SQLite por ano (judo_arquivo_AAAA.db), anexado com ATTACH só quando uma leitura
+# alcança aquele ano. O judo.db fica com os dados recentes.
+ARQUIVO_DIR = os.environ.get('ARQUIVO_DIR', os.path.dirname(os.path.abspath(DATABASE)))
+ARQUIVAMENTO_DIAS = int(os.environ.get('ARQUIVAMENTO_DIAS', 400))
+# O SQLite anexa no máximo 10 bancos por conexão (SQLITE_MAX_ATTACHED): uma consulta
+# alcança até ARQUIVO_ANEXOS_MAXIMO anos, e listagens sem data inicial só os anos
+# arquivados dos últimos ARQUIVO_ANOS_SEM_PERIODO anos
+ARQUIVO_ANEXOS_MAXIMO = 8
+ARQUIVO_ANOS_SEM_PERIODO = int(os.environ.get('ARQUIVO_ANOS_SEM_PERIODO', 2))
+
+# Colunas copiadas para o arquivo e a coluna de data usada no corte
+TABELAS_ARQUIVO = {
+    'presencas': (
+        ('id', 'aluno_id', 'data', 'presente', 'justificativa', 'created_at', 'versao', 'alterado_em'),
+        'data',
+    ),
+    'notificacoes': (
+        ('id', 'usuario_id', 'aluno_id', 'tipo', 'titulo', 'mensagem', 'lida', 'data_notificacao', 'link'),
+        'data_notificacao',
+    ),
+}
+
+SQL_SCHEMA_ARQUIVO = [
+    '''CREATE TABLE IF NOT EXISTS {esquema}.presencas (
+        id INTEGER PRIMARY KEY, aluno_id INTEGER NOT NULL, data DATE NOT NULL,
+        presente BOOLEAN NOT NULL, justificativa TEXT, created_at TIMESTAMP,
+        versao INTEGER NOT NULL DEFAULT 0, alterado_em TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS {esquema}.idx_presencas_aluno_data ON presencas(aluno_id, data)',
+    'CREATE INDEX IF NOT EXISTS {esquema}.idx_presencas_data ON presencas(data)',
+    '''CREATE TABLE IF NOT EXISTS {esquema}.notificacoes (
+        id INTEGER PRIMARY KEY, usuario_id INTEGER, aluno_id INTEGER, tipo TEXT NOT NULL,
+        titulo TEXT NOT NULL, mensagem TEXT NOT NULL, lida BOOLEAN DEFAULT 0,
+        data_notificacao TIMESTAMP, link TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS {esquema}.idx_notificacoes_usuario_data ON notificacoes(usuario_id, data_notificacao)',
+]
+
+def caminho_arquivo(ano):
+    return os.path.join(ARQUIVO_DIR, f'judo_arquivo_{int(ano)}.db')
+
+def anos_arquivados(conn, ano_inicio=None, ano_fim=None):
+    """Anos com arquivo, do mais recente ao mais antigo, opcionalmente limitados a um intervalo"""
+    query = 'SELECT ano FROM arquivos_anuais WHERE 1=1'
+    params = []
+    if ano_inicio is not None:
+        query += ' AND ano >= ?'
+        params.append(ano_inicio)
+    if ano_fim is not None:
+        query += ' AND ano <= ?'
+        params.append(ano_fim)
+    return [row[0] for row in conn.execute(query + ' ORDER BY ano DESC', params)]
+
+def anexar_arquivo(conn, ano, criar=False):
+    """Anexa o arquivo do ano à conexão (se ainda não estiver) e retorna o nome do esquema
+    
+    O anexo vale para a conexão toda: a conexão da requisição é desanexada em liberar_db;
+    fora dela, quem anexa chama desanexar_arquivos.
+    """
+    esquema = f'arquivo_{int(ano)}'
+    anexados = {row[1] for row in conn.execute('PRAGMA database_list')}
+    if esquema not in anexados:
+        caminho = caminho_arquivo(ano)
+        if not criar and not os.path.exists(caminho):
+            return None
+        # ATTACH não pode rodar dentro de transação
+        conn.execute('ATTACH DATABASE ? AS ' + esquema, (caminho,))
+        if has_app_context() and g.get('db') is conn:
+            g.arquivos_anexados = True
+        # Mesmo modo do banco principal: sem fsync a cada commit dos lotes de arquivamento
+        conn.execute(f'PRAGMA {esquema}.synchronous = NORMAL')
+        if criar:
+            conn.execute(f'PRAGMA {esquema}.journal_mode = WAL')
+            for sql in SQL_SCHEMA_ARQUIVO:
+                conn.execute(sql.format(esquema=esquema))
+    return esquema
+
+def desanexar_arquivos(conn, manter=()):
+    """Desanexa da conexão os arquivos anuais, exceto os esquemas em manter (fora de transação)"""
+    for row in conn.execute('PRAGMA database_list').fetchall():
+        if row[1].startswith('arquivo_') and row[1] not in manter:
+            conn.execute('DETACH DATABASE ' + row[1])
+
+def fontes_arquivadas(conn, tabela, data_inicio=None, data_fim=None):
+    """Tabelas arquivadas ('arquivo_AAAA.tabela') que podem ter linhas no período
+    
+    Lança ValueError se o período alcançar mais que ARQUIVO_ANEXOS_MAXIMO anos arquivados.
+    """
+    ano_inicio = int(str(data_inicio)[:4]) if data_inicio else None
+    ano_fim = int(str(data_fim)[:4]) if data_fim else None
+    anos = anos_arquivados(conn, ano_inicio, ano_fim)
+    if len(anos) > ARQUIVO_ANEXOS_MAXIMO:
+        raise ValueError(f'O período alcança {len(anos)} anos arquivados; '
+                         f'consulte no máximo {ARQUIVO_ANEXOS_MAXIMO} por vez')
+    fontes = []
+    for ano in anos:
+        esquema = anexar_arquivo(conn, ano)
+        if esquema:
+            fontes.append(f'{esquema}.{tabela}')
+    return fontes
+
+def tabela_com_arquivo(conn, tabela, data_inicio=None, data_fim=None):
+    """Expressão FROM da tabela: ela mesma, ou UNION ALL com os anos arquivados do período
+    
+    Lança ValueError como fontes_arquivadas.
+    """
+    fontes = fontes_arquivadas(conn, tabela, data_inicio, data_fim)
+    if not fontes:
+        return tabela
+    colunas = ', '.join(TABELAS_ARQUIVO[tabela][0])
+    partes = [f'SELECT {colunas} FROM main.{tabela}'] + [f'SELECT {colunas} FROM {fonte}' for fonte in fontes]
+    return '(' + ' UNION ALL '.join(partes) + ')'
+
+def reconstruir_resumos_com_arquivo(conn, inicio=None, fim=None):
+    """Recalcula os resumos de presença do período (padrão: todo o histórico), arquivo incluído
+    
+    Cada período é uma transação própria. Retorna o número de dias reconstruídos.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    periodos = [(inicio, fim)]
+    anos = anos_arquivados(conn, int(inicio[:4]) if inicio else None, int(fim[:4]) if fim else None)
+    if len(anos) > ARQUIVO_ANEXOS_MAXIMO:
+        # Anos arquivados demais para anexar de uma vez: um ano (e uma transação) por vez.
+        # O primeiro período fica aberto no início e o último no fim, como o pedido
+        primeiro, ultimo = int(inicio[:4]) if inicio else anos[-1], int(fim[:4]) if fim else anos[0]
+        periodos = [(inicio if ano == primeiro else f'{ano}-01-01', fim if ano == ultimo else f'{ano}-12-31')
+                    for ano in range(primeiro, ultimo + 1)]
+    dias = 0
+    for periodo_inicio, periodo_fim in periodos:
+        # Anexa os anos arquivados antes da transação: os resumos cobrem o histórico inteiro
+        fonte = tabela_com_arquivo(conn, 'presencas', periodo_inicio, periodo_fim)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            dias += reconstruir_resumos_presenca(conn.cursor(), periodo_inicio, periodo_fim, fonte)
+            registrar_alteracao(conn, 'presencas')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        desanexar_arquivos(conn)
+    return dias
+
+def _somar_resumos_arquivados(cursor, fonte):
+    """Devolve aos resumos diários as presenças que acabaram de sair de presencas
+    
+    Os resumos e bitmaps guardam o histórico inteiro; o DELETE do arquivamento os
+    decrementa pelos triggers, e isto os restaura na mesma transação. fonte deve ter
+    só as linhas apagadas nesta execução: o arquivo do ano também guarda as de
+    execuções anteriores, que já estão fora dos resumos.
+    """
+    dia = _DIA_PRESENCA.format('p')
+    cursor.execute(f'''
+        INSERT INTO presencas_resumo_aluno (data, aluno_id, total, presentes)
+        SELECT {dia}, p.aluno_id, COUNT(*), SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END)
+        FROM {fonte} p
+        GROUP BY 1, 2
+        ON CONFLICT(data, aluno_id) DO UPDATE SET
+            total = total + excluded.total, presentes = presentes + excluded.presentes
+    ''')
+    cursor.execute(f'''
+        INSERT INTO presencas_resumo_dia (data, total, presentes)
+        SELECT {dia}, COUNT(*), SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END)
+        FROM {fonte} p
+        GROUP BY 1
+        ON CONFLICT(data) DO UPDATE SET
+            total = total + excluded.total, presentes = presentes + excluded.presentes
+    ''')
+
+def _totais_resumos_presenca(cursor, data_inicio, data_fim):
+    """Linhas e somas dos resumos no período [data_inicio, data_fim), para conferência"""
+    return tuple(
+        tuple(cursor.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(total), 0), COALESCE(SUM(presentes), 0)
+            FROM {tabela} WHERE data >= ? AND data < ?
+        ''', (data_inicio, data_fim)).fetchone())
+        for tabela in ('presencas_resumo_aluno', 'presencas_resumo_dia')
+    )
+
+def arquivar_historico(conn, corte):
+    """Move presenças e notificações lidas anteriores ao corte (date) para os arquivos anuais
+    
+    Cada ano de presenças é copiado e depois apagado do banco principal. Em WAL o ATTACH
+    não torna as duas escritas atômicas entre si; a cópia usa INSERT OR IGNORE, então rodar
+    de novo após uma falha só termina de apagar o que já foi copiado. As notificações
+    vão em lotes, por compactar_notificacoes.
+    Retorna {ano: {'presencas': n, 'notificacoes': n}}.
+    """
+    colunas, coluna = TABELAS_ARQUIVO['presencas']
+    lista = ', '.join(colunas)
+    anos = sorted(
+        int(row[0]) for row in conn.execute(
+            f'SELECT DISTINCT substr({coluna}, 1, 4) FROM presencas WHERE {coluna} < ?', (corte.isoformat(),)
+        ) if row[0] and row[0].isdigit()
+    )
+    
+    os.makedirs(ARQUIVO_DIR, exist_ok=True)
+    resultado = {}
+    for ano in anos:
+        esquema = anexar_arquivo(conn, ano, criar=True)
+        inicio = f'{ano:04d}-01-01'
+        fim = min(f'{ano + 1:04d}-01-01', corte.isoformat())
+        
+        # 1) cópia para o arquivo (confirmada antes de apagar do principal)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {esquema}.presencas ({lista})
+                SELECT {lista} FROM main.presencas WHERE {coluna} >= ? AND {coluna} < ?
+            ''', (inicio, fim))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        # 2) remoção do principal, só do que já está no arquivo
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.cursor()
+            resumos_antes = _totais_resumos_presenca(cursor, inicio, fim)
+            # As linhas apagadas agora ficam numa tabela temporária: só elas voltam aos resumos
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS presencas_movidas (
+                    id INTEGER PRIMARY KEY, aluno_id INTEGER, data DATE, presente BOOLEAN
+                )
+            ''')
+            cursor.execute('DELETE FROM temp.presencas_movidas')
+            cursor.execute(f'''
+                INSERT INTO temp.presencas_movidas (id, aluno_id, data, presente)
+                SELECT id, aluno_id, data, presente FROM main.presencas
+                WHERE {coluna} >= ? AND {coluna} < ?
+                  AND id IN (SELECT id FROM {esquema}.presencas)
+            ''', (inicio, fim))
+            cursor.execute('DELETE FROM main.presencas WHERE id IN (SELECT id FROM temp.presencas_movidas)')
+            movidas = cursor.rowcount
+            if movidas:
+                _somar_resumos_arquivados(cursor, 'temp.presencas_movidas')
+            # Arquivar não muda a frequência: os resumos do período têm de sair como entraram
+            if _totais_resumos_presenca(cursor, inicio, fim) != resumos_antes:
+                raise RuntimeError(f'Resumos de presença alterados ao arquivar {ano}; nada foi removido')
+            _registrar_arquivo_anual(cursor, ano)
+            registrar_alteracao(conn, 'presencas')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        desanexar_arquivos(conn)
+        resultado[ano] = {'presencas': movidas, 'notificacoes': 0}
+    
+    for ano, arquivadas in compactar_notificacoes(conn, corte)['arquivadas'].items():
+        resultado.setdefault(ano, {'presencas': 0})['notificacoes'] = arquivadas
+    return dict(sorted(resultado.items()))
+
+def _registrar_arquivo_anual(cursor, ano):
+    cursor.execute('''
+        INSERT INTO arquivos_anuais (ano, caminho, atualizado_em) VALUES (?, ?, ?)
+        ON CONFLICT(ano) DO UPDATE SET caminho = excluded.caminho, atualizado_em = excluded.atualizado_em
+    ''', (ano, caminho_arquivo(ano), datetime.now().isoformat()))
+
+# ==================== RETENÇÃO DE NOTIFICAÇÕES ====================
+# Notificações lidas mais antigas que NOTIFICACOES_RETENCAO_DIAS saem do banco
+# principal (para o arquivo do ano ou, com apagar=True, de vez). Cada lote é uma
+# transação curta, seguida de uma pausa: as rotas nunca esperam o lock de escrita
+# por mais que um lote.
+
+NOTIFICACOES_RETENCAO_DIAS = int(os.environ.get('NOTIFICACOES_RETENCAO_DIAS', 180))
+NOTIFICACOES_RETENCAO_LOTE = 500
+NOTIFICACOES_RETENCAO_PAUSA = 0.05
+
+def _transacao_curta(conn, sql, params, begin='BEGIN IMMEDIATE'):
+    """Executa uma instrução em uma transação própria; retorna (linhas afetadas, ms com o lock)"""
+    inicio = time.perf_counter()
+    conn.execute(begin)
+    try:
+        linhas = conn.execute(sql, params).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return linhas, (time.perf_counter() - inicio) * 1000
+
+def compactar_notificacoes(conn, corte, apagar=False, lote=NOTIFICACOES_RETENCAO_LOTE,
+                           pausa=NOTIFICACOES_RETENCAO_PAUSA):
+    """Tira do banco principal as notificações lidas anteriores ao corte (date), em lotes
+    
+    Sem apagar, cada lote é copiado para os arquivos anuais (e confirmado) antes do
+    DELETE, como em arquivar_historico. O checkpoint do WAL roda entre os lotes, fora
+    da transação. Retorna {'removidas': n, 'arquivadas': {ano: n}, 'lotes': n,
+    'lock_maximo_ms': ms, 'checkpoint_ms': ms}.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    if not apagar:
+        os.makedirs(ARQUIVO_DIR, exist_ok=True)
+    colunas = ', '.join(TABELAS_ARQUIVO['notificacoes'][0])
+    resultado = {'removidas': 0, 'arquivadas': {}, 'lotes': 0, 'lock_maximo_ms': 0.0, 'checkpoint_ms': 0.0}
+    
+    # Com o checkpoint automático, o commit de cada lote também copiaria o WAL para o banco
+    checkpoint_automatico = conn.execute('PRAGMA wal_autocheckpoint').fetchone()[0]
+    conn.execute('PRAGMA wal_autocheckpoint = 0')
+    try:
+        while True:
+            por_ano = {}
+            for row in conn.execute(
+                'SELECT id, data_notificacao FROM notificacoes WHERE lida = 1 AND data_notificacao < ? '
+                'ORDER BY data_notificacao LIMIT ?', (corte.isoformat(), lote)
+            ):
+                por_ano.setdefault(int(row[1][:4]), []).append(row[0])
+            if not por_ano:
+                desanexar_arquivos(conn)
+                return resultado
+            
+            for ano, ids in por_ano.items():
+                condicao = f'id IN ({", ".join("?" * len(ids))})'
+                tempos = []
+                if not apagar:
+                    # ATTACH fica fora da transação; o ano é registrado antes de receber linhas.
+                    # Um ano anexado por vez (limite do ATTACH); os lotes seguem a data, então
+                    # o ano continua o mesmo de um lote para o outro
+                    desanexar_arquivos(conn, manter={f'arquivo_{ano}'})
+                    esquema = anexar_arquivo(conn, ano, criar=True)
+                    if ano not in resultado['arquivadas']:
+                        resultado['arquivadas'][ano] = 0
+                        _registrar_arquivo_anual(conn, ano)
+                        conn.commit()
+                    # BEGIN simples: o lock de escrita é só o do arquivo, o banco principal é lido
+                    _, ms = _transacao_curta(conn, (
+                        f'INSERT OR IGNORE INTO {esquema}.notificacoes ({colunas}) '
+                        f'SELECT {colunas} FROM main.notificacoes WHERE {condicao}'
+                    ), ids, begin='BEGIN')
+                    tempos.append(ms)
+                    # EXISTS busca cada id pela chave; IN (SELECT ...) leria o arquivo inteiro a cada lote
+                    condicao += f' AND EXISTS (SELECT 1 FROM {esquema}.notificacoes a WHERE a.id = notificacoes.id)'
+                removidas, ms = _transacao_curta(conn, f'DELETE FROM main.notificacoes WHERE {condicao}', ids)
+                tempos.append(ms)
+                resultado['removidas'] += removidas
+                resultado['lock_maximo_ms'] = max(resultado['lock_maximo_ms'], *tempos)
+                if not apagar:
+                    resultado['arquivadas'][ano] += removidas
+            
+            resultado['lotes'] += 1
+            inicio = time.perf_counter()
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            resultado['checkpoint_ms'] += (time.perf_counter() - inicio) * 1000
+            if pausa:
+                time.sleep(pausa)
+    finally:
+        conn.execute(f'PRAGMA wal_autocheckpoint = {int(checkpoint_automatico)}')
+
+# ==================== IMPORTAÇÃO DE ALUNOS ====================
+
+# Nomes de coluna aceitos na planilha (já em minúsculas e sem espaços nas pontas)
+COLUNAS_IMPORTACAO = {
+    'nome': ['nome', 'nome completo', 'nome_completo', 'nomecompleto'],
+    'data_nascimento': ['data nascimento', 'data_nascimento', 'datanascimento', 'nascimento', 'data de nascimento'],
+    'tipo': ['tipo', 'categoria', 'categoria_aluno'],
+    'nome_responsavel': ['responsavel', 'nome responsavel', 'nome_responsavel', 'responsável'],
+    'contato': ['contato', 'telefone', 'whatsapp', 'celular'],
+    'data_matricula': ['data matricula', 'data_matricula', 'matricula', 'data de matrícula'],
+    'status': ['status', 'situacao', 'situação'],
+    'graduacao_atual': ['graduacao', 'graduação', 'graduacao_atual', 'faixa', 'faixa atual'],
+    'modalidade': ['modalidade'],
+    'peso': ['peso', 'peso (kg)', 'peso_kg'],
+    'altura': ['altura', 'altura (cm)', 'altura_cm'],
+    'observacoes': ['observacoes', 'observações', 'obs', 'observacao']
+}
+
+GRADUACOES_VALIDAS = ['Branca', 'Cinza', 'Azul', 'Amarela', 'Laranja', 'Verde', 'Roxa', 'Marrom', 'Preta']
+
+FORMATOS_DATA_NASCIMENTO = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y/%m/%d']
+FORMATOS_DATA_MATRICULA = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']
+
+# Linhas por executemany dentro da transação da importação
+IMPORTACAO_TAMANHO_LOTE = 1000
+
+SQL_INSERIR_ALUNO = '''
+    INSERT INTO alunos (nome_completo, tipo, data_nascimento, nome_responsavel,
+                      contato, data_matricula, status, observacoes,
+                      graduacao_atual, modalidade, pode_graduar, graduar_para,
+                      peso, altura, idade, imc, classe, categoria, aniversario)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def mapear_colunas_importacao(colunas):
+    """Associa cada campo do cadastro à primeira coluna da planilha com nome conhecido"""
+    col_mapping = {}
+    for key, possible_names in COLUNAS_IMPORTACAO.items():
+        for col in colunas:
+            if col in possible_names:
+                col_mapping[key] = col
+                break
+    return col_mapping
+
+def _coluna_texto(df, col_mapping, campo):
+    """Coluna como texto sem espaços nas pontas; None onde a célula está vazia"""
+    import pandas as pd
+    
+    resultado = pd.Series(None, index=df.index, dtype=object)
+    if campo in col_mapping:
+        serie = df[col_mapping[campo]]
+        preenchidas = serie.notna()
+        resultado[preenchidas] = serie[preenchidas].astype(str).str.strip()
+    return resultado
+
+def _coluna_data(df, col_mapping, campo, formatos):
+    """Coluna de datas em ISO; textos são lidos pelos formatos na ordem dada"""
+    import pandas as pd
+    
+    resultado = pd.Series(None, index=df.index, dtype=object)
+    if campo not in col_mapping:
+        return resultado
+    serie = df[col_mapping[campo]]
+    serie = serie[serie.notna()]
+    eh_texto = serie.map(lambda valor: isinstance(valor, str)).astype(bool)
+    
+    pendentes = serie[eh_texto]
+    for fmt in formatos:
+        if pendentes.empty:
+            break
+        convertidas = pd.to_datetime(pendentes, format=fmt, errors='coerce')
+        validas = convertidas.notna()
+        resultado[convertidas.index[validas]] = convertidas[validas].dt.strftime('%Y-%m-%d')
+        pendentes = pendentes[~validas]
+    
+    # Células já convertidas em data pelo leitor (ex.: Excel)
+    outras = serie[~eh_texto]
+    if not outras.empty:
+        convertidas = pd.to_datetime(outras, errors='coerce')
+        validas = convertidas.notna()
+        resultado[convertidas.index[validas]] = convertidas[validas].dt.strftime('%Y-%m-%d')
+    return resultado
+
+def _coluna_numero(df, col_mapping, campo):
+    """Coluna numérica; valores vazios ou inválidos viram NaN"""
+    import pandas as pd
+    
+    if campo not in col_mapping:
+        return pd.Series(float('nan'), index=df.index)
+    return pd.to_numeric(df[col_mapping[campo]], errors='coerce')
+
+def calcular_campos_derivados_lote(datas_nascimento, pesos, alturas):
+    """Versão em lote de calcular_campos_derivados: retorna tuplas (idade, imc, classe, categoria, aniversario)"""
+    import numpy as np
+    import pandas as pd
+    
+    hoje = datetime.now().date()
+    nascimentos = pd.to_datetime(pd.Series(datas_nascimento, dtype=object), format='%Y-%m-%d', errors='coerce')
+    ano, mes, dia = nascimentos.dt.year, nascimentos.dt.month, nascimentos.dt.day
+    ainda_nao_fez = (mes * 100 + dia) > (hoje.month * 100 + hoje.day)
+    idades = (hoje.year - ano - ainda_nao_fez.astype(int)).to_numpy(dtype=float, na_value=np.nan)
+    
+    pesos = np.asarray(pesos, dtype=float)
+    alturas = np.asarray(alturas, dtype=float)
+    alturas_m = np.where(alturas < 3, alturas, alturas / 100)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        imcs = pesos / alturas_m ** 2
+    imc_valido = ~np.isnan(pesos) & ~np.isnan(alturas) & (pesos != 0) & (alturas != 0)
+    
+    indice_classe = np.searchsorted(_CORTES_CLASSE, idades, side='right')
+    categorias = classificar_categorias(idades, pesos)
+    nomes_classe = [classe for classe, _, _ in FAIXAS_CLASSE]
+    
+    derivados = []
+    for posicao, data in enumerate(datas_nascimento):
+        idade = idades[posicao]
+        tem_idade = not np.isnan(idade)
+        derivados.append((
+            int(idade) if tem_idade else None,
+            round(float(imcs[posicao]), 2) if imc_valido[posicao] else None,
+            nomes_classe[indice_classe[posicao]] if tem_idade and idade != 0 else None,
+            categorias[posicao],
+            data[5:10] if tem_idade else None,
+        ))
+    return derivados
+
+def normalizar_planilha(df, primeira_linha=2):
+    """Normaliza a planilha coluna a coluna
+    
+    Retorna (registros, erros, col_mapping). Cada registro é (linha, nome, parâmetros
+    de SQL_INSERIR_ALUNO); os erros seguem o formato do relatório de importação.
+    primeira_linha é o número da linha da planilha correspondente à primeira linha do df.
+    """
+    # Normalizar nomes das colunas
+    df.columns = df.columns.str.strip().str.lower()
+    col_mapping = mapear_colunas_importacao(df.columns)
+    if 'nome' not in col_mapping:
+        return None, None, col_mapping
+    
+    df = df.reset_index(drop=True)
+    linhas = df.index + primeira_linha
+    
+    nomes = df[col_mapping['nome']].astype(object).map(str).str.strip()
+    nome_vazio = (nomes == '') | (nomes == 'nan') | df[col_mapping['nome']].isna()
+    
+    tipos = _coluna_texto(df, col_mapping, 'tipo').fillna('nan').str.lower()
+    tipos = tipos.str.contains('adulto', regex=False).map({True: 'Adulto', False: 'Criança'})
+    
+    status = _coluna_texto(df, col_mapping, 'status').fillna('nan').str.lower()
+    status = status.str.contains('inativo', regex=False).map({True: 'Inativo', False: 'Ativo'})
+    
+    graduacoes = _coluna_texto(df, col_mapping, 'graduacao_atual')
+    graduacoes = graduacoes.where(graduacoes.isin(GRADUACOES_VALIDAS), 'Branca')
+    
+    datas_nascimento = _coluna_data(df, col_mapping, 'data_nascimento', FORMATOS_DATA_NASCIMENTO)
+    datas_matricula = _coluna_data(df, col_mapping, 'data_matricula', FORMATOS_DATA_MATRICULA)
+    datas_matricula = datas_matricula.fillna(datetime.now().date().isoformat())
+    
+    pesos = _coluna_numero(df, col_mapping, 'peso')
+    alturas = _coluna_numero(df, col_mapping, 'altura')
+    alturas = alturas.where(alturas < 3, alturas / 100)
+    
+    responsaveis = _coluna_texto(df, col_mapping, 'nome_responsavel')
+    contatos = _coluna_texto(df, col_mapping, 'contato')
+    modalidades = _coluna_texto(df, col_mapping, 'modalidade')
+    observacoes = _coluna_texto(df, col_mapping, 'observacoes')
+    
+    erros = [
+        {'linha': int(linha), 'nome': 'Vazio', 'erro': 'Nome não pode estar vazio'}
+        for linha in linhas[nome_vazio.to_numpy()]
+    ]
+    
+    validas = ~nome_vazio.to_numpy()
+    pesos_validos = pesos[validas].tolist()
+    alturas_validas = alturas[validas].tolist()
+    nascimentos_validos = datas_nascimento[validas].tolist()
+    derivados = calcular_campos_derivados_lote(nascimentos_validos, pesos_validos, alturas_validas)
+    
+    def _valor(numero):
+        return None if numero != numero else numero  # NaN -> None
+    
+    registros = []
+    colunas = zip(
+        linhas[validas], nomes[validas], tipos[validas], nascimentos_validos,
+        responsaveis[validas], contatos[validas], datas_matricula[validas], status[validas],
+        observacoes[validas], graduacoes[validas], modalidades[validas],
+        pesos_validos, alturas_validas, derivados
+    )
+    for (linha, nome, tipo, nascimento, responsavel, contato, matricula, situacao,
+         observacao, graduacao, modalidade, peso, altura, derivado) in colunas:
+        registros.append((int(linha), nome, (
+            nome, tipo, nascimento, responsavel,
+            contato, matricula, situacao, observacao,
+            graduacao, modalidade, False, None, _valor(peso), _valor(altura)
+        ) + derivado))
+    return registros, erros, col_mapping
+
+def inserir_alunos_em_lote(conn, registros, tamanho_lote=IMPORTACAO_TAMANHO_LOTE):
+    """Insere os registros com executemany em lotes, dentro da transação do chamador
+    
+    Se um lote falhar, ele é refeito linha a linha para apontar quais linhas deram erro.
+    Retorna (sucesso, erros) no formato do relatório de importação.
+    """
+    cursor = conn.cursor()
+    sucesso = []
+    erros = []
+    for inicio in range(0, len(registros), tamanho_lote):
+        lote = registros[inicio:inicio + tamanho_lote]
+        cursor.execute('SAVEPOINT lote_importacao')
+        try:
+            cursor.executemany(SQL_INSERIR_ALUNO, [params for _, _, params in lote])
+            cursor.execute('RELEASE lote_importacao')
+            sucesso.extend({'linha': linha, 'nome': nome} for linha, nome, _ in lote)
+            continue
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK TO lote_importacao')
+            cursor.execute('RELEASE lote_importacao')
+        for linha, nome, params in lote:
+            try:
+                cursor.execute(SQL_INSERIR_ALUNO, params)
+                sucesso.append({'linha': linha, 'nome': nome})
+            except Exception as e:
+                erros.append({'linha': linha, 'nome': nome, 'erro': str(e)})
+    return sucesso, erros
+
+class ErroImportacao(Exception):
+    """Planilha que não pode ser importada (formato ou colunas ausentes)"""
+
+# Células que o pandas tratava como vazias ao ler CSV (na_values padrão)
+VALORES_VAZIOS_CSV = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+
+def detectar_encoding(arquivo, encodings=('utf-8', 'cp1252', 'latin-1')):
+    """Descobre o encoding de um arquivo binário lendo-o em blocos, sem carregá-lo inteiro
+    
+    latin-1 aceita qualquer byte, por isso fica por último. O arquivo volta ao início.
+    """
+    try:
+        for encoding in encodings:
+            arquivo.seek(0)
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+                    decoder.decode(bloco)
+                decoder.decode(b'', final=True)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return encodings[-1]
+    finally:
+        arquivo.seek(0)
+
+@lru_cache(maxsize=65536)
+def _converter_data(valor, formatos):
+    """Data a partir de texto, tentando os formatos na ordem; None se nenhum servir
+    
+    Memorizada: datas se repetem muito numa planilha e o strptime é o passo mais caro da linha.
+    """
+    for fmt in formatos:
+        try:
+            return datetime.strptime(valor, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _converter_numero(valor):
+    """Número a partir de texto; None se vazio ou inválido"""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return None if numero != numero else numero  # NaN -> None
+
+def normalizar_linha_csv(valores, indices, linha):
+    """Normaliza uma linha do CSV; retorna (registro, None) ou (None, erro)
+    
+    Segue as mesmas regras de normalizar_planilha, célula a célula.
+    """
+    def celula(campo):
+        indice = indices.get(campo)
+        if indice is None or indice >= len(valores) or valores[indice] in VALORES_VAZIOS_CSV:
+            return None
+        return valores[indice]
+    
+    def texto(campo):
+        valor = celula(campo)
+        return valor.strip() if valor is not None else None
+    
+    nome_completo = texto('nome') or ''
+    if nome_completo in ('', 'nan'):
+        return None, {'linha': linha, 'nome': 'Vazio', 'erro': 'Nome não pode estar vazio'}
+    
+    tipo = 'Adulto' if 'adulto' in (texto('tipo') or '').lower() else 'Criança'
+    status = 'Inativo' if 'inativo' in (texto('status') or '').lower() else 'Ativo'
+    graduacao_atual = texto('graduacao_atual')
+    if graduacao_atual not in GRADUACOES_VALIDAS:
+        graduacao_atual = 'Branca'
+    
+    nascimento = matricula = None
+    if celula('data_nascimento') is not None:
+        nascimento = _converter_data(celula('data_nascimento'), tuple(FORMATOS_DATA_NASCIMENTO))
+    if celula('data_matricula') is not None:
+        matricula = _converter_data(celula('data_matricula'), tuple(FORMATOS_DATA_MATRICULA))
+    data_nascimento = nascimento.isoformat() if nascimento else None
+    data_matricula = (matricula or datetime.now().date()).isoformat()
+    
+    peso = _converter_numero(celula('peso'))
+    altura = _converter_numero(celula('altura'))
+    if altura is not None and altura >= 3:
+        altura = altura / 100
+    
+    params = (
+        nome_completo, tipo, data_nascimento, texto('nome_responsavel'),
+        texto('contato'), data_matricula, status, texto('observacoes'),
+        graduacao_atual, texto('modalidade'), False, None, peso, altura
+    ) + _parametros_derivados(nascimento, peso, altura)
+    return (linha, nome_completo, params), None
+
+def blocos_csv(arquivo, linhas_por_bloco):
+    """Lê um CSV em streaming com o módulo csv, em memória constante
+    
+    Gera (registros, erros, linhas_lidas) a cada linhas_por_bloco linhas.
+    """
+    encoding = detectar_encoding(arquivo)
+    if encoding == 'utf-8':
+        encoding = 'utf-8-sig'  # ignora o BOM do Excel
+    texto = io.TextIOWrapper(arquivo, encoding=encoding, newline='')
+    try:
+        leitor = csv.reader(texto)
+        cabecalho = next(leitor, None)
+        if not cabecalho:
+            raise ErroImportacao('Arquivo vazio')
+        
+        colunas = [coluna.strip().lower() for coluna in cabecalho]
+        col_mapping = mapear_colunas_importacao(colunas)
+        if 'nome' not in col_mapping:
+            raise ErroImportacao('Coluna "Nome" não encontrada na planilha')
+        indices = {campo: colunas.index(coluna) for campo, coluna in col_mapping.items()}
+        
+        registros, erros, lidas = [], [], 0
+        linha = 1
+        for valores in leitor:
+            if not valores:
+                continue  # linhas em branco são ignoradas, como no pandas
+            linha += 1
+            lidas += 1
+            registro, erro = normalizar_linha_csv(valores, indices, linha)
+            if erro:
+                erros.append(erro)
+            else:
+                registros.append(registro)
+            if lidas >= linhas_por_bloco:
+                yield registros, erros, lidas
+                registros, erros, lidas = [], [], 0
+        if lidas:
+            yield registros, erros, lidas
+    finally:
+        texto.detach()
+
+def ler_excel_em_blocos(arquivo, nome_arquivo, linhas_por_bloco):
+    """Gera DataFrames de até linhas_por_bloco linhas de uma planilha Excel
+    
+    .xlsx é lido em streaming pelo openpyxl (read_only), sem montar a planilha
+    inteira em memória. pandas e openpyxl só são importados aqui.
+    """
+    import pandas as pd
+    
+    if nome_arquivo.lower().endswith('.xlsx'):
+        import openpyxl
+        
+        workbook = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = workbook.active.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is None or all(valor is None for valor in cabecalho):
+                raise ErroImportacao('Planilha vazia ou sem cabeçalho')
+            colunas = [str(valor) if valor is not None else f'Unnamed: {i}' for i, valor in enumerate(cabecalho)]
+            bloco = []
+            # Linhas totalmente vazias só entram se vier uma linha preenchida depois:
+            # o modo read_only devolve as vazias do fim da planilha, que o pandas descartava
+            vazias = []
+            for linha in linhas:
+                if all(valor is None or (isinstance(valor, str) and not valor.strip()) for valor in linha):
+                    vazias.append(linha)
+                    continue
+                bloco.extend(vazias)
+                vazias = []
+                bloco.append(linha)
+                if len(bloco) >= linhas_por_bloco:
+                    yield pd.DataFrame(bloco, columns=colunas)
+                    bloco = []
+            if bloco:
+                yield pd.DataFrame(bloco, columns=colunas)
+        finally:
+            workbook.close()
+    else:
+        # .xls não tem leitura em streaming; é lido inteiro e dividido em blocos
+        df = pd.read_excel(arquivo)
+        if len(df.columns) == 0:
+            raise ErroImportacao('Planilha vazia ou sem cabeçalho')
+        for inicio in range(0, len(df), linhas_por_bloco):
+            yield df.iloc[inicio:inicio + linhas_por_bloco]
+
+def blocos_excel(arquivo, nome_arquivo, linhas_por_bloco):
+    """Gera (registros, erros, linhas_lidas) de uma planilha Excel, normalizada coluna a coluna"""
+    lidas_total = 0
+    for df in ler_excel_em_blocos(arquivo, nome_arquivo, linhas_por_bloco):
+        registros, erros, col_mapping = normalizar_planilha(df, primeira_linha=lidas_total + 2)
+        if registros is None:
+            raise ErroImportacao('Coluna "Nome" não encontrada na planilha')
+        lidas_total += len(df)
+        yield registros, erros, len(df)
+
+def blocos_importacao(arquivo, nome_arquivo, linhas_por_bloco=IMPORTACAO_TAMANHO_LOTE):
+    """Escolhe o leitor pelo tipo do arquivo (arquivo binário aberto)"""
+    nome_arquivo = nome_arquivo.lower()
+    if nome_arquivo.endswith('.csv'):
+        return blocos_csv(arquivo, linhas_por_bloco)
+    if nome_arquivo.endswith(('.xlsx', '.xls')):
+        return blocos_excel(arquivo, nome_arquivo, linhas_por_bloco)
+    raise ErroImportacao('Formato não suportado. Use CSV ou Excel (.xlsx, .xls)')
+
+def importar_arquivo(conn, arquivo, nome_arquivo):
+    """Lê, normaliza e grava uma planilha em uma única transação; retorna o relatório"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        sucesso, erros, total = [], [], 0
+        for registros, erros_validacao, lidas in blocos_importacao(arquivo, nome_arquivo):
+            sucesso_bloco, erros_insercao = inserir_alunos_em_lote(conn, registros)
+            sucesso.extend(sucesso_bloco)
+            erros.extend(erros_validacao + erros_insercao)
+            total += lidas
+        registrar_alteracao(conn, 'alunos')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    return {
+        'sucesso': sucesso,
+        'erros': sorted(erros, key=lambda erro: erro['linha']),
+        'total': total
+    }
+
+# ==================== IMPORTAÇÃO EM SEGUNDO PLANO ====================
+# Planilhas grandes são gravadas em disco e processadas em um processo
+# separado, em blocos com commit próprio. O andamento fica na tabela
+# importacoes, visível a qualquer worker.
+
+IMPORTACAO_DIR = os.environ.get('IMPORTACAO_DIR', os.path.join(tempfile.gettempdir(), 'judo_importacoes'))
+IMPORTACAO_PROCESSOS = int(os.environ.get('IMPORTACAO_PROCESSOS', 1))
+IMPORTACAO_LINHAS_POR_BLOCO = 5000
+
+_executor_importacao = {'executor': None, 'pid': None}
+
+def obter_executor_importacao():
+    """Pool de processos da importação (um por worker, recriado após fork)"""
+    if _executor_importacao['executor'] is None or _executor_importacao['pid'] != os.getpid():
+        _executor_importacao['executor'] = ProcessPoolExecutor(max_workers=IMPORTACAO_PROCESSOS)
+        _executor_importacao['pid'] = os.getpid()
+    return _executor_importacao['executor']
+
+def _atualizar_importacao(conn, importacao_id, **campos):
+    """Atualiza o registro da importação e confirma"""
+    campos['atualizada_em'] = datetime.now().isoformat()
+    atribuicoes = ', '.join(f'{campo} = ?' for campo in campos)
+    conn.execute(f'UPDATE importacoes SET {atribuicoes} WHERE id = ?', list(campos.values()) + [importacao_id])
+    conn.commit()
+
+def _importacao_cancelada(conn, importacao_id):
+    row = conn.execute('SELECT cancelar FROM importacoes WHERE id = ?', (importacao_id,)).fetchone()
+    return not row or bool(row['cancelar'])
+
+def executar_importacao(importacao_id, caminho, nome_arquivo):
+    """Processa uma importação em segundo plano (roda no pool de processos)"""
+    conn = get_db()
+    try:
+        if _importacao_cancelada(conn, importacao_id):
+            _atualizar_importacao(conn, importacao_id, status='Cancelada', concluida_em=datetime.now().isoformat())
+            return
+        _atualizar_importacao(conn, importacao_id, status='Processando', iniciada_em=datetime.now().isoformat())
+        
+        processadas = sucesso_total = erros_total = 0
+        status_final = 'Concluída'
+        with open(caminho, 'rb') as arquivo:
+            for registros, erros_validacao, lidas in blocos_importacao(arquivo, nome_arquivo, IMPORTACAO_LINHAS_POR_BLOCO):
+                if _importacao_cancelada(conn, importacao_id):
+                    status_final = 'Cancelada'
+                    break
+                
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    sucesso, erros_insercao = inserir_alunos_em_lote(conn, registros)
+                    erros = erros_validacao + erros_insercao
+                    conn.executemany(
+                        'INSERT INTO importacoes_erros (importacao_id, linha, nome, erro) VALUES (?, ?, ?, ?)',
+                        [(importacao_id, erro['linha'], erro['nome'], erro['erro']) for erro in erros]
+                    )
+                    processadas += lidas
+                    sucesso_total += len(sucesso)
+                    erros_total += len(erros)
+                    registrar_alteracao(conn, 'alunos')
+                    _atualizar_importacao(conn, importacao_id, linhas_processadas=processadas,
+                                          sucesso=sucesso_total, erros=erros_total)
+                except Exception:
+                    conn.rollback()
+                    raise
+        
+        _atualizar_importacao(
+            conn, importacao_id, status=status_final, concluida_em=datetime.now().isoformat(),
+            mensagem=f'Importação concluída: {sucesso_total} sucesso(s), {erros_total} erro(s)'
+            if status_final == 'Concluída' else 'Importação cancelada'
+        )
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        _atualizar_importacao(conn, importacao_id, status='Falhou', mensagem=f'Erro ao processar arquivo: {str(e)}',
+                              concluida_em=datetime.now().isoformat())
+    finally:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+def iniciar_importacao(file):
+    """Grava o upload em disco, registra a importação e a envia ao pool; retorna o id"""
+    os.makedirs(IMPORTACAO_DIR, exist_ok=True)
+    importacao_id = secrets.token_hex(16)
+    extensao = os.path.splitext(file.filename.lower())[1]
+    caminho = os.path.join(IMPORTACAO_DIR, importacao_id + extensao)
+    file.save(caminho)
     
-    if idade < 13:
-        return "Infantil"
-    elif idade < 16:
-        return "Juvenil"
-    elif idade < 20:
-        return "Júnior"
-    elif idade < 30:
-        return "Sênior"
-    else:
-        return "Veterano"
+    conn = get_db()
+    conn.execute('''
+        INSERT INTO importacoes (id, usuario_id, arquivo, status, atualizada_em)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (importacao_id, session.get('user_id'), secure_filename(file.filename), 'Na fila',
+          datetime.now().isoformat()))
+    conn.commit()
+    
+    obter_executor_importacao().submit(executar_importacao, importacao_id, caminho, file.filename)
+    return importacao_id
 
-def determinar_categoria(idade, peso, genero='M'):
-    """Determina a categoria de peso baseado em idade, peso e regras do Judô"""
-    if not idade or not peso:
-        return None
+# ==================== SAÍDA DE NOTIFICAÇÕES ====================
+# As rotas gravam um evento em notificacoes_saida na mesma transação da alteração
+# (uma linha, qualquer que seja o número de destinatários). Um worker resolve os
+# destinatários e grava as notificações em lotes, com novas tentativas espaçadas;
+# eventos que esgotam as tentativas ficam como 'descartada' para análise.
+
+# 'thread': worker em segundo plano em cada processo; 'cli': só via "flask notificacoes worker"
+NOTIFICACOES_WORKER = os.environ.get('NOTIFICACOES_WORKER', 'thread')
+SAIDA_LOTE = int(os.environ.get('SAIDA_LOTE', 200))
+SAIDA_INTERVALO = float(os.environ.get('SAIDA_INTERVALO', 2))
+SAIDA_TENTATIVAS = int(os.environ.get('SAIDA_TENTATIVAS', 5))
+SAIDA_BACKOFF = float(os.environ.get('SAIDA_BACKOFF', 5))
+
+_worker_saida = {'thread': None, 'pid': None, 'sinal': threading.Event()}
+_worker_saida_lock = threading.Lock()
+_stats_saida = {'lotes': 0, 'enviadas': 0, 'notificacoes': 0, 'falhas': 0, 'descartadas': 0,
+                'ultimo_lote_ms': None, 'ultimo_lote_em': None}
+_stats_saida_lock = threading.Lock()
+
+def enfileirar_notificacao(cursor, destino, aluno_id=None, tipo='', titulo='', mensagem='', link=None):
+    """Registra uma notificação para envio, na transação do cursor do chamador (sem commit)
     
-    # Categorias simplificadas baseadas nas regras da CBJ
-    if idade < 13:  # Infantil
-        if peso < 30:
-            return "Até 30kg"
-        elif peso < 34:
-            return "Até 34kg"
-        elif peso < 38:
-            return "Até 38kg"
-        elif peso < 42:
-            return "Até 42kg"
-        elif peso < 46:
-            return "Até 46kg"
-        elif peso < 50:
-            return "Até 50kg"
-        elif peso < 55:
-            return "Até 55kg"
-        else:
-            return "Acima de 55kg"
-    elif idade < 16:  # Juvenil
-        if peso < 40:
-            return "Até 40kg"
-        elif peso < 44:
-            return "Até 44kg"
-        elif peso < 48:
-            return "Até 48kg"
-        elif peso < 52:
-            return "Até 52kg"
-        elif peso < 57:
-            return "Até 57kg"
-        elif peso < 63:
-            return "Até 63kg"
-        elif peso < 70:
-            return "Até 70kg"
-        else:
-            return "Acima de 70kg"
-    elif idade < 20:  # Júnior
-        if peso < 50:
-            return "Até 50kg"
-        elif peso < 55:
-            return "Até 55kg"
-        elif peso < 60:
-            return "Até 60kg"
-        elif peso < 66:
-            return "Até 66kg"
-        elif peso < 73:
-            return "Até 73kg"
-        elif peso < 81:
-            return "Até 81kg"
-        elif peso < 90:
-            return "Até 90kg"
-        elif peso < 100:
-            return "Até 100kg"
-        else:
-            return "Acima de 100kg"
-    else:  # Sênior/Veterano
-        if peso < 60:
-            return "Até 60kg"
-        elif peso < 66:
-            return "Até 66kg"
-        elif peso < 73:
-            return "Até 73kg"
-        elif peso < 81:
-            return "Até 81kg"
-        elif peso < 90:
-            return "Até 90kg"
-        elif peso < 100:
-            return "Até 100kg"
-        else:
-            return "Acima de 100kg"
+    destino: 'usuario:<id>', 'aluno:<id>' (usuário vinculado ao aluno) ou 'perfil:<perfil>'.
+    """
+    agora = datetime.now().isoformat()
+    cursor.execute('''
+        INSERT INTO notificacoes_saida (destino, aluno_id, tipo, titulo, mensagem, link, criada_em, proxima_tentativa)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (destino, aluno_id, tipo, titulo, mensagem, link, agora, agora))
+    iniciar_worker_saida()
 
-def obter_proxima_graduacao(graduacao_atual):
-    """Retorna a próxima graduação possível"""
-    graduacoes = [
-        "Branca", "Cinza", "Azul", "Amarela", "Laranja",
-        "Verde", "Roxa", "Marrom", "Preta"
-    ]
+def resolver_destinatarios(conn, destino):
+    """Ids dos usuários de um destino da fila"""
+    tipo, _, valor = destino.partition(':')
+    if tipo == 'perfil':
+        return usuarios_por_perfil(conn, valor)
+    if tipo == 'aluno':
+        return tuple(usuarios_dos_alunos(conn.cursor(), [int(valor)]).values())
+    if tipo == 'usuario':
+        return (int(valor),)
+    raise ValueError(f'Destino inválido: {destino}')
+
+def processar_saida_notificacoes(conn, limite=SAIDA_LOTE):
+    """Entrega um lote de eventos vencidos em uma transação; retorna quantos foram lidos
+    
+    Cada evento roda em um SAVEPOINT: uma falha só adia aquele evento (espera
+    SAIDA_BACKOFF * 2^(tentativas-1) segundos) ou o descarta após SAIDA_TENTATIVAS.
+    """
+    inicio = time.perf_counter()
+    agora = datetime.now()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        index = graduacoes.index(graduacao_atual)
-        if index < len(graduacoes) - 1:
-            return graduacoes[index + 1]
-        return None
-    except:
-        return "Cinza"  # Se não encontrar, assume que pode graduar para Cinza
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM notificacoes_saida
+            WHERE status = 'pendente' AND proxima_tentativa <= ?
+            ORDER BY proxima_tentativa, id LIMIT ?
+        ''', (agora.isoformat(), limite))
+        eventos = cursor.fetchall()
+        enviadas, notificacoes, falhas, descartadas = [], 0, 0, 0
+        for evento in eventos:
+            cursor.execute('SAVEPOINT evento_saida')
+            try:
+                notificacoes += notificar(
+                    cursor, resolver_destinatarios(conn, evento['destino']), evento['aluno_id'],
+                    evento['tipo'], evento['titulo'], evento['mensagem'], evento['link']
+                )
+                cursor.execute('RELEASE evento_saida')
+                enviadas.append((evento['id'],))
+            except Exception as e:
+                cursor.execute('ROLLBACK TO evento_saida')
+                cursor.execute('RELEASE evento_saida')
+                tentativas = evento['tentativas'] + 1
+                if tentativas >= SAIDA_TENTATIVAS:
+                    status, proxima = 'descartada', evento['proxima_tentativa']
+                    descartadas += 1
+                else:
+                    status = 'pendente'
+                    proxima = (agora + timedelta(seconds=SAIDA_BACKOFF * 2 ** (tentativas - 1))).isoformat()
+                    falhas += 1
+                cursor.execute('''
+                    UPDATE notificacoes_saida SET status = ?, tentativas = ?, proxima_tentativa = ?, erro = ?
+                    WHERE id = ?
+                ''', (status, tentativas, proxima, str(e), evento['id']))
+        # Eventos entregues saem da fila; a fila só guarda pendentes e descartados
+        cursor.executemany('DELETE FROM notificacoes_saida WHERE id = ?', enviadas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if notificacoes:
+        invalidar_contadores_nao_lidas()
+    
+    if eventos:
+        with _stats_saida_lock:
+            _stats_saida['lotes'] += 1
+            _stats_saida['enviadas'] += len(enviadas)
+            _stats_saida['notificacoes'] += notificacoes
+            _stats_saida['falhas'] += falhas
+            _stats_saida['descartadas'] += descartadas
+            _stats_saida['ultimo_lote_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+            _stats_saida['ultimo_lote_em'] = agora.isoformat()
+    return len(eventos)
+
+def drenar_saida_notificacoes(conn, limite=SAIDA_LOTE):
+    """Processa lotes até não sobrar evento vencido; retorna o total lido"""
+    total = 0
+    while True:
+        lidos = processar_saida_notificacoes(conn, limite)
+        total += lidos
+        if lidos < limite:
+            if total:
+                hub_notificacoes.acordar()
+            return total
+
+def _executar_worker_saida(sinal):
+    while True:
+        sinal.wait(SAIDA_INTERVALO)
+        sinal.clear()
+        try:
+            drenar_saida_notificacoes(db_pool.obter())
+        except Exception as e:
+            print(f'Erro no envio de notificações: {e}')
+
+def garantir_worker_saida():
+    """Cria o worker do processo se ainda não existir (ou se o processo veio de um fork)"""
+    if _worker_saida['pid'] == os.getpid():
+        return
+    with _worker_saida_lock:
+        if _worker_saida['pid'] == os.getpid():
+            return
+        sinal = threading.Event()
+        # A primeira passada entrega o que ficou pendente ou aguardando nova tentativa
+        sinal.set()
+        _worker_saida['sinal'] = sinal
+        _worker_saida['thread'] = threading.Thread(
+            target=_executar_worker_saida, args=(sinal,), name='saida-notificacoes', daemon=True
+        )
+        _worker_saida['thread'].start()
+        _worker_saida['pid'] = os.getpid()
+
+def iniciar_worker_saida():
+    """Acorda o worker do processo depois de enfileirar um evento"""
+    if NOTIFICACOES_WORKER != 'thread':
+        return
+    garantir_worker_saida()
+    # O worker espera o lock de escrita, então só lê o evento depois do commit da rota
+    _worker_saida['sinal'].set()
+
+@app.before_request
+def iniciar_worker_saida_do_processo():
+    """Sobe o worker na primeira requisição de cada processo, mesmo sem eventos novos"""
+    if NOTIFICACOES_WORKER == 'thread' and _worker_saida['pid'] != os.getpid():
+        garantir_worker_saida()
+
+def metricas_saida_notificacoes(conn):
+    """Profundidade e atraso da fila (de todos os workers) e contadores deste processo"""
+    agora = datetime.now()
+    row = conn.execute('''
+        SELECT COUNT(*) AS pendentes, MIN(criada_em) AS mais_antiga,
+               SUM(proxima_tentativa <= ?) AS vencidas, SUM(tentativas > 0) AS em_nova_tentativa
+        FROM notificacoes_saida WHERE status = 'pendente'
+    ''', (agora.isoformat(),)).fetchone()
+    descartadas = conn.execute(
+        "SELECT COUNT(*) FROM notificacoes_saida WHERE status = 'descartada'"
+    ).fetchone()[0]
+    atraso = (agora - datetime.fromisoformat(row['mais_antiga'])).total_seconds() if row['mais_antiga'] else 0
+    with _stats_saida_lock:
+        processo = dict(_stats_saida)
+    thread = _worker_saida['thread']
+    processo.update(pid=os.getpid(), modo=NOTIFICACOES_WORKER,
+                    worker_ativo=bool(thread and thread.is_alive() and _worker_saida['pid'] == os.getpid()))
+    return {
+        'pendentes': row['pendentes'],
+        'vencidas': row['vencidas'] or 0,
+        'em_nova_tentativa': row['em_nova_tentativa'] or 0,
+        'descartadas': descartadas,
+        'atraso_segundos': round(atraso, 3),
+        'processo': processo,
+    }
 
 # ==================== ROTAS DE AUTENTICAÇÃO ====================
 
@@ -428,7 +2753,6 @@ def login():
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM usuarios WHERE username = ?', (username,))
     user = cursor.fetchone()
-    conn.close()
     
     if user and check_password_hash(user['password'], password):
         session['user_id'] = user['id']
@@ -461,7 +2785,6 @@ def listar_usuarios():
         ORDER BY u.created_at DESC
     ''')
     usuarios = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return jsonify(usuarios)
 
 @app.route('/api/usuarios', methods=['POST'])
@@ -476,14 +2799,12 @@ def criar_usuario():
         # Verificar se username já existe
         cursor.execute('SELECT id FROM usuarios WHERE username = ?', (data['username'],))
         if cursor.fetchone():
-            conn.close()
             return jsonify({'success': False, 'error': 'Username já existe'}), 400
         
         # Verificar se aluno_id já tem usuário (se fornecido)
         if data.get('aluno_id'):
             cursor.execute('SELECT id FROM usuarios WHERE aluno_id = ?', (data['aluno_id'],))
             if cursor.fetchone():
-                conn.close()
                 return jsonify({'success': False, 'error': 'Este aluno já possui um login'}), 400
         
         cursor.execute('''
@@ -497,11 +2818,10 @@ def criar_usuario():
             data.get('aluno_id'),                        
         ))
         usuario_id = cursor.lastrowid
+        registrar_alteracao(conn, 'usuarios')
         conn.commit()
-        conn.close()
         return jsonify({'success': True, 'id': usuario_id}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
@@ -517,7 +2837,6 @@ def obter_usuario(usuario_id):
         WHERE u.id = ?
     ''', (usuario_id,))
     usuario = cursor.fetchone()
-    conn.close()
     
     if usuario:
         return jsonify(dict(usuario))
@@ -565,11 +2884,10 @@ def atualizar_usuario(usuario_id):
                 usuario_id
             ))
         
+        registrar_alteracao(conn, 'usuarios')
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/usuarios/<int:usuario_id>', methods=['DELETE'])
@@ -581,12 +2899,11 @@ def deletar_usuario(usuario_id):
     
     # Não permitir deletar o próprio usuário
     if usuario_id == session.get('user_id'):
-        conn.close()
         return jsonify({'success': False, 'error': 'Não é possível deletar seu próprio usuário'}), 400
     
     cursor.execute('DELETE FROM usuarios WHERE id = ?', (usuario_id,))
+    registrar_alteracao(conn, 'usuarios')
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/usuarios/alunos-sem-login', methods=['GET'])
@@ -602,7 +2919,6 @@ def listar_alunos_sem_login():
         ORDER BY a.nome_completo
     ''')
     alunos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return jsonify(alunos)
 
 @app.route('/api/logout', methods=['POST'])
@@ -624,50 +2940,78 @@ def check_auth():
 
 # ==================== ROTAS DE ALUNOS ====================
 
+# Filtros diretos aceitos em GET /api/alunos (parâmetro -> coluna)
+FILTROS_ALUNOS = {
+    'status': 'status',
+    'tipo': 'tipo',
+    'graduacao': 'graduacao_atual',
+    'graduacao_atual': 'graduacao_atual',
+    'modalidade': 'modalidade',
+    'classe': 'classe',
+    'categoria': 'categoria',
+}
+
+ALUNOS_POR_PAGINA_MAXIMO = 500
+
 @app.route('/api/alunos', methods=['GET'])
 @login_required
 def listar_alunos():
-    """Lista todos os alunos"""
+    """Lista alunos com filtros e paginação por cursor (nome_completo, id)
+    
+    Parâmetros opcionais: status, tipo, graduacao_atual, modalidade, classe,
+    categoria, ordem (asc|desc), limite e cursor. Sem "limite", retorna todos.
+    O total filtrado vai no header X-Total-Count e o próximo cursor em X-Next-Cursor.
+    """
     conn = get_db()
     cursor = conn.cursor()
     
     # Se for aluno, só retorna seu próprio registro
     if session.get('perfil') == 'aluno':
         cursor.execute('SELECT * FROM alunos WHERE id = ?', (session.get('aluno_id'),))
-    else:
-        cursor.execute('SELECT * FROM alunos ORDER BY nome_completo')
+        alunos = [enriquecer_aluno(dict(row)) for row in cursor.fetchall()]
+        return jsonify(alunos)
     
-    alunos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    where = ' WHERE 1=1'
+    params = []
     
-    # Adicionar cálculos automáticos e converter datas
-    for aluno in alunos:
-        for key, value in aluno.items():
-            if isinstance(value, datetime):
-                aluno[key] = value.isoformat()
-        
-        # Calcular idade
-        aluno['idade'] = calcular_idade(aluno.get('data_nascimento'))
-        
-        # Calcular IMC
-        aluno['imc'] = calcular_imc(aluno.get('peso'), aluno.get('altura'))
-        
-        # Determinar classe
-        aluno['classe'] = determinar_classe(aluno['idade'])
-        
-        # Determinar categoria
-        aluno['categoria'] = determinar_categoria(
-            aluno['idade'], 
-            aluno.get('peso')
-        )
-        
-        # Determinar próxima graduação se pode graduar
-        if aluno.get('pode_graduar') and not aluno.get('graduar_para'):
-            aluno['graduar_para'] = obter_proxima_graduacao(
-                aluno.get('graduacao_atual', 'Branca')
-            )
+    for parametro, coluna in FILTROS_ALUNOS.items():
+        valor = request.args.get(parametro)
+        if valor:
+            where += f' AND {coluna} = ?'
+            params.append(valor)
     
-    return jsonify(alunos)
+    descendente = request.args.get('ordem', 'asc').lower() == 'desc'
+    limite = request.args.get('limite', type=int)
+    cursor_pagina = request.args.get('cursor')
+    
+    cursor.execute('SELECT COUNT(*) AS total FROM alunos' + where, params)
+    total = cursor.fetchone()['total']
+    
+    query = 'SELECT * FROM alunos' + where
+    if cursor_pagina:
+        try:
+            nome_ultimo, id_ultimo = decodificar_cursor(cursor_pagina, 2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query += ' AND (nome_completo, id) %s (?, ?)' % ('<' if descendente else '>')
+        params += [nome_ultimo, id_ultimo]
+    
+    direcao = 'DESC' if descendente else 'ASC'
+    query += f' ORDER BY nome_completo {direcao}, id {direcao}'
+    if limite:
+        limite = max(1, min(limite, ALUNOS_POR_PAGINA_MAXIMO))
+        query += ' LIMIT ?'
+        params.append(limite)
+    
+    cursor.execute(query, params)
+    alunos = [enriquecer_aluno(dict(row)) for row in cursor.fetchall()]
+    
+    response = jsonify(alunos)
+    response.headers['X-Total-Count'] = str(total)
+    if limite and len(alunos) == limite:
+        ultimo = alunos[-1]
+        response.headers['X-Next-Cursor'] = codificar_cursor(ultimo['nome_completo'], ultimo['id'])
+    return response
 
 @app.route('/api/alunos', methods=['POST'])
 @admin_required
@@ -678,13 +3022,7 @@ def criar_aluno():
     cursor = conn.cursor()
     
     try:
-        cursor.execute('''
-            INSERT INTO alunos (nome_completo, tipo, data_nascimento, nome_responsavel,
-                              contato, data_matricula, status, observacoes,
-                              graduacao_atual, modalidade, pode_graduar, graduar_para,
-                              peso, altura)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        cursor.execute(SQL_INSERIR_ALUNO, (
             data['nome_completo'],
             data['tipo'],
             data.get('data_nascimento'),
@@ -699,13 +3037,12 @@ def criar_aluno():
             data.get('graduar_para'),
             data.get('peso'),
             data.get('altura')
-        ))
+        ) + _parametros_derivados(data.get('data_nascimento'), data.get('peso'), data.get('altura')))
+        registrar_alteracao(conn, 'alunos')
         conn.commit()
         aluno_id = cursor.lastrowid
-        conn.close()
         return jsonify({'success': True, 'id': aluno_id}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/alunos/<int:aluno_id>', methods=['GET'])
@@ -717,27 +3054,13 @@ def obter_aluno(aluno_id):
     
     # Se for aluno, só pode ver seus próprios dados
     if session.get('perfil') == 'aluno' and session.get('aluno_id') != aluno_id:
-        conn.close()
         return jsonify({'error': 'Acesso negado'}), 403
     
     cursor.execute('SELECT * FROM alunos WHERE id = ?', (aluno_id,))
     aluno = cursor.fetchone()
-    conn.close()
     
     if aluno:
-        aluno_dict = dict(aluno)
-        # Adicionar cálculos automáticos
-        aluno_dict['idade'] = calcular_idade(aluno_dict.get('data_nascimento'))
-        aluno_dict['imc'] = calcular_imc(aluno_dict.get('peso'), aluno_dict.get('altura'))
-        aluno_dict['classe'] = determinar_classe(aluno_dict['idade'])
-        aluno_dict['categoria'] = determinar_categoria(
-            aluno_dict['idade'], 
-            aluno_dict.get('peso')
-        )
-        if aluno_dict.get('pode_graduar') and not aluno_dict.get('graduar_para'):
-            aluno_dict['graduar_para'] = obter_proxima_graduacao(
-                aluno_dict.get('graduacao_atual', 'Branca')
-            )
+        aluno_dict = enriquecer_aluno(dict(aluno))
         return jsonify(aluno_dict)
     return jsonify({'error': 'Aluno não encontrado'}), 404
 
@@ -761,6 +3084,7 @@ def atualizar_aluno(aluno_id):
                 nome_responsavel = ?, contato = ?, status = ?,
                 observacoes = ?, graduacao_atual = ?, modalidade = ?,
                 pode_graduar = ?, graduar_para = ?, peso = ?, altura = ?,
+                idade = ?, imc = ?, classe = ?, categoria = ?, aniversario = ?,
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (
@@ -776,14 +3100,14 @@ def atualizar_aluno(aluno_id):
             data.get('pode_graduar', False),
             graduar_para,
             data.get('peso'),
-            data.get('altura'),
-            aluno_id
+            data.get('altura')
+        ) + _parametros_derivados(data.get('data_nascimento'), data.get('peso'), data.get('altura')) + (
+            aluno_id,
         ))
+        registrar_alteracao(conn, 'alunos')
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/alunos/<int:aluno_id>', methods=['DELETE'])
@@ -793,8 +3117,8 @@ def deletar_aluno(aluno_id):
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM alunos WHERE id = ?', (aluno_id,))
+    registrar_alteracao(conn, 'alunos')
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/alunos/importar', methods=['POST'])
@@ -808,220 +3132,84 @@ def importar_alunos():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'Nenhum arquivo selecionado'}), 400
     
-    try:
-        # Ler arquivo
-        filename = file.filename.lower()
-        file_content = file.read()
-        
-        if filename.endswith('.csv'):
-            # Ler CSV
-            try:
-                df = pd.read_csv(io.BytesIO(file_content), encoding='utf-8')
-            except UnicodeDecodeError:
-                # Tentar com encoding alternativo
-                try:
-                    df = pd.read_csv(io.BytesIO(file_content), encoding='latin-1')
-                except:
-                    df = pd.read_csv(io.BytesIO(file_content), encoding='cp1252')
-        elif filename.endswith(('.xlsx', '.xls')):
-            # Ler Excel - verificar se openpyxl está instalado
-            try:
-                import openpyxl
-                df = pd.read_excel(io.BytesIO(file_content))
-            except ImportError:
-                return jsonify({
-                    'success': False, 
-                    'error': 'Biblioteca openpyxl não instalada.\n\nSOLUÇÃO:\n1. Execute no terminal: pip install openpyxl\n2. Ou use o arquivo install_dependencies.bat\n3. Ou use arquivo CSV ao invés de Excel (.xlsx)'
-                }), 400
-            except Exception as e:
-                return jsonify({
-                    'success': False, 
-                    'error': f'Erro ao ler arquivo Excel: {str(e)}\n\nDica: Tente salvar como CSV e importar novamente.'
-                }), 400
-        else:
+    # Modo assíncrono: o arquivo é processado em segundo plano
+    if request.args.get('modo', request.form.get('modo')) == 'async':
+        if not file.filename.lower().endswith(('.csv', '.xlsx', '.xls')):
             return jsonify({'success': False, 'error': 'Formato não suportado. Use CSV ou Excel (.xlsx, .xls)'}), 400
-        
-        # Normalizar nomes das colunas
-        df.columns = df.columns.str.strip().str.lower()
-        
-        # Mapear colunas possíveis
-        col_mapping = {}
-        col_names_map = {
-            'nome': ['nome', 'nome completo', 'nome_completo', 'nomecompleto'],
-            'data_nascimento': ['data nascimento', 'data_nascimento', 'datanascimento', 'nascimento', 'data de nascimento'],
-            'tipo': ['tipo', 'categoria', 'categoria_aluno'],
-            'nome_responsavel': ['responsavel', 'nome responsavel', 'nome_responsavel', 'responsável'],
-            'contato': ['contato', 'telefone', 'whatsapp', 'celular'],
-            'data_matricula': ['data matricula', 'data_matricula', 'matricula', 'data de matrícula'],
-            'status': ['status', 'situacao', 'situação'],
-            'graduacao_atual': ['graduacao', 'graduação', 'graduacao_atual', 'faixa', 'faixa atual'],
-            'modalidade': ['modalidade'],
-            'peso': ['peso', 'peso (kg)', 'peso_kg'],
-            'altura': ['altura', 'altura (cm)', 'altura_cm'],
-            'observacoes': ['observacoes', 'observações', 'obs', 'observacao']
-        }
-        
-        for key, possible_names in col_names_map.items():
-            for col in df.columns:
-                if col in possible_names:
-                    col_mapping[key] = col
-                    break
-        
-        if 'nome' not in col_mapping:
-            return jsonify({'success': False, 'error': 'Coluna "Nome" não encontrada na planilha'}), 400
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        resultados = {
-            'sucesso': [],
-            'erros': [],
-            'total': len(df)
-        }
-        
-        # Processar cada linha
-        for index, row in df.iterrows():
-            try:
-                nome_completo = str(row[col_mapping['nome']]).strip()
-                if pd.isna(nome_completo) or nome_completo == '' or nome_completo == 'nan':
-                    resultados['erros'].append({
-                        'linha': index + 2,
-                        'nome': 'Vazio',
-                        'erro': 'Nome não pode estar vazio'
-                    })
-                    continue
-                
-                tipo = 'Criança'
-                if 'tipo' in col_mapping:
-                    tipo_val = str(row[col_mapping['tipo']]).strip().lower()
-                    if 'adulto' in tipo_val:
-                        tipo = 'Adulto'
-                
-                data_nascimento = None
-                if 'data_nascimento' in col_mapping:
-                    try:
-                        data_val = row[col_mapping['data_nascimento']]
-                        if pd.notna(data_val):
-                            if isinstance(data_val, str):
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y/%m/%d']:
-                                    try:
-                                        data_nascimento = datetime.strptime(data_val, fmt).date().isoformat()
-                                        break
-                                    except:
-                                        continue
-                            else:
-                                data_nascimento = pd.to_datetime(data_val).date().isoformat()
-                    except:
-                        pass
-                
-                nome_responsavel = None
-                if 'nome_responsavel' in col_mapping:
-                    val = row[col_mapping['nome_responsavel']]
-                    if pd.notna(val):
-                        nome_responsavel = str(val).strip()
-                
-                contato = None
-                if 'contato' in col_mapping:
-                    val = row[col_mapping['contato']]
-                    if pd.notna(val):
-                        contato = str(val).strip()
-                
-                data_matricula = datetime.now().date().isoformat()
-                if 'data_matricula' in col_mapping:
-                    try:
-                        val = row[col_mapping['data_matricula']]
-                        if pd.notna(val):
-                            if isinstance(val, str):
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                                    try:
-                                        data_matricula = datetime.strptime(val, fmt).date().isoformat()
-                                        break
-                                    except:
-                                        continue
-                            else:
-                                data_matricula = pd.to_datetime(val).date().isoformat()
-                    except:
-                        pass
-                
-                status = 'Ativo'
-                if 'status' in col_mapping:
-                    val = str(row[col_mapping['status']]).strip().lower()
-                    if 'inativo' in val:
-                        status = 'Inativo'
-                
-                graduacao_atual = 'Branca'
-                if 'graduacao_atual' in col_mapping:
-                    val = str(row[col_mapping['graduacao_atual']]).strip()
-                    graduacoes_validas = ['Branca', 'Cinza', 'Azul', 'Amarela', 'Laranja', 'Verde', 'Roxa', 'Marrom', 'Preta']
-                    if val in graduacoes_validas:
-                        graduacao_atual = val
-                
-                modalidade = None
-                if 'modalidade' in col_mapping:
-                    val = row[col_mapping['modalidade']]
-                    if pd.notna(val):
-                        modalidade = str(val).strip()
-                
-                peso = None
-                if 'peso' in col_mapping:
-                    try:
-                        val = row[col_mapping['peso']]
-                        if pd.notna(val):
-                            peso = float(val)
-                    except:
-                        pass
-                
-                altura = None
-                if 'altura' in col_mapping:
-                    try:
-                        val = row[col_mapping['altura']]
-                        if pd.notna(val):
-                            altura_cm = float(val)
-                            altura = altura_cm if altura_cm < 3 else altura_cm / 100
-                    except:
-                        pass
-                
-                observacoes = None
-                if 'observacoes' in col_mapping:
-                    val = row[col_mapping['observacoes']]
-                    if pd.notna(val):
-                        observacoes = str(val).strip()
-                
-                cursor.execute('''
-                    INSERT INTO alunos (nome_completo, tipo, data_nascimento, nome_responsavel,
-                                      contato, data_matricula, status, observacoes,
-                                      graduacao_atual, modalidade, pode_graduar, graduar_para,
-                                      peso, altura)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    nome_completo, tipo, data_nascimento, nome_responsavel,
-                    contato, data_matricula, status, observacoes,
-                    graduacao_atual, modalidade, False, None, peso, altura
-                ))
-                
-                resultados['sucesso'].append({
-                    'linha': index + 2,
-                    'nome': nome_completo
-                })
-                
-            except Exception as e:
-                resultados['erros'].append({
-                    'linha': index + 2,
-                    'nome': str(row[col_mapping['nome']]) if 'nome' in col_mapping else 'Desconhecido',
-                    'erro': str(e)
-                })
-        
-        conn.commit()
-        conn.close()
-        
+        importacao_id = iniciar_importacao(file)
         return jsonify({
             'success': True,
-            'resultados': resultados,
-            'mensagem': f"Importação concluída: {len(resultados['sucesso'])} sucesso(s), {len(resultados['erros'])} erro(s)"
-        })
-        
+            'job_id': importacao_id,
+            'status_url': f'/api/alunos/importar/{importacao_id}'
+        }), 202
+    
+    filename = file.filename.lower()
+    try:
+        conn = get_db()
+        resultados = importar_arquivo(conn, file.stream, filename)
+    except ErroImportacao as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except ImportError:
+        return jsonify({
+            'success': False, 
+            'error': 'Biblioteca openpyxl não instalada.\n\nSOLUÇÃO:\n1. Execute no terminal: pip install openpyxl\n2. Ou use o arquivo install_dependencies.bat\n3. Ou use arquivo CSV ao invés de Excel (.xlsx)'
+        }), 400
     except Exception as e:
+        if filename.endswith(('.xlsx', '.xls')):
+            return jsonify({
+                'success': False, 
+                'error': f'Erro ao ler arquivo Excel: {str(e)}\n\nDica: Tente salvar como CSV e importar novamente.'
+            }), 400
         return jsonify({'success': False, 'error': f'Erro ao processar arquivo: {str(e)}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'resultados': resultados,
+        'mensagem': f"Importação concluída: {len(resultados['sucesso'])} sucesso(s), {len(resultados['erros'])} erro(s)"
+    })
+
+@app.route('/api/alunos/importar/<job_id>', methods=['GET'])
+@admin_required
+def obter_importacao(job_id):
+    """Andamento de uma importação em segundo plano"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM importacoes WHERE id = ?', (job_id,))
+    importacao = cursor.fetchone()
+    if not importacao:
+        return jsonify({'error': 'Importação não encontrada'}), 404
+    
+    resultado = dict(importacao)
+    resultado['linhas_por_segundo'] = None
+    if importacao['iniciada_em']:
+        fim = datetime.fromisoformat(importacao['concluida_em'] or importacao['atualizada_em'])
+        segundos = (fim - datetime.fromisoformat(importacao['iniciada_em'])).total_seconds()
+        if segundos > 0:
+            resultado['linhas_por_segundo'] = round(importacao['linhas_processadas'] / segundos, 1)
+    
+    # Erros por linha, no mesmo formato do relatório da importação síncrona
+    limite_erros = request.args.get('limite_erros', 1000, type=int)
+    cursor.execute('''
+        SELECT linha, nome, erro FROM importacoes_erros
+        WHERE importacao_id = ? ORDER BY linha LIMIT ?
+    ''', (job_id, limite_erros))
+    resultado['lista_erros'] = [dict(row) for row in cursor.fetchall()]
+    return jsonify(resultado)
+
+@app.route('/api/alunos/importar/<job_id>/cancelar', methods=['POST'])
+@admin_required
+def cancelar_importacao(job_id):
+    """Pede o cancelamento de uma importação; blocos já gravados são mantidos"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE importacoes SET cancelar = 1
+        WHERE id = ? AND status IN ('Na fila', 'Processando')
+    ''', (job_id,))
+    if cursor.rowcount == 0:
+        return jsonify({'success': False, 'error': 'Importação não encontrada ou já finalizada'}), 404
+    conn.commit()
+    return jsonify({'success': True})
 
 @app.route('/api/alunos/template', methods=['GET'])
 @admin_required
@@ -1046,8 +3234,92 @@ def download_template():
         'Content-Disposition': 'attachment; filename=template_importacao_alunos.csv'
     }
 
+# ==================== EXPORTAÇÃO EM STREAMING ====================
+
+# Formatos de exportação: (mimetype, extensão)
+FORMATOS_EXPORTACAO = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Linhas lidas do cursor por vez durante a exportação
+EXPORTACAO_LINHAS_POR_BLOCO = 500
+
+def _blocos_exportacao(cursor, formato):
+    """Gera o arquivo em blocos de texto, lendo o cursor aos poucos"""
+    colunas = [descricao[0] for descricao in cursor.description]
+    buffer = StringIO()
+    escritor = csv.writer(buffer) if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(colunas)
+    while True:
+        linhas = cursor.fetchmany(EXPORTACAO_LINHAS_POR_BLOCO)
+        if not linhas:
+            break
+        for linha in linhas:
+            if escritor:
+                escritor.writerow(linha)
+            else:
+                buffer.write(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False, default=str))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _comprimir_gzip(blocos):
+    """Comprime os blocos com gzip à medida que são gerados"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: cabeçalho gzip
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+def exportar_consulta(conn, query, params, formato, nome_arquivo):
+    """Resposta em streaming (NDJSON ou CSV) com memória constante, comprimida se o cliente aceitar gzip"""
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    blocos = _blocos_exportacao(cursor, formato)
+    
+    mimetype, extensao = FORMATOS_EXPORTACAO[formato]
+    headers = {
+        'Content-Disposition': f'attachment; filename={nome_arquivo}.{extensao}',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        blocos = _comprimir_gzip(blocos)
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        blocos = (bloco.encode('utf-8') for bloco in blocos)
+    # O contexto da requisição (e a conexão do pool) vive até o fim do streaming
+    return app.response_class(stream_with_context(blocos), mimetype=f'{mimetype}; charset=utf-8', headers=headers)
+
 # ==================== ROTAS DE PRESENÇA ====================
 
+# Limite de itens por chamada em lote (uma turma cabe com folga)
+PRESENCAS_POR_LOTE_MAXIMO = 1000
+
+# Alunos ativos da tela de chamada, em memória; refeita quando a versão de alunos muda
+_lista_chamada = {'versao': None, 'alunos': ()}
+_lista_chamada_lock = threading.Lock()
+
+def lista_chamada(conn):
+    """Alunos ativos como tuplas (id, nome_completo, graduacao_atual, tipo), em ordem de nome"""
+    versao = versoes_tabelas(conn).get('alunos')
+    if _lista_chamada['versao'] != versao:
+        with _lista_chamada_lock:
+            if _lista_chamada['versao'] != versao:
+                _lista_chamada['alunos'] = tuple(
+                    tuple(row) for row in conn.execute(
+                        'SELECT id, nome_completo, graduacao_atual, tipo FROM alunos '
+                        'WHERE status = "Ativo" ORDER BY nome_completo'
+                    )
+                )
+                _lista_chamada['versao'] = versao
+    return _lista_chamada['alunos']
+
 @app.route('/api/presencas', methods=['GET'])
 @login_required
 def listar_presencas():
@@ -1059,7 +3331,14 @@ def listar_presencas():
     conn = get_db()
     cursor = conn.cursor()
     
-    query = 'SELECT p.*, a.nome_completo FROM presencas p JOIN alunos a ON p.aluno_id = a.id WHERE 1=1'
+    # Anos arquivados entram na consulta só quando o período chega até eles; sem data
+    # inicial, só os mais recentes: o histórico antigo exige o período explícito
+    inicio_arquivo = data_inicio or f'{datetime.now().year - ARQUIVO_ANOS_SEM_PERIODO}-01-01'
+    try:
+        presencas = tabela_com_arquivo(conn, 'presencas', inicio_arquivo, data_fim)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    query = f'SELECT p.*, a.nome_completo FROM {presencas} p JOIN alunos a ON p.aluno_id = a.id WHERE 1=1'
     params = []
     
     # Se for aluno, só vê suas presenças
@@ -1079,9 +3358,14 @@ def listar_presencas():
     
     query += ' ORDER BY p.data DESC'
     
+    formato = request.args.get('format')
+    if formato:
+        if formato not in FORMATOS_EXPORTACAO:
+            return jsonify({'success': False, 'error': 'Formato inválido. Use ndjson ou csv'}), 400
+        return exportar_consulta(conn, query, params, formato, 'presencas')
+    
     cursor.execute(query, params)
     presencas = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
     return jsonify(presencas)
 
@@ -1094,51 +3378,288 @@ def registrar_presenca():
     cursor = conn.cursor()
     
     try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO presencas (aluno_id, data, presente, justificativa)
-            VALUES (?, ?, ?, ?)
-        ''', (
+        versao = registrar_alteracao(conn, 'presencas')['presencas']
+        cursor.execute(SQL_GRAVAR_PRESENCA, (
             data['aluno_id'],
             data['data'],
             data['presente'],
-            data.get('justificativa')
+            data.get('justificativa'),
+            versao,
+            datetime.now().isoformat(timespec='milliseconds')
         ))
         conn.commit()
-        conn.close()
         return jsonify({'success': True}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+# Gravação de presença feita online: sempre vence e carimba versão e horário
+SQL_GRAVAR_PRESENCA = '''
+    INSERT INTO presencas (aluno_id, data, presente, justificativa, versao, alterado_em)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(aluno_id, data) DO UPDATE SET
+        presente = excluded.presente,
+        justificativa = excluded.justificativa,
+        versao = excluded.versao,
+        alterado_em = excluded.alterado_em
+'''
+
+# Alteração vinda da sincronização: só vence se for mais recente que a do servidor
+SQL_SINCRONIZAR_PRESENCA = SQL_GRAVAR_PRESENCA + '''
+    WHERE presencas.alterado_em IS NULL OR presencas.alterado_em < excluded.alterado_em
+'''
+
+def _alunos_existentes(cursor, aluno_ids):
+    """Quais dos ids existem, com uma única consulta pela chave primária"""
+    aluno_ids = list(aluno_ids)
+    if not aluno_ids:
+        return set()
+    marcadores = ', '.join('?' * len(aluno_ids))
+    cursor.execute(f'SELECT id FROM alunos WHERE id IN ({marcadores})', aluno_ids)
+    return {row['id'] for row in cursor.fetchall()}
+
+def _horario_alteracao(valor, agora):
+    """Horário (ISO, hora local) informado pelo cliente; None se inválido
+    
+    Horários no futuro são trazidos para agora, para um relógio adiantado no
+    tablet não vencer todas as alterações seguintes.
+    """
+    try:
+        horario = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if horario.tzinfo is not None:
+        horario = horario.astimezone().replace(tzinfo=None)
+    return min(horario, agora).isoformat(timespec='milliseconds')
+
+@app.route('/api/presencas/lote', methods=['POST'])
+@admin_required
+def registrar_presencas_lote():
+    """Registra a chamada de uma turma inteira em uma única transação
+    
+    Corpo: {"data": "AAAA-MM-DD", "presencas": [{"aluno_id", "presente", "justificativa"}, ...]}.
+    Retorna o resultado de cada item na ordem enviada.
+    """
+    data = request.json or {}
+    data_presenca = data.get('data')
+    itens = data.get('presencas')
+    
+    try:
+        datetime.strptime(data_presenca or '', '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Data inválida. Use o formato AAAA-MM-DD'}), 400
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'success': False, 'error': 'Informe a lista de presenças'}), 400
+    if len(itens) > PRESENCAS_POR_LOTE_MAXIMO:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo de {PRESENCAS_POR_LOTE_MAXIMO} presenças por lote'
+        }), 400
+    
+    resultados = []
+    validos = {}
+    for indice, item in enumerate(itens):
+        aluno_id = item.get('aluno_id') if isinstance(item, dict) else None
+        if not isinstance(aluno_id, int) or isinstance(aluno_id, bool) or 'presente' not in item:
+            resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': False,
+                               'error': 'Informe aluno_id e presente'})
+        elif aluno_id in validos:
+            resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': False,
+                               'error': 'Aluno repetido no lote'})
+        else:
+            validos[aluno_id] = indice
+            resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': True})
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Uma única consulta pela chave primária confere todos os alunos do lote
+    existentes = _alunos_existentes(cursor, validos)
+    
+    parametros = []
+    for aluno_id, indice in validos.items():
+        if aluno_id not in existentes:
+            resultados[indice].update(success=False, error='Aluno não encontrado')
+            continue
+        item = itens[indice]
+        parametros.append((aluno_id, data_presenca, bool(item['presente']), item.get('justificativa')))
+    
+    try:
+        # Um lote todo rejeitado não grava nada e não invalida os caches de presença
+        if parametros:
+            versao = registrar_alteracao(conn, 'presencas')['presencas']
+            alterado_em = datetime.now().isoformat(timespec='milliseconds')
+            cursor.executemany(SQL_GRAVAR_PRESENCA, [parametro + (versao, alterado_em) for parametro in parametros])
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'registradas': len(parametros),
+        'rejeitadas': len(itens) - len(parametros),
+        'resultados': resultados
+    })
+
+@app.route('/api/presencas/sync', methods=['GET'])
+@admin_required
+def baixar_sincronizacao_presencas():
+    """Lista de chamada e presenças do dia para uso offline, com a versão atual
+    
+    A versão devolvida deve ser enviada de volta no POST da sincronização.
+    """
+    data_presenca = request.args.get('data', datetime.now().date().isoformat())
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Versão e presenças lidas no mesmo snapshot
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN')
+    try:
+        versao = versoes_tabelas(conn).get('presencas')
+        alunos = lista_chamada(conn)
+        cursor.execute('''
+            SELECT aluno_id, presente, justificativa, alterado_em
+            FROM presencas WHERE data = ?
+        ''', (data_presenca,))
+        presencas = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.rollback()
+    
+    return jsonify({
+        'versao': versao,
+        'data': data_presenca,
+        'alunos': [
+            {'id': aluno_id, 'nome_completo': nome, 'graduacao_atual': graduacao, 'tipo': tipo}
+            for aluno_id, nome, graduacao, tipo in alunos
+        ],
+        'presencas': presencas
+    })
+
+@app.route('/api/presencas/sync', methods=['POST'])
+@admin_required
+def enviar_sincronizacao_presencas():
+    """Aplica as alterações feitas offline com a regra "a última alteração vence"
+    
+    Corpo: {"data", "versao" (recebida no GET), "alteracoes": [{"aluno_id", "presente",
+    "justificativa", "alterado_em"}, ...]}. Responde com a nova versão e só as presenças
+    do dia em que o servidor difere do que o tablet tem.
+    """
+    data = request.json or {}
+    data_presenca = data.get('data')
+    versao_cliente = data.get('versao')
+    alteracoes = data.get('alteracoes')
+    
+    try:
+        datetime.strptime(data_presenca or '', '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Data inválida. Use o formato AAAA-MM-DD'}), 400
+    if not isinstance(versao_cliente, int) or isinstance(versao_cliente, bool):
+        return jsonify({'success': False, 'error': 'Informe a versão recebida na sincronização'}), 400
+    if not isinstance(alteracoes, list):
+        return jsonify({'success': False, 'error': 'Informe a lista de alterações'}), 400
+    if len(alteracoes) > PRESENCAS_POR_LOTE_MAXIMO:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo de {PRESENCAS_POR_LOTE_MAXIMO} alterações por sincronização'
+        }), 400
+    
+    agora = datetime.now()
+    rejeitadas = []
+    validas = []
+    for indice, item in enumerate(alteracoes):
+        aluno_id = item.get('aluno_id') if isinstance(item, dict) else None
+        if not isinstance(aluno_id, int) or isinstance(aluno_id, bool) or 'presente' not in item:
+            rejeitadas.append({'indice': indice, 'aluno_id': aluno_id, 'error': 'Informe aluno_id e presente'})
+            continue
+        alterado_em = _horario_alteracao(item.get('alterado_em'), agora)
+        if alterado_em is None:
+            rejeitadas.append({'indice': indice, 'aluno_id': aluno_id, 'error': 'Horário da alteração inválido'})
+            continue
+        validas.append((indice, aluno_id, bool(item['presente']), item.get('justificativa'), alterado_em))
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existentes = _alunos_existentes(cursor, {aluno_id for _, aluno_id, _, _, _ in validas})
+        for indice, aluno_id, _, _, _ in validas:
+            if aluno_id not in existentes:
+                rejeitadas.append({'indice': indice, 'aluno_id': aluno_id, 'error': 'Aluno não encontrado'})
+        validas = [alteracao for alteracao in validas if alteracao[1] in existentes]
+        
+        if validas:
+            versao = registrar_alteracao(conn, 'presencas')['presencas']
+        else:
+            versao = versoes_tabelas(conn)['presencas']
+        # Em ordem de horário: se o mesmo aluno vier repetido, a última alteração fica
+        validas.sort(key=lambda alteracao: alteracao[4])
+        cursor.executemany(SQL_SINCRONIZAR_PRESENCA, [
+            (aluno_id, data_presenca, presente, justificativa, versao, alterado_em)
+            for _, aluno_id, presente, justificativa, alterado_em in validas
+        ])
+        
+        # O tablet já tem o que ele mesmo enviou e venceu; devolve o resto que mudou
+        cursor.execute('''
+            SELECT aluno_id, presente, justificativa, alterado_em, versao
+            FROM presencas WHERE data = ?
+        ''', (data_presenca,))
+        enviadas = {aluno_id: alterado_em for _, aluno_id, _, _, alterado_em in validas}
+        alteradas = []
+        aplicadas = 0
+        for row in cursor.fetchall():
+            venceu = row['versao'] == versao and enviadas.get(row['aluno_id']) == row['alterado_em']
+            if venceu:
+                aplicadas += 1
+            elif row['versao'] > versao_cliente or row['aluno_id'] in enviadas:
+                alteradas.append({campo: row[campo] for campo in ('aluno_id', 'presente', 'justificativa', 'alterado_em')})
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'versao': versao,
+        'aplicadas': aplicadas,
+        'rejeitadas': sorted(rejeitadas, key=lambda rejeitada: rejeitada['indice']),
+        'alteradas': alteradas
+    })
+
 @app.route('/api/presencas/hoje', methods=['GET'])
 @admin_required
+@cache_resposta('alunos', 'presencas')
 def presencas_hoje():
     """Lista alunos para registro de presença"""
     data_selecionada = request.args.get('data', datetime.now().date().isoformat())
     conn = get_db()
     cursor = conn.cursor()
     
-    # Busca todos os alunos ativos
-    cursor.execute('SELECT * FROM alunos WHERE status = "Ativo" ORDER BY nome_completo')
-    alunos = cursor.fetchall()
-    
-    # Busca presenças da data selecionada
-    cursor.execute('SELECT * FROM presencas WHERE data = ?', (data_selecionada,))
-    presencas_dia = {row['aluno_id']: dict(row) for row in cursor.fetchall()}
+    # Só as colunas que a tela de chamada mostra
+    cursor.execute('SELECT aluno_id, presente, justificativa FROM presencas WHERE data = ?', (data_selecionada,))
+    presencas_dia = {row['aluno_id']: {'presente': row['presente'], 'justificativa': row['justificativa']}
+                     for row in cursor.fetchall()}
     
     resultado = []
-    for aluno in alunos:
-        aluno_dict = dict(aluno)
-        aluno_dict['presenca_hoje'] = presencas_dia.get(aluno['id'])
-        resultado.append(aluno_dict)
+    for aluno_id, nome_completo, graduacao_atual, tipo in lista_chamada(conn):
+        resultado.append({
+            'id': aluno_id,
+            'nome_completo': nome_completo,
+            'graduacao_atual': graduacao_atual,
+            'tipo': tipo,
+            'presenca_hoje': presencas_dia.get(aluno_id)
+        })
     
-    conn.close()
     return jsonify(resultado)
 
 # ==================== ROTAS DE DASHBOARD ====================
 
 @app.route('/api/dashboard/frequencia', methods=['GET'])
 @login_required
+@cache_resposta('alunos', 'presencas')
 def dashboard_frequencia():
     """Estatísticas de frequência"""
     data_inicio = request.args.get('data_inicio')
@@ -1153,13 +3674,19 @@ def dashboard_frequencia():
     conn = get_db()
     cursor = conn.cursor()
     
+    # Soma os resumos diários do período; o custo depende só do tamanho do período
     query = '''
         SELECT a.id, a.nome_completo, a.tipo,
-               COUNT(p.id) as total_registros,
-               SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END) as total_presentes,
-               SUM(CASE WHEN p.presente = 0 THEN 1 ELSE 0 END) as total_ausentes
+               r.total as total_registros,
+               r.presentes as total_presentes,
+               r.total - r.presentes as total_ausentes
         FROM alunos a
-        LEFT JOIN presencas p ON a.id = p.aluno_id AND p.data BETWEEN ? AND ?
+        LEFT JOIN (
+            SELECT aluno_id, SUM(total) as total, SUM(presentes) as presentes
+            FROM presencas_resumo_aluno
+            WHERE data BETWEEN ? AND ?
+            GROUP BY aluno_id
+        ) r ON r.aluno_id = a.id
         WHERE a.status = "Ativo"
     '''
     params = [data_inicio, data_fim]
@@ -1172,7 +3699,7 @@ def dashboard_frequencia():
         query += ' AND a.id = ?'
         params.append(session.get('aluno_id'))
     
-    query += ' GROUP BY a.id ORDER BY total_presentes DESC'
+    query += ' ORDER BY total_presentes DESC, a.id'
     
     cursor.execute(query, params)
     resultados = cursor.fetchall()
@@ -1193,11 +3720,11 @@ def dashboard_frequencia():
             'frequencia_percentual': round(frequencia, 2)
         })
     
-    conn.close()
     return jsonify(dados)
 
 @app.route('/api/dashboard/evolucao', methods=['GET'])
 @login_required
+@cache_resposta('presencas')
 def dashboard_evolucao():
     """Evolução de frequência ao longo do tempo"""
     aluno_id = request.args.get('aluno_id', type=int)
@@ -1210,25 +3737,28 @@ def dashboard_evolucao():
         data_fim = datetime.now().date().isoformat()
     
     conn = get_db()
-    cursor = conn.cursor()
-    
-    query = '''
-        SELECT DATE(p.data) as data_dia,
-               COUNT(*) as total,
-               SUM(CASE WHEN p.presente = 1 THEN 1 ELSE 0 END) as presentes
-        FROM presencas p
-        WHERE p.data BETWEEN ? AND ?
-    '''
-    params = [data_inicio, data_fim]
-    
-    if aluno_id:
-        query += ' AND p.aluno_id = ?'
-        params.append(aluno_id)
-    elif session.get('perfil') == 'aluno':
-        query += ' AND p.aluno_id = ?'
-        params.append(session.get('aluno_id'))
+    cursor = conn.cursor()
+    
+    if not aluno_id and session.get('perfil') == 'aluno':
+        aluno_id = session.get('aluno_id')
     
-    query += ' GROUP BY DATE(p.data) ORDER BY data_dia'
+    # Lê os resumos diários em vez de agrupar as presenças a cada requisição
+    if aluno_id:
+        query = '''
+            SELECT data as data_dia, total, presentes
+            FROM presencas_resumo_aluno
+            WHERE aluno_id = ? AND data BETWEEN ? AND ?
+            ORDER BY data
+        '''
+        params = [aluno_id, data_inicio, data_fim]
+    else:
+        query = '''
+            SELECT data as data_dia, total, presentes
+            FROM presencas_resumo_dia
+            WHERE data BETWEEN ? AND ?
+            ORDER BY data
+        '''
+        params = [data_inicio, data_fim]
     
     cursor.execute(query, params)
     resultados = cursor.fetchall()
@@ -1246,60 +3776,110 @@ def dashboard_evolucao():
             'total': total
         })
     
-    conn.close()
     return jsonify(dados)
 
 # ==================== ROTAS DE AVALIAÇÕES ====================
 
+# Limite de avaliações por página e chaves de ordenação (coluna, direção padrão)
+AVALIACOES_POR_PAGINA_MAXIMO = 500
+ORDENACOES_AVALIACOES = {
+    'data': ('av.data_avaliacao', 'desc'),
+    'media': ('av.media', 'asc'),
+}
+
 @app.route('/api/avaliacoes', methods=['GET'])
 @login_required
 def listar_avaliacoes():
-    """Lista avaliações com controle de acesso por perfil"""
+    """Lista avaliações com controle de acesso por perfil
+    
+    Parâmetros opcionais: aluno_id, data_inicio, data_fim, media_min,
+    ordenar (data|media), ordem (asc|desc), limite e cursor. Sem "limite",
+    retorna todas. Ordenando por média, avaliações sem nota ficam de fora.
+    O total filtrado vai no header X-Total-Count e o próximo cursor em X-Next-Cursor.
+    """
     aluno_id = request.args.get('aluno_id', type=int)
     incluir_nao_liberadas = request.args.get('incluir_nao_liberadas', 'false').lower() == 'true'
     
     conn = get_db()
     cursor = conn.cursor()
     
-    query = 'SELECT av.*, a.nome_completo FROM avaliacoes av JOIN alunos a ON av.aluno_id = a.id WHERE 1=1'
+    where = ' WHERE 1=1'
     params = []
     
     # Controle de acesso baseado em perfil
     if session.get('perfil') == 'aluno':
         # Aluno só vê avaliações liberadas do seu próprio aluno_id
-        query += ' AND av.aluno_id = ? AND av.status = "Liberada"'
+        where += ' AND av.aluno_id = ? AND av.status = "Liberada"'
         params.append(session.get('aluno_id'))
     elif session.get('perfil') == 'admin':
         # Admin vê todas, mas pode filtrar
         if aluno_id:
-            query += ' AND av.aluno_id = ?'
+            where += ' AND av.aluno_id = ?'
             params.append(aluno_id)
         if not incluir_nao_liberadas:
             # Por padrão, admin também pode ver não liberadas, mas pode filtrar
             pass
     else:
         # Outros perfis não têm acesso
-        conn.close()
         return jsonify({'error': 'Acesso negado'}), 403
     
-    query += ' ORDER BY av.data_avaliacao DESC'
+    ordenar = request.args.get('ordenar', 'data')
+    if ordenar not in ORDENACOES_AVALIACOES:
+        return jsonify({'error': 'Ordenação inválida. Use data ou media'}), 400
+    coluna, ordem_padrao = ORDENACOES_AVALIACOES[ordenar]
+    descendente = request.args.get('ordem', ordem_padrao).lower() == 'desc'
+    
+    data_inicio = request.args.get('data_inicio')
+    data_fim = request.args.get('data_fim')
+    media_min = request.args.get('media_min', type=float)
+    if data_inicio:
+        where += ' AND av.data_avaliacao >= ?'
+        params.append(data_inicio)
+    if data_fim:
+        where += ' AND av.data_avaliacao <= ?'
+        params.append(data_fim)
+    if media_min is not None:
+        where += ' AND av.media >= ?'
+        params.append(media_min)
+    elif ordenar == 'media':
+        where += ' AND av.media IS NOT NULL'
+    
+    limite = request.args.get('limite', type=int)
+    cursor_pagina = request.args.get('cursor')
+    
+    cursor.execute('SELECT COUNT(*) AS total FROM avaliacoes av' + where, params)
+    total = cursor.fetchone()['total']
+    
+    query = 'SELECT av.*, a.nome_completo FROM avaliacoes av JOIN alunos a ON av.aluno_id = a.id' + where
+    if cursor_pagina:
+        try:
+            valor_ultimo, id_ultimo = decodificar_cursor(cursor_pagina, 2)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query += f' AND ({coluna}, av.id) %s (?, ?)' % ('<' if descendente else '>')
+        params += [valor_ultimo, id_ultimo]
+    
+    direcao = 'DESC' if descendente else 'ASC'
+    query += f' ORDER BY {coluna} {direcao}, av.id {direcao}'
+    if limite:
+        limite = max(1, min(limite, AVALIACOES_POR_PAGINA_MAXIMO))
+        query += ' LIMIT ?'
+        params.append(limite)
     
     cursor.execute(query, params)
     avaliacoes = [dict(row) for row in cursor.fetchall()]
-    
-    # Calcular média/score
     for av in avaliacoes:
-        notas = [
-            av.get('disciplina'),
-            av.get('tecnica'),
-            av.get('participacao'),
-            av.get('respeito_comportamento')
-        ]
-        notas_validas = [n for n in notas if n is not None]
-        av['media'] = round(sum(notas_validas) / len(notas_validas), 2) if notas_validas else None
+        # Lida do índice, uma média sem casas decimais pode vir como inteiro
+        if av['media'] is not None:
+            av['media'] = float(av['media'])
     
-    conn.close()
-    return jsonify(avaliacoes)
+    response = jsonify(avaliacoes)
+    response.headers['X-Total-Count'] = str(total)
+    if limite and len(avaliacoes) == limite:
+        ultima = avaliacoes[-1]
+        chave = 'media' if ordenar == 'media' else 'data_avaliacao'
+        response.headers['X-Next-Cursor'] = codificar_cursor(ultima[chave], ultima['id'])
+    return response
 
 @app.route('/api/avaliacoes', methods=['POST'])
 @admin_required
@@ -1326,11 +3906,10 @@ def criar_avaliacao():
             status
         ))
         avaliacao_id = cursor.lastrowid
+        registrar_alteracao(conn, 'avaliacoes')
         conn.commit()
-        conn.close()
         return jsonify({'success': True, 'id': avaliacao_id}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/avaliacoes/<int:avaliacao_id>', methods=['PUT'])
@@ -1341,12 +3920,17 @@ def atualizar_avaliacao(avaliacao_id):
     conn = get_db()
     cursor = conn.cursor()
     
+    # Status lido já com o lock de escrita, como em liberar_avaliacoes_lote
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        status_anterior = None
         cursor.execute('SELECT status, aluno_id FROM avaliacoes WHERE id = ?', (avaliacao_id,))
         av_antiga = cursor.fetchone()
-        if av_antiga:
-            status_anterior = av_antiga['status']
+        if not av_antiga:
+            conn.rollback()
+            return jsonify({'success': False, 'error': 'Avaliação não encontrada'}), 404
+        status_anterior = av_antiga['status']
         
         novo_status = data.get('status', status_anterior)
         data_liberacao = None
@@ -1354,20 +3938,11 @@ def atualizar_avaliacao(avaliacao_id):
         # Se mudou para "Liberada", registrar data de liberação e criar notificação
         if novo_status == 'Liberada' and status_anterior != 'Liberada':
             data_liberacao = datetime.now().date().isoformat()
-            aluno_id = av_antiga['aluno_id'] if av_antiga else data.get('aluno_id')
+            aluno_id = av_antiga['aluno_id']
             
-            # Buscar usuário associado ao aluno
-            cursor.execute('SELECT id FROM usuarios WHERE aluno_id = ?', (aluno_id,))
-            usuario = cursor.fetchone()
-            if usuario:
-                criar_notificacao(
-                    usuario_id=usuario['id'],
-                    aluno_id=aluno_id,
-                    tipo='avaliacao_liberada',
-                    titulo='Nova Avaliação Liberada',
-                    mensagem=f'Uma nova avaliação foi liberada para visualização.',
-                    link=f'/avaliacoes'
-                )
+            # O usuário do aluno é resolvido pelo worker da fila; o evento entra na transação do UPDATE
+            if aluno_id is not None:
+                enfileirar_notificacao(cursor, f'aluno:{aluno_id}', aluno_id, *NOTIFICACAO_AVALIACAO_LIBERADA)
         
         cursor.execute('''
             UPDATE avaliacoes SET
@@ -1387,11 +3962,11 @@ def atualizar_avaliacao(avaliacao_id):
             data_liberacao,
             avaliacao_id
         ))
+        registrar_alteracao(conn, 'avaliacoes')
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/avaliacoes/<int:avaliacao_id>/liberar', methods=['POST'])
@@ -1405,7 +3980,6 @@ def liberar_avaliacao(avaliacao_id):
         cursor.execute('SELECT aluno_id FROM avaliacoes WHERE id = ?', (avaliacao_id,))
         avaliacao = cursor.fetchone()
         if not avaliacao:
-            conn.close()
             return jsonify({'success': False, 'error': 'Avaliação não encontrada'}), 404
         
         aluno_id = avaliacao['aluno_id']
@@ -1419,26 +3993,326 @@ def liberar_avaliacao(avaliacao_id):
             WHERE id = ?
         ''', (data_liberacao, avaliacao_id))
         
-        # Criar notificação para o aluno/responsável
-        cursor.execute('SELECT id FROM usuarios WHERE aluno_id = ?', (aluno_id,))
-        usuario = cursor.fetchone()
-        if usuario:
-            criar_notificacao(
-                usuario_id=usuario['id'],
-                aluno_id=aluno_id,
-                tipo='avaliacao_liberada',
-                titulo='Nova Avaliação Liberada',
-                mensagem='Uma nova avaliação foi liberada para visualização.',
-                link='/avaliacoes'
-            )
+        # Notificar o aluno/responsável (entregue pela fila de saída)
+        enfileirar_notificacao(cursor, f'aluno:{aluno_id}', aluno_id, *NOTIFICACAO_AVALIACAO_LIBERADA)
         
+        registrar_alteracao(conn, 'avaliacoes')
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+# Limite de avaliações por chamada em lote
+AVALIACOES_POR_LOTE_MAXIMO = 1000
+
+# Notificação enviada ao aluno/responsável quando uma avaliação é liberada: (tipo, titulo, mensagem, link)
+NOTIFICACAO_AVALIACAO_LIBERADA = ('avaliacao_liberada', 'Nova Avaliação Liberada',
+                                  'Uma nova avaliação foi liberada para visualização.', '/avaliacoes')
+
+@app.route('/api/avaliacoes/lote', methods=['POST'])
+@admin_required
+def criar_avaliacoes_lote():
+    """Cria as avaliações de uma turma inteira em uma única transação
+    
+    Corpo: {"data_avaliacao": "AAAA-MM-DD", "status": "Rascunho"|"Liberada",
+    "avaliacoes": [{"aluno_id", "disciplina", "tecnica", "participacao",
+    "respeito_comportamento", "observacoes"}, ...]}. Data e status podem ser
+    informados por item. Retorna o resultado de cada item na ordem enviada.
+    """
+    data = request.json or {}
+    itens = data.get('avaliacoes')
+    
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'success': False, 'error': 'Informe a lista de avaliações'}), 400
+    if len(itens) > AVALIACOES_POR_LOTE_MAXIMO:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo de {AVALIACOES_POR_LOTE_MAXIMO} avaliações por lote'
+        }), 400
+    
+    resultados = []
+    validos = []
+    for indice, item in enumerate(itens):
+        aluno_id = item.get('aluno_id') if isinstance(item, dict) else None
+        if not isinstance(aluno_id, int) or isinstance(aluno_id, bool):
+            resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': False,
+                               'error': 'Informe aluno_id'})
+            continue
+        data_avaliacao = item.get('data_avaliacao', data.get('data_avaliacao'))
+        try:
+            datetime.strptime(data_avaliacao or '', '%Y-%m-%d')
+        except (TypeError, ValueError):
+            resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': False,
+                               'error': 'Data inválida. Use o formato AAAA-MM-DD'})
+            continue
+        validos.append(indice)
+        resultados.append({'indice': indice, 'aluno_id': aluno_id, 'success': True})
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Uma consulta para todos os alunos do lote
+    existentes = _alunos_existentes(cursor, {itens[indice]['aluno_id'] for indice in validos})
+    hoje = datetime.now().date().isoformat()
+    
+    try:
+        enfileiradas = 0
+        for indice in validos:
+            item = itens[indice]
+            aluno_id = item['aluno_id']
+            if aluno_id not in existentes:
+                resultados[indice].update(success=False, error='Aluno não encontrado')
+                continue
+            status = item.get('status', data.get('status', 'Rascunho'))
+            liberada = status == 'Liberada'
+            cursor.execute('''
+                INSERT INTO avaliacoes (aluno_id, data_avaliacao, disciplina, tecnica,
+                                      participacao, respeito_comportamento, observacoes, status,
+                                      data_liberacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                aluno_id,
+                item.get('data_avaliacao', data.get('data_avaliacao')),
+                item.get('disciplina'),
+                item.get('tecnica'),
+                item.get('participacao'),
+                item.get('respeito_comportamento'),
+                item.get('observacoes'),
+                status,
+                hoje if liberada else None
+            ))
+            resultados[indice]['id'] = cursor.lastrowid
+            if liberada:
+                # Pela fila de saída, como o PUT de uma avaliação, na mesma transação do INSERT
+                enfileirar_notificacao(cursor, f'aluno:{aluno_id}', aluno_id, *NOTIFICACAO_AVALIACAO_LIBERADA)
+                enfileiradas += 1
+        registrar_alteracao(conn, 'avaliacoes')
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    criadas = sum(1 for resultado in resultados if resultado['success'])
+    return jsonify({
+        'success': True,
+        'criadas': criadas,
+        'rejeitadas': len(itens) - criadas,
+        'notificacoes': enfileiradas,
+        'resultados': resultados
+    }), 201
+
+@app.route('/api/avaliacoes/liberar-lote', methods=['POST'])
+@admin_required
+def liberar_avaliacoes_lote():
+    """Libera várias avaliações em uma única transação e notifica os alunos
+    
+    Corpo: {"ids": [1, 2, ...]}. Avaliações já liberadas não geram nova notificação.
+    Retorna o resultado de cada id na ordem enviada.
+    """
+    data = request.json or {}
+    ids = data.get('ids')
+    
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'success': False, 'error': 'Informe a lista de ids'}), 400
+    if len(ids) > AVALIACOES_POR_LOTE_MAXIMO:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo de {AVALIACOES_POR_LOTE_MAXIMO} avaliações por lote'
+        }), 400
+    if not all(isinstance(avaliacao_id, int) and not isinstance(avaliacao_id, bool) for avaliacao_id in ids):
+        return jsonify({'success': False, 'error': 'Os ids devem ser números inteiros'}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    unicos = list(dict.fromkeys(ids))
+    marcadores = ', '.join('?' * len(unicos))
+    resultados = []
+    liberar = {}
+    # O lock de escrita vem antes da leitura do status: dois lotes (ou um PUT) ao mesmo
+    # tempo não veem a mesma avaliação como pendente e não a notificam duas vezes
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute(f'SELECT id, aluno_id, status FROM avaliacoes WHERE id IN ({marcadores})', unicos)
+        avaliacoes = {row['id']: row for row in cursor.fetchall()}
+        
+        for avaliacao_id in ids:
+            avaliacao = avaliacoes.get(avaliacao_id)
+            if not avaliacao:
+                resultados.append({'id': avaliacao_id, 'success': False, 'error': 'Avaliação não encontrada'})
+            elif avaliacao['status'] == 'Liberada' or avaliacao_id in liberar:
+                resultados.append({'id': avaliacao_id, 'success': True, 'liberada': False})
+            else:
+                liberar[avaliacao_id] = avaliacao['aluno_id']
+                resultados.append({'id': avaliacao_id, 'success': True, 'liberada': True})
+        
+        if liberar:
+            marcadores = ', '.join('?' * len(liberar))
+            cursor.execute(f'''
+                UPDATE avaliacoes SET
+                    status = "Liberada",
+                    data_liberacao = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({marcadores})
+            ''', [datetime.now().date().isoformat()] + list(liberar))
+            # Pela fila de saída: um evento por avaliação liberada, na mesma transação do UPDATE
+            for aluno_id in liberar.values():
+                enfileirar_notificacao(cursor, f'aluno:{aluno_id}', aluno_id, *NOTIFICACAO_AVALIACAO_LIBERADA)
+            registrar_alteracao(conn, 'avaliacoes')
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'liberadas': len(liberar),
+        'notificacoes': len(liberar),
+        'resultados': resultados
+    })
+
+# ==================== TENDÊNCIAS DAS AVALIAÇÕES ====================
+
+CRITERIOS_AVALIACAO = ('disciplina', 'tecnica', 'participacao', 'respeito_comportamento')
+
+# Média móvel sobre as últimas N avaliações de cada aluno
+TENDENCIA_JANELA = 3
+
+# Resultado do cálculo em memória; refeito quando avaliações ou alunos mudam
+_tendencias = {'versoes': None, 'resumo': None, 'series': None}
+_tendencias_lock = threading.Lock()
+
+def calcular_tendencias(conn, janela=TENDENCIA_JANELA):
+    """Tendência de cada aluno em cada critério, para a academia inteira de uma vez
+    
+    Retorna (resumo, series): resumo é um DataFrame com uma linha por aluno e, por
+    critério, a última nota, a média móvel atual, a inclinação (pontos por mês,
+    mínimos quadrados sobre todas as avaliações) e o percentil da média móvel
+    dentro da classe; series tem uma linha por avaliação com as médias móveis.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    colunas = ', '.join(f'av.{criterio}' for criterio in CRITERIOS_AVALIACAO)
+    series = pd.read_sql_query(f'''
+        SELECT av.aluno_id, av.id, av.data_avaliacao, {colunas}, a.nome_completo, a.classe
+        FROM avaliacoes av JOIN alunos a ON av.aluno_id = a.id
+        ORDER BY av.aluno_id, av.data_avaliacao, av.id
+    ''', conn)
+    series['classe'] = series['classe'].fillna('')
+    series[list(CRITERIOS_AVALIACAO)] = series[list(CRITERIOS_AVALIACAO)].astype(float)
+    datas = pd.to_datetime(series['data_avaliacao'], errors='coerce')
+    # Tempo em meses desde a primeira avaliação do aluno (a origem não altera a inclinação)
+    meses = ((datas - datas.groupby(series['aluno_id']).transform('min')).dt.days / 30.4375).to_numpy()
+    
+    # Início da janela de cada linha, sem atravessar para o aluno anterior
+    posicao = np.arange(len(series))
+    inicio_aluno = posicao - series.groupby('aluno_id', sort=False).cumcount().to_numpy()
+    inicio_janela = np.maximum(posicao - janela + 1, inicio_aluno)
+    
+    grupos = series.groupby('aluno_id', sort=False)
+    resumo = grupos.agg(
+        nome_completo=('nome_completo', 'first'),
+        classe=('classe', 'first'),
+        avaliacoes=('id', 'size'),
+        ultima_avaliacao=('data_avaliacao', 'last'),
+    )
+    
+    for criterio in CRITERIOS_AVALIACAO:
+        notas = series[criterio]
+        movel = f'{criterio}_media_movel'
+        # Média móvel por somas acumuladas: soma e quantidade de notas dentro da janela
+        preenchida = notas.notna().to_numpy()
+        soma = np.concatenate(([0.0], np.cumsum(np.where(preenchida, notas.to_numpy(), 0.0))))
+        quantidade = np.concatenate(([0], np.cumsum(preenchida)))
+        na_janela = quantidade[posicao + 1] - quantidade[inicio_janela]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series[movel] = np.where(
+                na_janela > 0, (soma[posicao + 1] - soma[inicio_janela]) / na_janela, np.nan
+            )
+        
+        # Somas por aluno só dos pontos com nota e data: inclinação sem laço por aluno
+        valido = preenchida & ~np.isnan(meses)
+        x = np.where(valido, meses, 0.0)
+        y = np.where(valido, notas.to_numpy(), 0.0)
+        somas = pd.DataFrame({
+            'n': valido.astype(float), 'x': x, 'y': y, 'xy': x * y, 'xx': x * x
+        }).groupby(series['aluno_id'].to_numpy(), sort=False).sum()
+        denominador = somas['n'] * somas['xx'] - somas['x'] ** 2
+        inclinacao = (somas['n'] * somas['xy'] - somas['x'] * somas['y']) / denominador.where(denominador > 1e-9)
+        
+        resumo[f'{criterio}_ultima'] = grupos[criterio].last()
+        resumo[movel] = series.loc[preenchida, ['aluno_id', movel]].groupby('aluno_id').last()[movel]
+        resumo[f'{criterio}_inclinacao'] = inclinacao
+        resumo[f'{criterio}_percentil'] = resumo.groupby('classe')[movel].rank(pct=True) * 100
+    
+    return resumo, series.set_index('aluno_id')
+
+def tendencias_avaliacoes(conn):
+    """Tendências em cache por worker, recalculadas após qualquer escrita em avaliações ou alunos"""
+    versoes = versoes_tabelas(conn)
+    versoes = (versoes.get('avaliacoes'), versoes.get('alunos'))
+    if _tendencias['versoes'] != versoes:
+        with _tendencias_lock:
+            if _tendencias['versoes'] != versoes:
+                _tendencias['resumo'], _tendencias['series'] = calcular_tendencias(conn)
+                _tendencias['versoes'] = versoes
+    return _tendencias['resumo'], _tendencias['series']
+
+def _numero_json(valor, casas=2):
+    """float arredondado, ou None para NaN"""
+    return None if valor is None or valor != valor else round(float(valor), casas)
+
+@app.route('/api/avaliacoes/tendencias', methods=['GET'])
+@admin_required
+def tendencias_alunos():
+    """Evolução de cada aluno por critério: última nota, média móvel, inclinação e percentil na classe
+    
+    Parâmetros opcionais: classe e aluno_id (este inclui a série de avaliações).
+    """
+    aluno_id = request.args.get('aluno_id', type=int)
+    classe = request.args.get('classe')
+    
+    conn = get_db()
+    resumo, series = tendencias_avaliacoes(conn)
+    
+    if aluno_id is not None:
+        resumo = resumo[resumo.index == aluno_id]
+    if classe:
+        resumo = resumo[resumo['classe'] == classe]
+    
+    alunos = []
+    for id_aluno, linha in zip(resumo.index.tolist(), resumo.to_dict('records')):
+        alunos.append({
+            'aluno_id': id_aluno,
+            'nome_completo': linha['nome_completo'],
+            'classe': linha['classe'] or None,
+            'avaliacoes': linha['avaliacoes'],
+            'ultima_avaliacao': linha['ultima_avaliacao'],
+            'criterios': {
+                criterio: {
+                    'ultima': _numero_json(linha[f'{criterio}_ultima']),
+                    'media_movel': _numero_json(linha[f'{criterio}_media_movel']),
+                    'inclinacao_mensal': _numero_json(linha[f'{criterio}_inclinacao'], 3),
+                    'percentil_classe': _numero_json(linha[f'{criterio}_percentil'], 1),
+                }
+                for criterio in CRITERIOS_AVALIACAO
+            }
+        })
+    
+    resposta = {'janela_media_movel': TENDENCIA_JANELA, 'alunos': alunos}
+    if aluno_id is not None and alunos:
+        serie = series.loc[[aluno_id]]
+        resposta['serie'] = [
+            {'id': linha['id'], 'data_avaliacao': linha['data_avaliacao'],
+             **{coluna: _numero_json(linha[coluna]) for coluna in serie.columns
+                if coluna.startswith(CRITERIOS_AVALIACAO)}}
+            for linha in serie.to_dict('records')
+        ]
+    return jsonify(resposta)
+
 # ==================== ROTAS DE AVISOS ====================
 
 @app.route('/api/avisos', methods=['GET'])
@@ -1449,7 +4323,6 @@ def listar_avisos():
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM avisos ORDER BY data_publicacao DESC LIMIT 10')
     avisos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return jsonify(avisos)
 
 @app.route('/api/avisos', methods=['POST'])
@@ -1470,10 +4343,8 @@ def criar_aviso():
             data.get('data_publicacao', datetime.now().date().isoformat())
         ))
         conn.commit()
-        conn.close()
         return jsonify({'success': True}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/avisos/<int:aviso_id>', methods=['DELETE'])
@@ -1484,7 +4355,6 @@ def deletar_aviso(aviso_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM avisos WHERE id = ?', (aviso_id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 # ==================== ROTAS DE JUSTIFICATIVAS DE AUSÊNCIA ====================
@@ -1518,7 +4388,6 @@ def listar_justificativas():
             query += ' AND j.aluno_id = ?'
             params.append(aluno_id)
     else:
-        conn.close()
         return jsonify({'error': 'Acesso negado'}), 403
     
     if status_filtro:
@@ -1529,7 +4398,6 @@ def listar_justificativas():
     
     cursor.execute(query, params)
     justificativas = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
     return jsonify(justificativas)
 
@@ -1549,11 +4417,9 @@ def criar_justificativa():
         elif session.get('perfil') == 'admin':
             aluno_id = data.get('aluno_id')
         else:
-            conn.close()
             return jsonify({'success': False, 'error': 'Acesso negado'}), 403
         
         if not aluno_id:
-            conn.close()
             return jsonify({'success': False, 'error': 'Aluno não identificado'}), 400
         
         cursor.execute('''
@@ -1567,29 +4433,23 @@ def criar_justificativa():
         ))
         justificativa_id = cursor.lastrowid
         
-        # Criar notificação para o Sensei/Admin
-        # Buscar todos os admins
-        cursor.execute('SELECT id FROM usuarios WHERE perfil = "admin"')
-        admins = cursor.fetchall()
-        for admin in admins:
-            cursor.execute('SELECT nome_completo FROM alunos WHERE id = ?', (aluno_id,))
-            aluno = cursor.fetchone()
-            nome_aluno = aluno['nome_completo'] if aluno else 'Aluno'
-            
-            criar_notificacao(
-                usuario_id=admin['id'],
-                aluno_id=aluno_id,
-                tipo='justificativa_ausencia',
-                titulo='Nova Justificativa de Ausência',
-                mensagem=f'{nome_aluno} justificou uma ausência.',
-                link='/justificativas'
-            )
+        # Notificar todos os Senseis/Admins (um evento na fila, qualquer que seja o número de admins)
+        cursor.execute('SELECT nome_completo FROM alunos WHERE id = ?', (aluno_id,))
+        aluno = cursor.fetchone()
+        nome_aluno = aluno['nome_completo'] if aluno else 'Aluno'
+        enfileirar_notificacao(
+            cursor,
+            'perfil:admin',
+            aluno_id=aluno_id,
+            tipo='justificativa_ausencia',
+            titulo='Nova Justificativa de Ausência',
+            mensagem=f'{nome_aluno} justificou uma ausência.',
+            link='/justificativas'
+        )
         
         conn.commit()
-        conn.close()
         return jsonify({'success': True, 'id': justificativa_id}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/justificativas/<int:justificativa_id>', methods=['PUT'])
@@ -1616,10 +4476,8 @@ def atualizar_justificativa(justificativa_id):
             justificativa_id
         ))
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/justificativas/<int:justificativa_id>/marcar-lida', methods=['POST'])
@@ -1632,48 +4490,308 @@ def marcar_justificativa_lida(justificativa_id):
     try:
         cursor.execute('UPDATE justificativas_ausencia SET lida = 1 WHERE id = ?', (justificativa_id,))
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+# ==================== NOTIFICAÇÕES EM TEMPO REAL ====================
+# Cada processo tem um hub com uma única thread que consulta o SQLite a cada
+# SSE_INTERVALO segundos (notificações com id acima do último visto e os contadores
+# dos usuários conectados) e distribui os eventos para as filas dos assinantes.
+# Como todo worker lê o mesmo banco, notificações gravadas em qualquer processo
+# chegam a todos. Um assinante ocioso custa uma thread bloqueada, sem consultas.
+# Por isso cada processo aceita no máximo SSE_STREAMS_MAXIMO streams: o resto das
+# threads do worker (--threads no Procfile) fica para as outras rotas.
+
+SSE_INTERVALO = float(os.environ.get('SSE_INTERVALO', 1))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))
+SSE_STREAMS_MAXIMO = int(os.environ.get('SSE_STREAMS_MAXIMO', 300))
+SSE_RETRY_MS = 3000
+SSE_LOTADO_RETRY_MS = 30000
+SSE_REPLAY_MAXIMO = 100
+SSE_FILA_MAXIMO = 100
+
+class HubNotificacoes:
+    """Distribui notificações novas e mudanças de contador aos streams abertos no processo"""
+
+    def __init__(self, intervalo=SSE_INTERVALO, maximo=SSE_STREAMS_MAXIMO):
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._assinantes = {}
+        self._streams = 0
+        self._totais = {}
+        self._ultimo_id = None
+        self._lock = threading.Lock()
+        self._sinal = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {'consultas': 0, 'notificacoes': 0, 'contadores': 0, 'descartados': 0, 'recusados': 0,
+                       'ultima_consulta_ms': None}
+
+    def assinar(self, usuario_id, conn):
+        """Registra um stream do usuário e retorna sua fila de eventos (evento, dados),
+        ou None se o processo já tem o máximo de streams abertos"""
+        fila = queue.Queue(maxsize=SSE_FILA_MAXIMO)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._assinantes, self._totais, self._streams = {}, {}, 0
+                self._thread = threading.Thread(target=self._executar, name='hub-notificacoes', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            if not self._assinantes:
+                # Sem assinantes o hub não consulta; o que chegou nesse meio-tempo já está
+                # na página do novo assinante (ou vem no replay do Last-Event-ID)
+                self._ultimo_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM notificacoes').fetchone()[0]
+            if self._streams >= self.maximo:
+                self._stats['recusados'] += 1
+                return None
+            self._assinantes.setdefault(usuario_id, set()).add(fila)
+            self._streams += 1
+        return fila
+
+    def cancelar(self, usuario_id, fila):
+        with self._lock:
+            filas = self._assinantes.get(usuario_id)
+            if filas is not None and fila in filas:
+                filas.discard(fila)
+                self._streams -= 1
+                if not filas:
+                    del self._assinantes[usuario_id]
+                    self._totais.pop(usuario_id, None)
+
+    def acordar(self):
+        """Antecipa a próxima consulta (gravações feitas neste processo)
+
+        Durante uma requisição, espera o fim dela: antes do commit a consulta não veria nada.
+        """
+        if has_request_context():
+            g.acordar_hub = True
+        else:
+            self._sinal.set()
+
+    def _entregar(self, usuario_id, evento, dados):
+        for fila in list(self._assinantes.get(usuario_id, ())):
+            try:
+                fila.put_nowait((evento, dados))
+            except queue.Full:
+                # Cliente lento: o stream é encerrado e ele se reconecta com Last-Event-ID
+                self.cancelar(usuario_id, fila)
+                self._stats['descartados'] += 1
+                try:
+                    fila.get_nowait()
+                    fila.put_nowait((None, None))
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def consultar(self, conn):
+        """Uma rodada de consulta e distribuição; retorna o número de eventos entregues"""
+        inicio = time.perf_counter()
+        with self._lock:
+            usuarios = list(self._assinantes)
+        eventos = 0
+        while True:
+            novas = conn.execute(
+                'SELECT * FROM notificacoes WHERE id > ? ORDER BY id LIMIT 1000', (self._ultimo_id,)
+            ).fetchall()
+            for row in novas:
+                if row['usuario_id'] in self._assinantes:
+                    self._entregar(row['usuario_id'], 'notificacao', dict(row))
+                    eventos += 1
+            if novas:
+                # max: um assinante novo pode ter adiantado o ponteiro durante esta consulta
+                self._ultimo_id = max(self._ultimo_id, novas[-1]['id'])
+            if len(novas) < 1000:
+                break
+        if usuarios:
+            marcadores = ', '.join('?' * len(usuarios))
+            totais = dict(conn.execute(
+                f'SELECT usuario_id, total FROM notificacoes_nao_lidas WHERE usuario_id IN ({marcadores})', usuarios
+            ).fetchall())
+            for usuario_id in usuarios:
+                total = totais.get(usuario_id, 0)
+                # Sem total anterior (usuário recém-assinado) o evento vai mesmo assim: o total
+                # pode ter mudado entre a leitura do stream e esta consulta
+                if self._totais.get(usuario_id) != total:
+                    self._entregar(usuario_id, 'contador', {'total': total})
+                    eventos += 1
+                    self._stats['contadores'] += 1
+                    self._totais[usuario_id] = total
+        self._stats['consultas'] += 1
+        self._stats['notificacoes'] += eventos
+        self._stats['ultima_consulta_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+        return eventos
+
+    def _executar(self):
+        while True:
+            self._sinal.wait(self.intervalo)
+            self._sinal.clear()
+            if not self._assinantes:
+                continue
+            try:
+                self.consultar(db_pool.obter())
+            except Exception as e:
+                print(f'Erro no hub de notificações: {e}')
+
+    def estatisticas(self):
+        with self._lock:
+            streams = self._streams
+            usuarios = len(self._assinantes)
+        return dict(self._stats, streams=streams, maximo=self.maximo, usuarios=usuarios,
+                    ultimo_id=self._ultimo_id, intervalo=self.intervalo, pid=os.getpid())
+
+hub_notificacoes = HubNotificacoes()
+
+def _evento_sse(evento, dados, id_evento=None):
+    """Formata um evento Server-Sent Events"""
+    linhas = [f'id: {id_evento}'] if id_evento is not None else []
+    linhas.append(f'event: {evento}')
+    linhas.append('data: ' + json.dumps(dados, ensure_ascii=False, default=str))
+    return '\n'.join(linhas) + '\n\n'
+
 # ==================== ROTAS DE NOTIFICAÇÕES ====================
 
+# Notificações por página em GET /api/notificacoes
+NOTIFICACOES_POR_PAGINA = 50
+NOTIFICACOES_POR_PAGINA_MAXIMO = 500
+
 @app.route('/api/notificacoes', methods=['GET'])
 @login_required
 def listar_notificacoes():
-    """Lista notificações do usuário logado"""
+    """Lista notificações do usuário logado, das mais recentes para as mais antigas
+    
+    Parâmetros opcionais: apenas_nao_lidas, limite (padrão 50) e cursor. O cursor da
+    próxima página, pela chave (data_notificacao, id), vai no header X-Next-Cursor.
+    """
     apenas_nao_lidas = request.args.get('apenas_nao_lidas', 'false').lower() == 'true'
+    limite = request.args.get('limite', NOTIFICACOES_POR_PAGINA, type=int)
+    limite = max(1, min(limite, NOTIFICACOES_POR_PAGINA_MAXIMO))
+    cursor_pagina = request.args.get('cursor')
     
     conn = get_db()
     cursor = conn.cursor()
     
-    query = 'SELECT * FROM notificacoes WHERE usuario_id = ?'
+    query = 'SELECT * FROM {notificacoes} WHERE usuario_id = ?'
     params = [session.get('user_id')]
     
     if apenas_nao_lidas:
         query += ' AND lida = 0'
     
-    query += ' ORDER BY data_notificacao DESC LIMIT 50'
+    ano_cursor = None
+    if cursor_pagina:
+        try:
+            data_ultima, id_ultima = decodificar_cursor(cursor_pagina, 2)
+            ano_cursor = int(str(data_ultima)[:4])
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        query += ' AND (data_notificacao, id) < (?, ?)'
+        params += [data_ultima, id_ultima]
     
-    cursor.execute(query, params)
+    query += ' ORDER BY data_notificacao DESC, id DESC LIMIT ?'
+    params.append(limite)
+    
+    cursor.execute(query.format(notificacoes='notificacoes'), params)
     notificacoes = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
-    return jsonify(notificacoes)
+    # Página curta: o banco principal acabou abaixo do cursor. Só notificações lidas são
+    # arquivadas, e as não lidas antigas continuam aqui, então os anos arquivados entram
+    # pelo mesmo cursor, do mais recente ao mais antigo, anexando só os anos necessários
+    if len(notificacoes) < limite and not apenas_nao_lidas:
+        for ano in anos_arquivados(conn, ano_fim=ano_cursor):
+            esquema = anexar_arquivo(conn, ano)
+            if esquema is None:
+                continue
+            cursor.execute(query.format(notificacoes=f'{esquema}.notificacoes'), params)
+            notificacoes += [dict(row) for row in cursor.fetchall()]
+            # Um ano anexado por vez: a página pode atravessar mais anos que o limite do ATTACH
+            desanexar_arquivos(conn)
+            notificacoes.sort(key=lambda n: (n['data_notificacao'], n['id']), reverse=True)
+            del notificacoes[limite:]
+            # Os anos anteriores só têm notificações de antes de 1º de janeiro deste ano
+            if len(notificacoes) == limite and notificacoes[-1]['data_notificacao'] >= f'{ano}-01-01':
+                break
+    
+    response = jsonify(notificacoes)
+    if len(notificacoes) == limite:
+        ultima = notificacoes[-1]
+        response.headers['X-Next-Cursor'] = codificar_cursor(ultima['data_notificacao'], ultima['id'])
+    return response
 
 @app.route('/api/notificacoes/contador', methods=['GET'])
 @login_required
 def contar_notificacoes_nao_lidas():
-    """Retorna quantidade de notificações não lidas"""
+    """Retorna quantidade de notificações não lidas (contador mantido por triggers)"""
+    return jsonify({'total': contar_nao_lidas(get_db(), session.get('user_id'))})
+
+@app.route('/api/notificacoes/stream', methods=['GET'])
+@login_required
+def stream_notificacoes():
+    """Stream SSE com as notificações novas (event: notificacao, id = id da notificação)
+    e o total de não lidas (event: contador) do usuário logado
+    
+    Com Last-Event-ID (ou ?last_event_id=), reenvia antes as notificações perdidas,
+    até SSE_REPLAY_MAXIMO. Sem eventos, envia um comentário a cada SSE_HEARTBEAT segundos.
+    Com SSE_STREAMS_MAXIMO streams abertos no processo, responde 503.
+    """
+    usuario_id = session.get('user_id')
+    ultimo_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Last-Event-ID inválido'}), 400
+    
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) as total FROM notificacoes WHERE usuario_id = ? AND lida = 0', 
-                   (session.get('user_id'),))
-    resultado = cursor.fetchone()
-    conn.close()
-    return jsonify({'total': resultado['total'] if resultado else 0})
+    # Assina antes de ler o banco: o que chegar no meio vem pela fila (e é deduplicado pelo id)
+    fila = hub_notificacoes.assinar(usuario_id, conn)
+    if fila is None:
+        # Processo lotado: o EventSource não reconecta após um 503 e o app.js tenta de
+        # novo depois de SSE_LOTADO_RETRY_MS (o retry vai no corpo para outros clientes)
+        return app.response_class(f'retry: {SSE_LOTADO_RETRY_MS}\n\n', status=503,
+                                  mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'Retry-After': str(SSE_LOTADO_RETRY_MS // 1000),
+        })
+    try:
+        perdidas = []
+        if ultimo_id is not None:
+            perdidas = [dict(row) for row in conn.execute(
+                'SELECT * FROM notificacoes WHERE usuario_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (usuario_id, ultimo_id, SSE_REPLAY_MAXIMO)
+            )]
+        total = contar_nao_lidas(conn, usuario_id)
+    except Exception:
+        hub_notificacoes.cancelar(usuario_id, fila)
+        raise
+    
+    def gerar():
+        enviado = ultimo_id or 0
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            for notificacao in perdidas:
+                enviado = notificacao['id']
+                yield _evento_sse('notificacao', notificacao, notificacao['id'])
+            yield _evento_sse('contador', {'total': total})
+            while True:
+                try:
+                    evento, dados = fila.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if evento is None:
+                    return
+                if evento == 'notificacao':
+                    if dados['id'] <= enviado:
+                        continue
+                    enviado = dados['id']
+                    yield _evento_sse('notificacao', dados, dados['id'])
+                else:
+                    yield _evento_sse(evento, dados)
+        finally:
+            hub_notificacoes.cancelar(usuario_id, fila)
+    
+    return app.response_class(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @app.route('/api/notificacoes/<int:notificacao_id>/marcar-lida', methods=['POST'])
 @login_required
@@ -1683,19 +4801,16 @@ def marcar_notificacao_lida(notificacao_id):
     cursor = conn.cursor()
     
     try:
-        # Verificar se a notificação pertence ao usuário
-        cursor.execute('SELECT id FROM notificacoes WHERE id = ? AND usuario_id = ?', 
-                      (notificacao_id, session.get('user_id')))
-        if not cursor.fetchone():
-            conn.close()
+        # Só atualiza se a notificação pertencer ao usuário; o trigger ajusta o contador
+        cursor.execute('UPDATE notificacoes SET lida = 1 WHERE id = ? AND usuario_id = ?',
+                       (notificacao_id, session.get('user_id')))
+        if cursor.rowcount == 0:
+            conn.rollback()
             return jsonify({'success': False, 'error': 'Notificação não encontrada'}), 404
-        
-        cursor.execute('UPDATE notificacoes SET lida = 1 WHERE id = ?', (notificacao_id,))
         conn.commit()
-        conn.close()
+        invalidar_contadores_nao_lidas(session.get('user_id'))
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/notificacoes/marcar-todas-lidas', methods=['POST'])
@@ -1709,10 +4824,9 @@ def marcar_todas_notificacoes_lidas():
         cursor.execute('UPDATE notificacoes SET lida = 1 WHERE usuario_id = ? AND lida = 0', 
                       (session.get('user_id'),))
         conn.commit()
-        conn.close()
+        invalidar_contadores_nao_lidas(session.get('user_id'))
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 # ==================== ROTAS DE BIBLIOTECA TÉCNICA ====================
@@ -1745,7 +4859,6 @@ def listar_biblioteca():
     
     cursor.execute(query, params)
     conteudos = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
     return jsonify(conteudos)
 
@@ -1757,7 +4870,6 @@ def obter_avaliacao(avaliacao_id):
     cursor = conn.cursor()
     cursor.execute('SELECT av.*, a.nome_completo FROM avaliacoes av JOIN alunos a ON av.aluno_id = a.id WHERE av.id = ?', (avaliacao_id,))
     avaliacao = cursor.fetchone()
-    conn.close()
     
     if avaliacao:
         # Verificar permissão
@@ -1765,18 +4877,7 @@ def obter_avaliacao(avaliacao_id):
             if avaliacao['aluno_id'] != session.get('aluno_id') or avaliacao['status'] != 'Liberada':
                 return jsonify({'error': 'Acesso negado'}), 403
         
-        # Calcular média
-        notas = [
-            avaliacao.get('disciplina'),
-            avaliacao.get('tecnica'),
-            avaliacao.get('participacao'),
-            avaliacao.get('respeito_comportamento')
-        ]
-        notas_validas = [n for n in notas if n is not None]
-        avaliacao_dict = dict(avaliacao)
-        avaliacao_dict['media'] = round(sum(notas_validas) / len(notas_validas), 2) if notas_validas else None
-        
-        return jsonify(avaliacao_dict)
+        return jsonify(dict(avaliacao))
     return jsonify({'error': 'Avaliação não encontrada'}), 404
 
 @app.route('/api/biblioteca/<int:conteudo_id>', methods=['GET'])
@@ -1787,7 +4888,6 @@ def obter_conteudo(conteudo_id):
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM biblioteca_tecnica WHERE id = ?', (conteudo_id,))
     conteudo = cursor.fetchone()
-    conn.close()
     
     if conteudo:
         return jsonify(dict(conteudo))
@@ -1818,10 +4918,8 @@ def criar_conteudo():
         ))
         conn.commit()
         conteudo_id = cursor.lastrowid
-        conn.close()
         return jsonify({'success': True, 'id': conteudo_id}), 201
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/biblioteca/<int:conteudo_id>', methods=['PUT'])
@@ -1851,10 +4949,8 @@ def atualizar_conteudo(conteudo_id):
             conteudo_id
         ))
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/biblioteca/<int:conteudo_id>', methods=['DELETE'])
@@ -1865,7 +4961,6 @@ def deletar_conteudo(conteudo_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM biblioteca_tecnica WHERE id = ?', (conteudo_id,))
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/biblioteca/tipos-golpes', methods=['GET'])
@@ -1912,13 +5007,11 @@ def gerar_link_rematricula():
             'Pendente'
         ))
         conn.commit()
-        conn.close()
         
         # Retorna o link (em produção, usar domínio real)
         link = f"/rematricula/{token}"
         return jsonify({'success': True, 'link': link, 'token': token})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/rematriculas/token/<token>', methods=['GET'])
@@ -1932,7 +5025,6 @@ def obter_rematricula_token(token):
         WHERE r.token = ? AND r.status = "Pendente"
     ''', (token,))
     rematricula = cursor.fetchone()
-    conn.close()
     
     if rematricula:
         return jsonify(dict(rematricula))
@@ -1955,7 +5047,6 @@ def confirmar_rematricula():
         ''', (token,))
         
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({'success': False, 'error': 'Link inválido'}), 400
         
         # Atualiza status do aluno para Ativo
@@ -1964,11 +5055,10 @@ def confirmar_rematricula():
             WHERE id = (SELECT aluno_id FROM rematriculas WHERE token = ?)
         ''', (token,))
         
+        registrar_alteracao(conn, 'alunos')
         conn.commit()
-        conn.close()
         return jsonify({'success': True})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/rematricula/<token>')
@@ -1976,6 +5066,633 @@ def pagina_rematricula(token):
     """Página pública de rematrícula"""
     return render_template('rematricula.html', token=token)
 
+# ==================== TAREFAS AGENDADAS ====================
+
+_virada_idades_verificada = {'data': None}
+
+@app.before_request
+def virada_diaria_idades():
+    """Roda a virada de idades na primeira requisição do dia em cada worker"""
+    hoje = datetime.now().date()
+    if _virada_idades_verificada['data'] == hoje:
+        return
+    _virada_idades_verificada['data'] = hoje
+    try:
+        executar_virada_idades(get_db(), hoje)
+    except sqlite3.Error as e:
+        # Outro worker pode estar com o lock; a próxima execução recupera os dias perdidos
+        _virada_idades_verificada['data'] = None
+        print(f'Erro na virada de idades: {e}')
+
+alunos_cli = AppGroup('alunos', help='Manutenção do cadastro de alunos')
+
+@alunos_cli.command('virada-idades')
+@click.option('--todos', is_flag=True, help='Recalcula todos os alunos, não só os aniversariantes')
+def alunos_virada_idades(todos):
+    """Recalcula idade, IMC, classe e categoria dos aniversariantes (para cron diário)"""
+    total = executar_virada_idades(get_db(), todos=todos)
+    click.echo(f'{total} aluno(s) atualizado(s)')
+
+# Resultados da escada if/elif original de determinar_categoria, como (idade, peso, gênero,
+# categoria): os dois lados de cada limite de peso por classe e de cada idade de corte.
+# Lista fixa: não é derivada de FAIXAS_PESO, então uma mudança nas tabelas aparece aqui.
+CATEGORIAS_ESPERADAS = [
+    (12, 29.9, 'M', 'Até 30kg'), (12, 30, 'M', 'Até 34kg'), (12, 33.9, 'F', 'Até 34kg'), (12, 34, 'F', 'Até 38kg'),
+    (12, 37.9, 'M', 'Até 38kg'), (12, 38, 'M', 'Até 42kg'), (12, 41.9, 'F', 'Até 42kg'), (12, 42, 'F', 'Até 46kg'),
+    (12, 45.9, 'M', 'Até 46kg'), (12, 46, 'M', 'Até 50kg'), (12, 49.9, 'F', 'Até 50kg'), (12, 50, 'F', 'Até 55kg'),
+    (12, 54.9, 'M', 'Até 55kg'), (12, 55, 'M', 'Acima de 55kg'),
+    (15, 39.9, 'M', 'Até 40kg'), (15, 40, 'M', 'Até 44kg'), (15, 43.9, 'F', 'Até 44kg'), (15, 44, 'F', 'Até 48kg'),
+    (15, 47.9, 'M', 'Até 48kg'), (15, 48, 'M', 'Até 52kg'), (15, 51.9, 'F', 'Até 52kg'), (15, 52, 'F', 'Até 57kg'),
+    (15, 56.9, 'M', 'Até 57kg'), (15, 57, 'M', 'Até 63kg'), (15, 62.9, 'F', 'Até 63kg'), (15, 63, 'F', 'Até 70kg'),
+    (15, 69.9, 'M', 'Até 70kg'), (15, 70, 'M', 'Acima de 70kg'),
+    (19, 49.9, 'M', 'Até 50kg'), (19, 50, 'M', 'Até 55kg'), (19, 54.9, 'F', 'Até 55kg'), (19, 55, 'F', 'Até 60kg'),
+    (19, 59.9, 'M', 'Até 60kg'), (19, 60, 'M', 'Até 66kg'), (19, 65.9, 'F', 'Até 66kg'), (19, 66, 'F', 'Até 73kg'),
+    (19, 72.9, 'M', 'Até 73kg'), (19, 73, 'M', 'Até 81kg'), (19, 80.9, 'F', 'Até 81kg'), (19, 81, 'F', 'Até 90kg'),
+    (19, 89.9, 'M', 'Até 90kg'), (19, 90, 'M', 'Até 100kg'), (19, 99.9, 'F', 'Até 100kg'),
+    (19, 100, 'F', 'Acima de 100kg'),
+    (20, 59.9, 'M', 'Até 60kg'), (20, 60, 'M', 'Até 66kg'), (20, 65.9, 'F', 'Até 66kg'), (20, 66, 'F', 'Até 73kg'),
+    (20, 72.9, 'M', 'Até 73kg'), (20, 73, 'M', 'Até 81kg'), (20, 80.9, 'F', 'Até 81kg'), (20, 81, 'F', 'Até 90kg'),
+    (20, 89.9, 'M', 'Até 90kg'), (20, 90, 'M', 'Até 100kg'), (20, 99.9, 'F', 'Até 100kg'),
+    (20, 100, 'F', 'Acima de 100kg'),
+    (30, 59.9, 'M', 'Até 60kg'), (30, 60, 'M', 'Até 66kg'), (30, 65.9, 'F', 'Até 66kg'), (30, 66, 'F', 'Até 73kg'),
+    (30, 72.9, 'M', 'Até 73kg'), (30, 73, 'M', 'Até 81kg'), (30, 80.9, 'F', 'Até 81kg'), (30, 81, 'F', 'Até 90kg'),
+    (30, 89.9, 'M', 'Até 90kg'), (30, 90, 'M', 'Até 100kg'), (30, 99.9, 'F', 'Até 100kg'),
+    (30, 100, 'F', 'Acima de 100kg'),
+    (5, 58, 'M', 'Acima de 55kg'), (12, 58, 'F', 'Acima de 55kg'), (13, 58, 'M', 'Até 63kg'),
+    (15, 58, 'M', 'Até 63kg'), (16, 58, 'F', 'Até 60kg'), (19, 58, 'M', 'Até 60kg'), (20, 58, 'F', 'Até 60kg'),
+    (29, 58, 'M', 'Até 60kg'), (30, 58, 'F', 'Até 60kg'), (70, 58, 'F', 'Até 60kg'),
+    (None, 50, 'M', None), (0, 50, 'F', None), (15, None, 'M', None), (15, 0, 'F', None),
+]
+
+@alunos_cli.command('benchmark-categorias')
+@click.option('--quantidade', default=100000, help='Número de atletas sintéticos')
+def alunos_benchmark_categorias(quantidade):
+    """Compara determinar_categoria linha a linha com classificar_categorias em lote
+    
+    Antes da medição, confere as duas contra CATEGORIAS_ESPERADAS.
+    """
+    import random
+    
+    idades, pesos, generos, esperadas = zip(*CATEGORIAS_ESPERADAS)
+    obtidas = zip([determinar_categoria(*linha) for linha in zip(idades, pesos, generos)],
+                  classificar_categorias(idades, pesos, generos))
+    erradas = [(linha, por_linha, em_lote) for linha, esperada, (por_linha, em_lote)
+               in zip(CATEGORIAS_ESPERADAS, esperadas, obtidas) if not por_linha == em_lote == esperada]
+    for (idade, peso, genero, esperada), por_linha, em_lote in erradas:
+        click.echo(f'❌ idade {idade}, peso {peso}, gênero {genero}: esperado {esperada}, '
+                   f'linha a linha {por_linha}, em lote {em_lote}')
+    if erradas:
+        raise SystemExit(1)
+    click.echo(f'✅ {len(CATEGORIAS_ESPERADAS)} casos da tabela original')
+    
+    aleatorio = random.Random(42)
+    idades = [aleatorio.randint(5, 60) for _ in range(quantidade)]
+    pesos = [round(aleatorio.uniform(20, 130), 1) for _ in range(quantidade)]
+    generos = [aleatorio.choice('MF') for _ in range(quantidade)]
+    
+    inicio = time.perf_counter()
+    por_linha = [determinar_categoria(i, p, gen) for i, p, gen in zip(idades, pesos, generos)]
+    tempo_linha = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    em_lote = classificar_categorias(idades, pesos, generos)
+    tempo_lote = time.perf_counter() - inicio
+    
+    # Caso típico de uma planilha já carregada no pandas: colunas como arrays NumPy
+    import numpy as np
+    idades_np, pesos_np, generos_np = np.array(idades), np.array(pesos), np.array(generos, dtype=object)
+    inicio = time.perf_counter()
+    em_lote_np = classificar_categorias(idades_np, pesos_np, generos_np)
+    tempo_lote_np = time.perf_counter() - inicio
+    
+    divergencias = sum(1 for a, b, c in zip(por_linha, em_lote, em_lote_np) if not a == b == c)
+    click.echo(f'{quantidade} atletas')
+    click.echo(f'linha a linha:        {tempo_linha * 1000:.1f} ms')
+    click.echo(f'em lote (listas):     {tempo_lote * 1000:.1f} ms ({tempo_linha / tempo_lote:.1f}x)')
+    click.echo(f'em lote (NumPy):      {tempo_lote_np * 1000:.1f} ms ({tempo_linha / tempo_lote_np:.1f}x)')
+    click.echo(f'divergências:         {divergencias}')
+    if divergencias:
+        raise SystemExit(1)
+
+def _planilha_sintetica(quantidade, semente=42):
+    """CSV sintético no formato do template de importação, para benchmarks"""
+    import random
+    
+    aleatorio = random.Random(semente)
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow([
+        'Nome', 'Data Nascimento', 'Tipo', 'Nome Responsável', 'Contato',
+        'Data Matrícula', 'Status', 'Graduação', 'Modalidade', 'Peso', 'Altura', 'Observações'
+    ])
+    for i in range(quantidade):
+        writer.writerow([
+            f'Atleta {i}',
+            f'{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/{aleatorio.randint(1960, 2018)}',
+            aleatorio.choice(['Criança', 'Adulto']), 'Responsável', '(11) 99999-9999',
+            '01/01/2024', 'Ativo', aleatorio.choice(GRADUACOES_VALIDAS), 'Judô',
+            f'{aleatorio.uniform(20, 120):.1f}', str(aleatorio.randint(110, 200)), ''
+        ])
+    return output.getvalue().encode('utf-8')
+
+@alunos_cli.command('benchmark-importacao')
+@click.option('--linhas', multiple=True, type=int, default=[1000, 10000, 100000], help='Tamanhos de planilha')
+def alunos_benchmark_importacao(linhas):
+    """Mede a vazão da importação em um banco temporário"""
+    
+    for quantidade in linhas:
+        conteudo = _planilha_sintetica(quantidade)
+        with tempfile.TemporaryDirectory() as diretorio:
+            conn = sqlite3.connect(os.path.join(diretorio, 'benchmark.db'))
+            conn.row_factory = sqlite3.Row
+            for nome, valor in SQLITE_PRAGMAS.items():
+                conn.execute(f'PRAGMA {nome} = {valor}')
+            aplicar_migracoes(conn)
+            
+            inicio = time.perf_counter()
+            resultados = importar_arquivo(conn, io.BytesIO(conteudo), 'benchmark.csv')
+            tempo = time.perf_counter() - inicio
+            conn.close()
+        click.echo(f'{quantidade:>7} linhas: {tempo:6.2f} s  '
+                   f'{quantidade / tempo:>9,.0f} linhas/s  ({len(resultados["erros"])} erro(s))')
+
+app.cli.add_command(alunos_cli)
+
+presencas_cli = AppGroup('presencas', help='Manutenção do controle de presença')
+
+@presencas_cli.command('reconstruir-resumos')
+@click.option('--inicio', default=None, help='Primeiro dia (AAAA-MM-DD); padrão: todo o histórico')
+@click.option('--fim', default=None, help='Último dia (AAAA-MM-DD)')
+def presencas_reconstruir_resumos(inicio, fim):
+    """Recalcula os resumos diários de presença a partir da tabela presencas"""
+    dias = reconstruir_resumos_com_arquivo(get_db(), inicio, fim)
+    click.echo(f'{dias} dia(s) reconstruído(s)')
+
+@presencas_cli.command('benchmark-bitmaps')
+@click.option('--alunos', default=300, help='Número de alunos sintéticos')
+@click.option('--anos', default=3, help='Anos de histórico')
+def presencas_benchmark_bitmaps(alunos, anos):
+    """Compara as análises da turma inteira lendo presencas com os bitmaps mensais"""
+    import random
+    import tracemalloc
+    
+    aleatorio = random.Random(42)
+    fim = datetime.now().date()
+    inicio = fim - timedelta(days=365 * anos)
+    with tempfile.TemporaryDirectory() as diretorio:
+        conn = sqlite3.connect(os.path.join(diretorio, 'benchmark.db'))
+        conn.row_factory = sqlite3.Row
+        aplicar_migracoes(conn)
+        conn.executemany(
+            "INSERT INTO alunos (nome_completo, tipo, data_matricula) VALUES (?, 'Adulto', ?)",
+            [(f'Atleta {i}', inicio.isoformat()) for i in range(alunos)]
+        )
+        # Três treinos por semana, com 70% de presença
+        dias = [inicio + timedelta(days=d) for d in range((fim - inicio).days + 1)
+                if (inicio + timedelta(days=d)).weekday() in (0, 2, 4)]
+        conn.executemany(
+            'INSERT INTO presencas (aluno_id, data, presente) VALUES (?, ?, ?)',
+            ((aluno_id, dia.isoformat(), aleatorio.random() < 0.7)
+             for aluno_id in range(1, alunos + 1) for dia in dias)
+        )
+        conn.commit()
+        total = conn.execute('SELECT COUNT(*) FROM presencas').fetchone()[0]
+        
+        def analisar_linhas():
+            por_aluno = {}
+            for row in conn.execute('SELECT aluno_id, data, presente FROM presencas ORDER BY aluno_id, data'):
+                por_aluno.setdefault(row['aluno_id'], []).append((row['data'], row['presente']))
+            resultado = {}
+            for aluno_id, registros in por_aluno.items():
+                presentes = maior = atual = 0
+                ultima = None
+                for data, presente in registros:
+                    if presente:
+                        presentes += 1
+                        atual = 0
+                        ultima = data
+                    else:
+                        atual += 1
+                        maior = max(maior, atual)
+                resultado[aluno_id] = (presentes, len(registros), maior, ultima)
+            return resultado
+        
+        def analisar_bitmaps():
+            resultado = {}
+            for aluno_id, bitmap in carregar_bitmaps_presenca(conn).items():
+                presentes, registrados, _ = bitmap.frequencia()
+                resultado[aluno_id] = (presentes, registrados, bitmap.maior_sequencia_ausencias(),
+                                       bitmap.ultima_presenca())
+            return resultado
+        
+        click.echo(f'{alunos} alunos, {total:,} presenças em {anos} ano(s)')
+        for nome, funcao in [('linhas de presencas', analisar_linhas), ('bitmaps mensais', analisar_bitmaps)]:
+            inicio_tempo = time.perf_counter()
+            funcao()
+            tempo = time.perf_counter() - inicio_tempo
+            # Memória medida numa segunda passada, para o tracemalloc não pesar no tempo
+            tracemalloc.start()
+            funcao()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            click.echo(f'{nome:>20}: {tempo * 1000:8.1f} ms  pico de memória {pico / 1024 / 1024:7.2f} MB')
+        conn.close()
+
+app.cli.add_command(presencas_cli)
+
+notificacoes_cli = AppGroup('notificacoes', help='Fila de saída das notificações')
+
+@notificacoes_cli.command('worker')
+@click.option('--uma-vez', is_flag=True, help='Esvazia a fila uma vez e sai (para cron)')
+@click.option('--lote', default=SAIDA_LOTE, help='Eventos por transação')
+def notificacoes_worker(uma_vez, lote):
+    """Entrega as notificações da fila (use com NOTIFICACOES_WORKER=cli nos servidores web)"""
+    conn = get_db()
+    while True:
+        lidos = drenar_saida_notificacoes(conn, lote)
+        if lidos or uma_vez:
+            metricas = metricas_saida_notificacoes(conn)
+            click.echo(f'{lidos} evento(s) lido(s); pendentes: {metricas["pendentes"]}, '
+                       f'descartadas: {metricas["descartadas"]}')
+        if uma_vez:
+            return
+        time.sleep(SAIDA_INTERVALO)
+
+@notificacoes_cli.command('status')
+def notificacoes_status():
+    """Mostra profundidade, atraso e eventos descartados da fila"""
+    metricas = metricas_saida_notificacoes(get_db())
+    click.echo(f'pendentes: {metricas["pendentes"]} ({metricas["vencidas"]} vencida(s), '
+               f'{metricas["em_nova_tentativa"]} em nova tentativa)')
+    click.echo(f'atraso: {metricas["atraso_segundos"]:.1f} s')
+    click.echo(f'descartadas: {metricas["descartadas"]}')
+
+@notificacoes_cli.command('reenviar-descartadas')
+def notificacoes_reenviar_descartadas():
+    """Devolve os eventos descartados à fila, com as tentativas zeradas"""
+    conn = get_db()
+    cursor = conn.execute('''
+        UPDATE notificacoes_saida SET status = 'pendente', tentativas = 0, proxima_tentativa = ?
+        WHERE status = 'descartada'
+    ''', (datetime.now().isoformat(),))
+    conn.commit()
+    click.echo(f'{cursor.rowcount} evento(s) devolvido(s) à fila')
+
+@notificacoes_cli.command('reparar-contadores')
+def notificacoes_reparar_contadores():
+    """Recalcula os contadores de não lidas e lista os usuários que estavam divergentes"""
+    conn = get_db()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        divergentes = reconstruir_contadores_nao_lidas(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    invalidar_contadores_nao_lidas()
+    if divergentes:
+        click.echo(f'{len(divergentes)} contador(es) corrigido(s): usuários {", ".join(map(str, divergentes))}')
+    else:
+        click.echo('Contadores consistentes')
+
+@notificacoes_cli.command('compactar')
+@click.option('--dias', type=int, default=None, help='Idade mínima em dias (padrão: NOTIFICACOES_RETENCAO_DIAS)')
+@click.option('--apagar', is_flag=True, help='Apaga em vez de mover para os arquivos anuais')
+@click.option('--lote', default=NOTIFICACOES_RETENCAO_LOTE, help='Notificações por transação')
+def notificacoes_compactar(dias, apagar, lote):
+    """Tira do banco as notificações lidas antigas, em lotes curtos (para cron)"""
+    corte = datetime.now().date() - timedelta(days=NOTIFICACOES_RETENCAO_DIAS if dias is None else dias)
+    resultado = compactar_notificacoes(get_db(), corte, apagar=apagar, lote=lote)
+    destino = 'apagada(s)' if apagar else 'arquivada(s)'
+    click.echo(f'{resultado["removidas"]} notificação(ões) lida(s) anteriores a {corte.isoformat()} {destino} '
+               f'em {resultado["lotes"]} lote(s); maior transação: {resultado["lock_maximo_ms"]:.1f} ms')
+    for ano, arquivadas in sorted(resultado['arquivadas'].items()):
+        click.echo(f'{ano}: {arquivadas} → {caminho_arquivo(ano)}')
+
+@notificacoes_cli.command('benchmark-retencao')
+@click.option('--linhas', default=1000000, help='Notificações sintéticas')
+@click.option('--usuarios', default=2000, help='Destinatários distintos')
+@click.option('--dias', default=NOTIFICACOES_RETENCAO_DIAS, help='Retenção aplicada')
+@click.option('--apagar', is_flag=True, help='Apaga em vez de arquivar')
+@click.option('--lote', default=NOTIFICACOES_RETENCAO_LOTE, help='Notificações por transação')
+def notificacoes_benchmark_retencao(linhas, usuarios, dias, apagar, lote):
+    """Mede tamanho e latência das listagens antes e depois da retenção, num banco temporário"""
+    import random
+    global ARQUIVO_DIR
+    
+    aleatorio = random.Random(42)
+    agora = datetime.now().replace(microsecond=0)
+    arquivo_dir_original = ARQUIVO_DIR
+    with tempfile.TemporaryDirectory() as diretorio:
+        ARQUIVO_DIR = diretorio
+        caminho = os.path.join(diretorio, 'benchmark.db')
+        conn = sqlite3.connect(caminho)
+        conn.row_factory = sqlite3.Row
+        for nome, valor in SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {nome} = {valor}')
+        try:
+            aplicar_migracoes(conn)
+            
+            # Dois anos de histórico em ordem cronológica; tudo lido, exceto metade do último mês
+            inicio = time.perf_counter()
+            segundos = 730 * 86400
+            def gerar():
+                for i in range(linhas):
+                    data = agora - timedelta(seconds=segundos - segundos * i // linhas)
+                    lida = 1 if (agora - data).days > 30 or aleatorio.random() < 0.5 else 0
+                    yield (aleatorio.randint(1, usuarios), 'benchmark', 'Aviso', 'Notificação de teste',
+                           lida, data.strftime('%Y-%m-%d %H:%M:%S'))
+            conn.executemany('''
+                INSERT INTO notificacoes (usuario_id, tipo, titulo, mensagem, lida, data_notificacao)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', gerar())
+            conn.commit()
+            click.echo(f'{linhas:,} notificações para {usuarios} usuários geradas em '
+                       f'{time.perf_counter() - inicio:.1f} s')
+            
+            amostra = aleatorio.sample(range(1, usuarios + 1), min(200, usuarios))
+            profundidade = 19 * NOTIFICACOES_POR_PAGINA
+            sql_pagina = ('SELECT * FROM notificacoes WHERE usuario_id = ?{chave} '
+                          'ORDER BY data_notificacao DESC, id DESC LIMIT ?{offset}')
+            
+            def latencias(sql, params_por_usuario):
+                tempos = []
+                for usuario_id in amostra:
+                    params = params_por_usuario(usuario_id)
+                    inicio_consulta = time.perf_counter()
+                    conn.execute(sql, params).fetchall()
+                    tempos.append((time.perf_counter() - inicio_consulta) * 1000)
+                tempos.sort()
+                return f'p50 {tempos[len(tempos) // 2]:.3f} ms, p99 {tempos[int(len(tempos) * 0.99) - 1]:.3f} ms'
+            
+            def medir(rotulo):
+                paginas, tamanho_pagina, livres = (conn.execute(f'PRAGMA {p}').fetchone()[0]
+                                                   for p in ('page_count', 'page_size', 'freelist_count'))
+                total = conn.execute('SELECT COUNT(*) FROM notificacoes').fetchone()[0]
+                click.echo(f'[{rotulo}] {total:,} linhas, {paginas * tamanho_pagina / 1024 / 1024:.1f} MB '
+                           f'({livres * tamanho_pagina / 1024 / 1024:.1f} MB livres)')
+                # Chave da última linha da 19ª página, para comparar OFFSET com cursor na 20ª
+                cursores = {}
+                for usuario_id in amostra:
+                    row = conn.execute(sql_pagina.format(chave='', offset=' OFFSET ?'),
+                                       (usuario_id, 1, profundidade - 1)).fetchone()
+                    cursores[usuario_id] = (row['data_notificacao'], row['id']) if row else ('', 0)
+                click.echo('  primeira página:       ' + latencias(
+                    sql_pagina.format(chave='', offset=''), lambda u: (u, NOTIFICACOES_POR_PAGINA)))
+                click.echo('  20ª página com OFFSET: ' + latencias(
+                    sql_pagina.format(chave='', offset=' OFFSET ?'),
+                    lambda u: (u, NOTIFICACOES_POR_PAGINA, profundidade)))
+                click.echo('  20ª página com cursor: ' + latencias(
+                    sql_pagina.format(chave=' AND (data_notificacao, id) < (?, ?)', offset=''),
+                    lambda u: (u, *cursores[u], NOTIFICACOES_POR_PAGINA)))
+                click.echo('  não lidas:             ' + latencias(
+                    'SELECT * FROM notificacoes WHERE usuario_id = ? AND lida = 0 '
+                    'ORDER BY data_notificacao DESC, id DESC LIMIT ?', lambda u: (u, NOTIFICACOES_POR_PAGINA)))
+            
+            medir('antes')
+            
+            # Uma gravação a cada 10 ms em outra conexão mede quanto as rotas esperam pelo lock
+            esperas = []
+            parar = threading.Event()
+            def escritor():
+                outra = sqlite3.connect(caminho)
+                for nome, valor in SQLITE_PRAGMAS.items():
+                    outra.execute(f'PRAGMA {nome} = {valor}')
+                while not parar.is_set():
+                    inicio_escrita = time.perf_counter()
+                    outra.execute("INSERT INTO notificacoes (usuario_id, tipo, titulo, mensagem) "
+                                  "VALUES (1, 'benchmark', 'Aviso', 'Durante a retenção')")
+                    outra.commit()
+                    esperas.append((time.perf_counter() - inicio_escrita) * 1000)
+                    time.sleep(0.01)
+                outra.close()
+            thread = threading.Thread(target=escritor)
+            thread.start()
+            inicio = time.perf_counter()
+            resultado = compactar_notificacoes(conn, agora.date() - timedelta(days=dias), apagar=apagar, lote=lote)
+            tempo = time.perf_counter() - inicio
+            parar.set()
+            thread.join()
+            esperas.sort()
+            click.echo(f'retenção de {dias} dias: {resultado["removidas"]:,} linhas '
+                       f'{"apagadas" if apagar else "arquivadas"} em {resultado["lotes"]} lotes, {tempo:.1f} s; '
+                       f'maior transação {resultado["lock_maximo_ms"]:.1f} ms, '
+                       f'checkpoints {resultado["checkpoint_ms"] / 1000:.1f} s')
+            click.echo(f'gravações concorrentes: {len(esperas)}, p50 {esperas[len(esperas) // 2]:.2f} ms, '
+                       f'p99 {esperas[int(len(esperas) * 0.99) - 1]:.2f} ms, máx {esperas[-1]:.2f} ms, '
+                       f'{sum(1 for espera in esperas if espera > 100)} acima de 100 ms')
+            
+            medir('depois')
+            conn.execute('VACUUM')
+            medir('depois do VACUUM')
+        finally:
+            conn.close()
+            ARQUIVO_DIR = arquivo_dir_original
+
+@notificacoes_cli.command('benchmark-stream')
+@click.option('--assinantes', default=500, help='Streams SSE abertos ao mesmo tempo')
+@click.option('--segundos', default=10.0, help='Duração da fase ociosa')
+@click.option('--heartbeat', default=5.0, help='Intervalo do heartbeat durante o teste')
+def notificacoes_benchmark_stream(assinantes, segundos, heartbeat):
+    """Sobe o gunicorn com o comando do Procfile, abre N streams ociosos e mede o custo em
+    repouso, a latência das outras rotas com os streams abertos e a entrega"""
+    import http.client
+    import shlex
+    import socket
+    import subprocess
+    
+    with open(os.path.join(BASE_DIR, 'Procfile')) as arquivo:
+        comando = next(linha.split(':', 1)[1] for linha in arquivo if linha.startswith('web:'))
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        porta = sock.getsockname()[1]
+    argumentos = shlex.split(comando.replace('$PORT', str(porta)).replace('0.0.0.0', '127.0.0.1'))
+    click.echo('servidor: ' + ' '.join(argumentos))
+    
+    def processos_servidor():
+        pids = [servidor.pid]
+        for nome in os.listdir('/proc'):
+            if nome.isdigit():
+                try:
+                    with open(f'/proc/{nome}/stat') as stat:
+                        if int(stat.read().rsplit(')', 1)[1].split()[1]) == servidor.pid:
+                            pids.append(int(nome))
+                except (OSError, IndexError, ValueError):
+                    pass
+        return pids
+    
+    def cpu_servidor():
+        total = 0
+        for pid in processos_servidor():
+            with open(f'/proc/{pid}/stat') as stat:
+                campos = stat.read().rsplit(')', 1)[1].split()
+            total += int(campos[11]) + int(campos[12])
+        return total / os.sysconf('SC_CLK_TCK')
+    
+    def rss_servidor():
+        total = 0
+        for pid in processos_servidor():
+            with open(f'/proc/{pid}/status') as status:
+                total += next(int(linha.split()[1]) for linha in status if linha.startswith('VmRSS:'))
+        return total / 1024
+    
+    def percentis(tempos):
+        tempos = sorted(tempos)
+        return (f'p50 {tempos[len(tempos) // 2]:.0f} ms, p99 {tempos[max(0, int(len(tempos) * 0.99) - 1)]:.0f} ms, '
+                f'máx {tempos[-1]:.0f} ms')
+    
+    serializador = app.session_interface.get_signing_serializer(app)
+    def cabecalho(usuario_id, perfil='aluno'):
+        cookie = serializador.dumps({'user_id': usuario_id, 'perfil': perfil})
+        return {'Cookie': f'{app.config["SESSION_COOKIE_NAME"]}={cookie}'}
+    
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'benchmark.db')
+        pool = GerenciadorConexoes(caminho, SQLITE_PRAGMAS)
+        aplicar_migracoes(pool.obter())
+        ambiente = dict(os.environ, DATABASE_PATH=caminho, SECRET_KEY=app.secret_key,
+                        SSE_HEARTBEAT=str(heartbeat))
+        with open(os.path.join(diretorio, 'gunicorn.log'), 'w') as log:
+            servidor = subprocess.Popen(argumentos, cwd=BASE_DIR, env=ambiente, stdout=log, stderr=log)
+        try:
+            limite = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+                    break
+                except OSError:
+                    if servidor.poll() is not None or time.monotonic() > limite:
+                        with open(os.path.join(diretorio, 'gunicorn.log')) as log:
+                            click.echo(log.read()[-2000:])
+                        raise click.ClickException('o gunicorn não subiu')
+                    time.sleep(0.2)
+            
+            prontos = threading.Semaphore(0)
+            conectados, recusados, heartbeats = set(), [0], [0]
+            chegadas = {}
+            
+            def assinante(usuario_id):
+                # Após um 503 o app.js espera SSE_LOTADO_RETRY_MS; aqui tenta de novo logo,
+                # para ver se outro worker do servidor ainda tem vaga
+                for _ in range(5):
+                    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+                    conexao.request('GET', '/api/notificacoes/stream', headers=cabecalho(usuario_id))
+                    resposta = conexao.getresponse()
+                    if resposta.status == 200:
+                        break
+                    resposta.read()
+                    conexao.close()
+                    recusados[0] += 1
+                else:
+                    prontos.release()
+                    return
+                for linha in resposta:
+                    if linha.startswith(b'event: contador') and usuario_id not in conectados:
+                        conectados.add(usuario_id)
+                        prontos.release()
+                    elif linha.startswith(b': ping'):
+                        heartbeats[0] += 1
+                    elif linha.startswith(b'event: notificacao'):
+                        chegadas[usuario_id] = time.perf_counter()
+                        break
+                conexao.close()
+            
+            inicio = time.perf_counter()
+            clientes = [threading.Thread(target=assinante, args=(usuario_id,), daemon=True)
+                        for usuario_id in range(1, assinantes + 1)]
+            for cliente in clientes:
+                cliente.start()
+            for _ in clientes:
+                prontos.acquire()
+            click.echo(f'{len(conectados)}/{assinantes} streams abertos em {time.perf_counter() - inicio:.2f} s, '
+                       f'{recusados[0]} resposta(s) 503 de processo lotado')
+            
+            # Streams por worker, pelas métricas do hub de quem atende cada chamada
+            por_worker = {}
+            for _ in range(20):
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=10)
+                conexao.request('GET', '/api/sistema/notificacoes', headers=cabecalho(1, 'admin'))
+                stream = json.loads(conexao.getresponse().read())['stream']
+                conexao.close()
+                por_worker[stream['pid']] = f'{stream["streams"]}/{stream["maximo"]}'
+            click.echo('streams por worker: ' + ', '.join(por_worker.values()))
+            
+            # As outras rotas com todos os streams abertos: 20 clientes, 10 chamadas cada
+            tempos, falhas = [], [0]
+            def rota():
+                for _ in range(10):
+                    inicio_chamada = time.perf_counter()
+                    try:
+                        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=10)
+                        conexao.request('GET', '/api/notificacoes/contador', headers=cabecalho(1))
+                        if conexao.getresponse().status != 200:
+                            falhas[0] += 1
+                        conexao.close()
+                    except OSError:
+                        falhas[0] += 1
+                    tempos.append((time.perf_counter() - inicio_chamada) * 1000)
+            chamadores = [threading.Thread(target=rota) for _ in range(20)]
+            for chamador in chamadores:
+                chamador.start()
+            for chamador in chamadores:
+                chamador.join()
+            click.echo(f'GET /api/notificacoes/contador com os streams abertos: {percentis(tempos)}, '
+                       f'{falhas[0]} falha(s)')
+            
+            cpu = cpu_servidor()
+            time.sleep(segundos)
+            cpu = cpu_servidor() - cpu
+            click.echo(f'ociosos por {segundos:.0f} s: CPU do servidor {cpu * 1000:.0f} ms '
+                       f'({cpu / segundos * 100:.1f}% de um núcleo), {heartbeats[0]} heartbeat(s) recebidos, '
+                       f'RSS do servidor {rss_servidor():.0f} MB')
+            
+            # Gravação de outro processo: os hubs só a veem na próxima consulta (SSE_INTERVALO)
+            conn = pool.obter()
+            criar_notificacoes(conn.cursor(), [
+                (usuario_id, None, 'benchmark', 'Teste', 'Notificação de teste', None)
+                for usuario_id in conectados
+            ])
+            conn.commit()
+            enviado_em = time.perf_counter()
+            for cliente in clientes:
+                cliente.join(timeout=max(10, SSE_INTERVALO * 5))
+            latencias = [(chegada - enviado_em) * 1000 for chegada in chegadas.values()]
+            if latencias:
+                click.echo(f'entrega a {len(latencias)}/{len(conectados)} streams: {percentis(latencias)}')
+            if len(conectados) < assinantes or len(latencias) < len(conectados) or falhas[0]:
+                raise SystemExit(1)
+        finally:
+            servidor.terminate()
+            try:
+                servidor.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                servidor.kill()
+            pool.fechar_todas()
+
+app.cli.add_command(notificacoes_cli)
+
+# ==================== ROTAS DE SISTEMA ====================
+
+@app.route('/api/sistema/conexoes', methods=['GET'])
+@admin_required
+def estatisticas_conexoes():
+    """Estatísticas do pool de conexões do worker atual"""
+    return jsonify(db_pool.estatisticas())
+
+@app.route('/api/sistema/cache', methods=['GET'])
+@admin_required
+def estatisticas_cache():
+    """Acertos e falhas do cache de respostas do worker atual"""
+    return jsonify(cache_respostas.estatisticas())
+
+@app.route('/api/sistema/notificacoes', methods=['GET'])
+@admin_required
+def estatisticas_saida_notificacoes():
+    """Fila de notificações (profundidade, atraso, contadores do worker) e streams SSE abertos"""
+    return jsonify(dict(metricas_saida_notificacoes(get_db()), stream=hub_notificacoes.estatisticas()))
+
 # Inicializar banco de dados na primeira execução
 init_db()
 
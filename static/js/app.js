@@ -7,6 +7,8 @@ let chartFrequencia = null;
 let chartEvolucao = null;
 let chartAlunoFrequencia = null;
 let chartAlunoEvolucao = null;
+let notificacoesStream = null;
+let notificacoesStreamTimer = null;
 
 // Inicialização
 document.addEventListener('DOMContentLoaded', function() {
@@ -74,6 +76,7 @@ function logout() {
     })
     .then(() => {
         currentUser = null;
+        pararStreamNotificacoes();
         showLoginScreen();
     })
     .catch(error => console.error('Erro ao fazer logout:', error));
@@ -102,6 +105,7 @@ function showAppScreen(perfil) {
         loadNotificacoes();
         loadJustificativasAluno();
         loadAvaliacoesAluno();
+        iniciarStreamNotificacoes();
     }
 }
 
@@ -491,15 +495,49 @@ function updateAlunoEvolucaoChart(data) {
 
 // ==================== ALUNOS ====================
 
+const ALUNOS_POR_PAGINA = 100;
+let alunosProximoCursor = null;
+
+function filtrosAlunos() {
+    const params = new URLSearchParams();
+    const status = document.getElementById('filter-aluno-status')?.value;
+    const tipo = document.getElementById('filter-aluno-tipo')?.value;
+    const classe = document.getElementById('filter-aluno-classe')?.value;
+    if (status) params.append('status', status);
+    if (tipo) params.append('tipo', tipo);
+    if (classe) params.append('classe', classe);
+    params.append('limite', ALUNOS_POR_PAGINA);
+    return params;
+}
+
 function loadAlunos() {
-    fetch('/api/alunos', {
+    alunosCache = [];
+    alunosProximoCursor = null;
+    document.querySelector('#alunos-table tbody').innerHTML = '';
+    carregarPaginaAlunos(filtrosAlunos());
+}
+
+function loadMaisAlunos() {
+    if (!alunosProximoCursor) return;
+    const params = filtrosAlunos();
+    params.append('cursor', alunosProximoCursor);
+    carregarPaginaAlunos(params);
+}
+
+function carregarPaginaAlunos(params) {
+    fetch('/api/alunos?' + params.toString(), {
         credentials: 'include'
     })
-    .then(response => response.json())
+    .then(response => {
+        alunosProximoCursor = response.headers.get('X-Next-Cursor');
+        const total = response.headers.get('X-Total-Count');
+        const totalEl = document.getElementById('alunos-total');
+        if (totalEl && total !== null) totalEl.textContent = `${total} aluno(s)`;
+        return response.json();
+    })
     .then(alunos => {
-        alunosCache = alunos;
+        alunosCache = alunosCache.concat(alunos);
         const tbody = document.querySelector('#alunos-table tbody');
-        tbody.innerHTML = '';
         
         alunos.forEach(aluno => {
             const row = document.createElement('tr');
@@ -519,6 +557,9 @@ function loadAlunos() {
             `;
             tbody.appendChild(row);
         });
+        
+        const botaoMais = document.getElementById('alunos-carregar-mais');
+        if (botaoMais) botaoMais.style.display = alunosProximoCursor ? 'inline-block' : 'none';
     })
     .catch(error => console.error('Erro ao carregar alunos:', error));
 }
@@ -802,6 +843,10 @@ function openImportarModal() {
     document.getElementById('modal-overlay').classList.add('active');
 }
 
+// Arquivos acima deste tamanho são importados em segundo plano
+const IMPORTACAO_ASYNC_BYTES = 1024 * 1024;
+let importacaoTimer = null;
+
 function importarAlunos() {
     const fileInput = document.getElementById('import-file');
     if (!fileInput.files.length) {
@@ -809,8 +854,12 @@ function importarAlunos() {
         return;
     }
     
+    const arquivo = fileInput.files[0];
     const formData = new FormData();
-    formData.append('file', fileInput.files[0]);
+    formData.append('file', arquivo);
+    if (arquivo.size > IMPORTACAO_ASYNC_BYTES) {
+        formData.append('modo', 'async');
+    }
     
     fetch('/api/alunos/importar', {
         method: 'POST',
@@ -819,7 +868,9 @@ function importarAlunos() {
     })
     .then(response => response.json())
     .then(data => {
-        if (data.success) {
+        if (data.success && data.job_id) {
+            acompanharImportacao(data.job_id);
+        } else if (data.success) {
             alert(data.mensagem);
             closeModal();
             loadAlunos();
@@ -833,6 +884,55 @@ function importarAlunos() {
     });
 }
 
+function acompanharImportacao(jobId) {
+    const modalBody = document.getElementById('modal-body');
+    modalBody.innerHTML = `
+        <h3>Importando Alunos</h3>
+        <p id="importacao-progresso">Aguardando processamento...</p>
+        <div style="display: flex; gap: 10px; margin-top: 20px;">
+            <button onclick="cancelarImportacao('${jobId}')" class="btn btn-danger">Cancelar</button>
+        </div>
+    `;
+    
+    clearInterval(importacaoTimer);
+    importacaoTimer = setInterval(() => {
+        fetch(`/api/alunos/importar/${jobId}`, {
+            credentials: 'include'
+        })
+        .then(response => response.json())
+        .then(job => {
+            const progresso = document.getElementById('importacao-progresso');
+            if (progresso) {
+                const velocidade = job.linhas_por_segundo ? ` (${Math.round(job.linhas_por_segundo)} linhas/s)` : '';
+                progresso.textContent = `${job.status}: ${job.linhas_processadas} linha(s) processada(s), ` +
+                    `${job.sucesso} sucesso(s), ${job.erros} erro(s)${velocidade}`;
+            }
+            if (!['Na fila', 'Processando'].includes(job.status)) {
+                clearInterval(importacaoTimer);
+                alert(job.mensagem || job.status);
+                closeModal();
+                loadAlunos();
+            }
+        })
+        .catch(error => {
+            clearInterval(importacaoTimer);
+            console.error('Erro ao acompanhar importação:', error);
+        });
+    }, 1000);
+}
+
+function cancelarImportacao(jobId) {
+    fetch(`/api/alunos/importar/${jobId}/cancelar`, {
+        method: 'POST',
+        credentials: 'include'
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) alert('Erro: ' + data.error);
+    })
+    .catch(error => console.error('Erro ao cancelar importação:', error));
+}
+
 function loadAlunosForSelect(selectedAlunoId = null) {
     fetch('/api/alunos', {
         credentials: 'include'
@@ -961,6 +1061,35 @@ function marcarPresenca(alunoId, data, presente) {
     .catch(error => console.error('Erro ao marcar presença:', error));
 }
 
+function marcarTodosPresentes() {
+    const data = document.getElementById('presenca-data').value || new Date().toISOString().split('T')[0];
+    
+    fetch(`/api/presencas/hoje?data=${data}`, {
+        credentials: 'include'
+    })
+    .then(response => response.json())
+    .then(alunos => fetch('/api/presencas/lote', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        credentials: 'include',
+        body: JSON.stringify({
+            data: data,
+            presencas: alunos.map(aluno => ({aluno_id: aluno.id, presente: true, justificativa: ''}))
+        })
+    }))
+    .then(response => response.json())
+    .then(resultado => {
+        if (resultado.success) {
+            loadPresencas();
+        } else {
+            alert('Erro: ' + resultado.error);
+        }
+    })
+    .catch(error => console.error('Erro ao registrar presenças:', error));
+}
+
 function atualizarJustificativaPresenca(alunoId, data, justificativa) {
     fetch('/api/presencas', {
         method: 'POST',
@@ -2318,6 +2447,57 @@ function enviarJustificativa() {
 
 // ==================== NOTIFICAÇÕES ====================
 
+// O servidor envia notificações novas e o total de não lidas; ao reconectar,
+// o EventSource manda o Last-Event-ID e recebe o que perdeu
+function iniciarStreamNotificacoes() {
+    if (notificacoesStream || !window.EventSource) return;
+    notificacoesStream = new EventSource('/api/notificacoes/stream', { withCredentials: true });
+    notificacoesStream.addEventListener('contador', event => {
+        atualizarBadgeNotificacoes(JSON.parse(event.data).total);
+    });
+    notificacoesStream.addEventListener('notificacao', () => {
+        if (document.getElementById('aluno-notificacoes')?.classList.contains('active')) {
+            loadNotificacoes();
+        }
+    });
+    notificacoesStream.addEventListener('error', () => {
+        // Com o servidor lotado (503) o navegador não reconecta sozinho:
+        // atualiza o contador uma vez e tenta o stream de novo mais tarde
+        if (notificacoesStream && notificacoesStream.readyState === EventSource.CLOSED) {
+            notificacoesStream = null;
+            fetch('/api/notificacoes/contador', { credentials: 'include' })
+                .then(response => response.ok ? response.json() : null)
+                .then(dados => dados && atualizarBadgeNotificacoes(dados.total))
+                .catch(() => {});
+            notificacoesStreamTimer = setTimeout(() => {
+                notificacoesStreamTimer = null;
+                iniciarStreamNotificacoes();
+            }, 30000);
+        }
+    });
+}
+
+function pararStreamNotificacoes() {
+    clearTimeout(notificacoesStreamTimer);
+    notificacoesStreamTimer = null;
+    if (notificacoesStream) {
+        notificacoesStream.close();
+        notificacoesStream = null;
+    }
+}
+
+function atualizarBadgeNotificacoes(naoLidas) {
+    const badge = document.getElementById('notificacao-badge');
+    if (badge) {
+        if (naoLidas > 0) {
+            badge.textContent = naoLidas;
+            badge.style.display = 'inline';
+        } else {
+            badge.style.display = 'none';
+        }
+    }
+}
+
 function loadNotificacoes() {
     fetch('/api/notificacoes', {
         credentials: 'include'
@@ -2325,17 +2505,8 @@ function loadNotificacoes() {
     .then(response => response.json())
     .then(notificacoes => {
         // Atualizar badge
-        const badge = document.getElementById('notificacao-badge');
         const naoLidas = notificacoes.filter(n => !n.lida).length;
-        
-        if (badge) {
-            if (naoLidas > 0) {
-                badge.textContent = naoLidas;
-                badge.style.display = 'inline';
-            } else {
-                badge.style.display = 'none';
-            }
-        }
+        atualizarBadgeNotificacoes(naoLidas);
         
         // Atualizar contador total
         const totalSpan = document.getElementById('notificacoes-total');